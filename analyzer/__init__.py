@@ -1,8 +1,12 @@
 """
 分析模組
 """
-from .gemini_client import GeminiClient
+from .client_pool import GeminiClientPool
+from .gemini_client import GeminiAPIError, GeminiClient
+from .async_client import AsyncGeminiClient
+from .scheduler import GeminiScheduler
+from .token_planner import PromptPlanner
 from .phrase_extractor import PhraseExtractor
 from .classifier import Classifier
 
-__all__ = ['GeminiClient', 'PhraseExtractor', 'Classifier']
+__all__ = ['GeminiClientPool', 'GeminiAPIError', 'GeminiClient', 'AsyncGeminiClient', 'GeminiScheduler', 'PromptPlanner', 'PhraseExtractor', 'Classifier']
@@ -0,0 +1,106 @@
+"""
+Gemini 非同步串流客戶端
+所有非同步呼叫在同一個背景事件迴圈執行，等待 Gemini 回應時不佔用執行緒；
+串流回應邊接收邊回報目前已產生的 Markdown，供任務預覽逐步顯示
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from .client_pool import get_client_pool
+from .gemini_client import GeminiClient
+from .scheduler import get_scheduler
+from .token_planner import get_token_counter
+from tracing import span
+
+T = TypeVar('T')
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """取得（必要時啟動）共用的背景事件迴圈"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='gemini-async', daemon=True)
+                thread.start()
+                _loop = loop
+    return _loop
+
+
+def run_coroutine(coro: Awaitable[T]) -> 'Future[T]':
+    """於背景事件迴圈執行 coroutine，回傳可在任意執行緒等待的 Future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())  # type: ignore[arg-type]
+
+
+class AsyncGeminiClient(GeminiClient):
+    """GeminiClient 的 asyncio 版本，以串流方式取得回應（須在背景事件迴圈中呼叫）"""
+
+    async def analyze_content_async(self, content: str, prompt: str,
+                                    priority: Optional[int] = None,
+                                    on_partial: Optional[Callable[[str], Any]] = None) -> str:
+        """
+        以串流方式分析內容
+
+        Args:
+            content: 要分析的文件內容
+            prompt: 分析指令
+            priority: 排程優先序權重，見 GeminiClient.analyze_content
+            on_partial: 每收到一段回應時以目前累積的文字呼叫（重試時從頭開始）
+
+        Returns:
+            AI 分析結果
+
+        Raises:
+            GeminiAPIError: 呼叫失敗或回應無法取得文字
+        """
+        full_prompt = self.build_request(content, prompt)
+        model = get_client_pool().get_async_model(self.api_key, self.model_name)
+        text = ''
+
+        async def generate() -> Any:
+            nonlocal text
+            text = ''
+            response = await model.generate_content_async(
+                full_prompt, generation_config=self.generation_config(), stream=True
+            )
+            async for chunk in response:
+                piece = chunk.text
+                if not piece:
+                    # 結尾的 chunk 可能只帶 finish_reason / usage_metadata
+                    continue
+                text += piece
+                if on_partial:
+                    result = on_partial(text)
+                    if asyncio.iscoroutine(result):
+                        await result
+            return response
+
+        tokens = get_token_counter().count(full_prompt, self.model_name)
+        try:
+            with span('gemini.request', cat='gemini', model=self.model_name, stream=True,
+                      prompt_chars=len(full_prompt), prompt_tokens=tokens) as info:
+                await get_scheduler().call_async(
+                    self.api_key, self.model_name, generate,
+                    tokens=tokens, priority=priority, stats=self.stats
+                )
+                info['response_chars'] = len(text)
+        except Exception as e:
+            raise self.wrap_error(e) from e
+
+        if not text:
+            raise self.wrap_error(ValueError('Gemini 未回傳任何內容'))
+        return text
+
+    async def extract_phrases_async(self, content: str, categories: list,
+                                    priority: Optional[int] = None,
+                                    on_partial: Optional[Callable[[str], Any]] = None) -> str:
+        """extract_phrases 的串流版本"""
+        return await self.analyze_content_async(
+            content, self.build_extract_prompt(categories), priority, on_partial
+        )
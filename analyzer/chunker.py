@@ -0,0 +1,141 @@
+"""
+文件分塊器
+依結構邊界（投影片群組、Word 章節）將解析結果切分為多個分析區塊
+"""
+from typing import Any, Callable, Dict, List, Optional
+
+from parsers import PPTParser
+import config
+
+
+def build_chunks(parsed: Dict[str, Any], max_size: int | None = None,
+                 measure: Callable[[str], int] = len) -> List[str]:
+    """
+    將解析結果切分為區塊
+
+    Args:
+        parsed: WordParser / PPTParser 的解析結果
+        max_size: 每個區塊的大小上限（以 measure 計算，預設為 CHUNK_MAX_CHARS 字元）
+        measure: 大小計算方式，預設為字元數，可改為 token 估算
+
+    Returns:
+        區塊文字列表（至少一個，除非文件為空）
+    """
+    max_size = max_size or config.CHUNK_MAX_CHARS
+    return pack_units(document_units(parsed), max_size, measure)
+
+
+def document_units(parsed: Dict[str, Any]) -> List[str]:
+    """
+    文件的結構單元（投影片、Word 章節，其餘依段落），為分塊與增量提取的最小單位
+
+    Returns:
+        非空白單元的文字（依文件順序）
+    """
+    if parsed.get('file_type') == 'pptx' and parsed.get('slides'):
+        units = [PPTParser.slide_text(slide) for slide in parsed['slides']]
+    elif parsed.get('file_type') == 'docx' and parsed.get('sections'):
+        units = [_format_section(section) for section in parsed['sections']]
+    else:
+        units = parsed.get('full_text', '').split('\n\n')
+    return [u for u in units if u.strip()]
+
+
+def _format_section(section: Dict[str, str]) -> str:
+    """Word 章節文字"""
+    if section['heading']:
+        return f"# {section['heading']}\n{section['text']}".rstrip()
+    return section['text']
+
+
+def pack_units(units: List[str], max_size: int, measure: Callable[[str], int] = len,
+               owners: Optional[List[List[int]]] = None) -> List[str]:
+    """
+    將相鄰單元合併到上限內，單一單元過大時依段落再切分
+
+    Args:
+        owners: 提供時依序填入每個區塊包含的單元索引（過大的單元可能分屬多個區塊）
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    members: List[int] = []
+    size = 0
+    separator = measure('\n\n')
+
+    def flush() -> None:
+        chunks.append('\n\n'.join(current))
+        if owners is not None:
+            owners.append(list(dict.fromkeys(members)))
+
+    for index, unit in enumerate(units):
+        pieces = [unit] if measure(unit) <= max_size else _split_oversized(unit, max_size, measure)
+        for piece in pieces:
+            piece_size = measure(piece)
+            if current and size + piece_size > max_size:
+                flush()
+                current, members, size = [], [], 0
+            current.append(piece)
+            members.append(index)
+            size += piece_size + separator
+
+    if current:
+        flush()
+
+    return chunks
+
+
+def _split_oversized(text: str, max_size: int, measure: Callable[[str], int]) -> List[str]:
+    """依行切分過大的單元，單行仍過長時硬切（累計大小逐行加總，不重複計算已累積的內容）"""
+    pieces: List[str] = []
+    current: List[str] = []
+    size = 0
+
+    def flush() -> None:
+        nonlocal current, size
+        if current:
+            pieces.append('\n'.join(current))
+            current, size = [], 0
+
+    for line in text.split('\n'):
+        while True:
+            cut = _cut_point(line, max_size, measure)
+            if cut >= len(line):
+                break
+            flush()
+            pieces.append(line[:cut])
+            line = line[cut:]
+        line_size = measure(line)
+        if current and size + line_size + 1 > max_size:
+            flush()
+        if not current and not line:
+            # 區塊開頭的空行略過
+            continue
+        size += line_size + (1 if current else 0)
+        current.append(line)
+
+    flush()
+    return pieces
+
+
+def _cut_point(line: str, max_size: int, measure: Callable[[str], int]) -> int:
+    """
+    硬切位置：最長且不超過上限的前綴長度（整行未超過上限時為 len(line)）
+
+    先以倍增找出超過上限的前綴再二分搜尋，只需計算與上限同量級的前綴，不必反覆計算整行
+    """
+    if not line:
+        return 0
+    high = min(max(max_size, 1), len(line))
+    while high < len(line) and measure(line[:high]) <= max_size:
+        high = min(high * 2, len(line))
+    if measure(line[:high]) <= max_size:
+        return high
+    low = high // 2 if high > max_size else 1
+    low = max(low, 1)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if measure(line[:mid]) <= max_size:
+            low = mid
+        else:
+            high = mid - 1
+    return low
@@ -0,0 +1,185 @@
+"""
+Gemini 客戶端池
+依 API Key 保留一個 google-genai 的 genai.Client（各自的連線設定與連線池），依 (API Key, 模型)
+重用模型包裝；只使用 SDK 的公開介面，不設定行程全域的預設 Key，不同使用者的 Key 可同時使用
+"""
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+from google.api_core import exceptions as api_exceptions  # type: ignore[import-untyped]
+
+import config
+from .fake_backend import FakeGenerativeModel
+
+
+@contextmanager
+def _api_errors() -> Iterator[None]:
+    """
+    將 google-genai 的例外轉為 google.api_core 例外，排程器與錯誤處理沿用同一套例外類型：
+    APIError 依 HTTP 狀態（429 → TooManyRequests、503 → ServiceUnavailable），
+    httpx 的逾時 → DeadlineExceeded，連線中斷等傳輸錯誤 → ServiceUnavailable
+    """
+    try:
+        yield
+    except Exception as e:
+        import httpx
+        from google.genai import errors as genai_errors  # type: ignore[import-untyped]
+
+        if isinstance(e, genai_errors.APIError):
+            raise api_exceptions.from_http_status(e.code or 500, e.message or str(e)) from e
+        if isinstance(e, httpx.TimeoutException):
+            raise api_exceptions.DeadlineExceeded(f'Gemini 請求逾時: {e}') from e
+        if isinstance(e, httpx.TransportError):
+            raise api_exceptions.ServiceUnavailable(f'Gemini 連線失敗: {e}') from e
+        raise
+
+
+class _Stream:
+    """串流回應：逐段轉換錯誤，迭代完成後可讀取最後一段的 usage_metadata"""
+
+    def __init__(self, chunks: AsyncIterator[Any]):
+        self._chunks = chunks
+        self.usage_metadata: Any = None
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        with _api_errors():
+            async for chunk in self._chunks:
+                if getattr(chunk, 'usage_metadata', None) is not None:
+                    self.usage_metadata = chunk.usage_metadata
+                yield chunk
+
+
+class GenaiModel:
+    """
+    以 genai.Client 呼叫單一模型，提供與 FakeGenerativeModel 相同的
+    generate_content / generate_content_async / count_tokens 介面
+    """
+
+    def __init__(self, client: Any, model_name: str):
+        self.client = client
+        self.model_name = model_name
+
+    def generate_content(self, prompt: str, generation_config: Any = None,
+                         **_kwargs: Any) -> Any:
+        with _api_errors():
+            return self.client.models.generate_content(
+                model=self.model_name, contents=prompt, config=generation_config
+            )
+
+    async def generate_content_async(self, prompt: str, generation_config: Any = None,
+                                     stream: bool = False, **_kwargs: Any) -> Any:
+        with _api_errors():
+            if stream:
+                return _Stream(await self.client.aio.models.generate_content_stream(
+                    model=self.model_name, contents=prompt, config=generation_config
+                ))
+            return await self.client.aio.models.generate_content(
+                model=self.model_name, contents=prompt, config=generation_config
+            )
+
+    def count_tokens(self, contents: str, **_kwargs: Any) -> Any:
+        with _api_errors():
+            return self.client.models.count_tokens(model=self.model_name, contents=contents)
+
+
+@dataclass
+class _KeyEntry:
+    """單一 API Key 的客戶端與模型快取"""
+    client: Any
+    models: Dict[str, Any] = field(default_factory=dict)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class GeminiClientPool:
+    """執行緒安全的 Gemini 模型池，閒置過久的 Key 會被釋放"""
+
+    def __init__(self, idle_seconds: Optional[int] = None):
+        """
+        Args:
+            idle_seconds: Key 閒置多久後釋放其連線（秒），預設依 GEMINI_CLIENT_IDLE_SECONDS
+        """
+        self.idle_seconds = idle_seconds or config.GEMINI_CLIENT_IDLE_SECONDS
+        self._entries: Dict[str, _KeyEntry] = {}
+        self._lock = threading.Lock()
+
+    def get_model(self, api_key: str, model_name: str) -> Any:
+        """
+        取得綁定指定 API Key 的模型（同一 Key 的模型共用客戶端），
+        GEMINI_BACKEND=fake 時回傳模擬模型
+
+        Args:
+            api_key: Gemini API Key
+            model_name: 模型名稱
+        """
+        with self._lock:
+            return self._get(api_key, model_name)[1]
+
+    def get_async_model(self, api_key: str, model_name: str) -> Any:
+        """
+        取得可呼叫 generate_content_async 的模型（genai.Client 的 aio 介面與同步介面共用設定，
+        非同步連線於背景事件迴圈中首次使用時建立）
+        """
+        return self.get_model(api_key, model_name)
+
+    def _get(self, api_key: str, model_name: str) -> Tuple[_KeyEntry, Any]:
+        """取得（必要時建立）Key 的客戶端與模型（呼叫端需持有鎖）"""
+        now = time.monotonic()
+        self._evict_idle(now)
+
+        entry = self._entries.get(api_key)
+        if entry is None:
+            entry = _KeyEntry(client=self._create_client(api_key))
+            self._entries[api_key] = entry
+        entry.last_used = now
+
+        model = entry.models.get(model_name)
+        if model is None:
+            model = self._create_model(entry, model_name)
+            entry.models[model_name] = model
+        return entry, model
+
+    @staticmethod
+    def _create_client(api_key: str) -> Any:
+        if config.GEMINI_BACKEND == 'fake':
+            return None
+
+        from google import genai  # type: ignore[import-untyped]
+        from google.genai import types  # type: ignore[import-untyped]
+
+        return genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(timeout=int(config.GEMINI_HTTP_TIMEOUT * 1000)),
+        )
+
+    @staticmethod
+    def _create_model(entry: _KeyEntry, model_name: str) -> Any:
+        if config.GEMINI_BACKEND == 'fake':
+            return FakeGenerativeModel(model_name)
+        return GenaiModel(entry.client, model_name)
+
+    def _evict_idle(self, now: float) -> None:
+        """釋放閒置過久的 Key（呼叫端需持有鎖）；進行中的呼叫仍持有模型參考，不受影響"""
+        expired = [key for key, entry in self._entries.items()
+                   if now - entry.last_used > self.idle_seconds]
+        for key in expired:
+            del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_pool: Optional[GeminiClientPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_client_pool() -> GeminiClientPool:
+    """取得共用的客戶端池"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = GeminiClientPool()
+    return _pool
@@ -0,0 +1,222 @@
+"""
+提取結果快取
+以 (正規化區塊內容雜湊, 模型, Prompt 版本, 溫度) 為鍵，支援磁碟（SQLite）與 Redis 兩種後端
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Iterator
+
+import config
+
+
+def make_cache_key(chunk: str, model: str, prompt_version: str | None = None,
+                   temperature: float | None = None) -> str:
+    """
+    生成快取鍵
+
+    Args:
+        chunk: 區塊文字（會先做 NFKC 與空白正規化）
+        model: 模型名稱
+        prompt_version: Prompt 版本
+        temperature: 生成溫度
+
+    Returns:
+        SHA-256 十六進位字串
+    """
+    prompt_version = prompt_version or config.EXTRACT_PROMPT_VERSION
+    temperature = config.GEMINI_TEMPERATURE if temperature is None else temperature
+    normalized = re.sub(r'\s+', ' ', unicodedata.normalize('NFKC', chunk)).strip()
+    raw = f"{model}\x00{prompt_version}\x00{temperature}\x00{normalized}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ExtractionCache(ABC):
+    """提取結果快取抽象基類"""
+
+    @abstractmethod
+    def get(self, key: str) -> str | None:
+        """取得快取的提取結果"""
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        """寫入提取結果"""
+        pass
+
+
+class DiskExtractionCache(ExtractionCache):
+    """磁碟快取（SQLite），超過容量時依最近存取時間淘汰（LRU）"""
+
+    _SIZE_TRIGGERS = (
+        "CREATE TRIGGER IF NOT EXISTS cache_size_insert AFTER INSERT ON cache"
+        " BEGIN UPDATE cache_size SET total = total + NEW.size; END",
+        "CREATE TRIGGER IF NOT EXISTS cache_size_delete AFTER DELETE ON cache"
+        " BEGIN UPDATE cache_size SET total = total - OLD.size; END",
+        "CREATE TRIGGER IF NOT EXISTS cache_size_update AFTER UPDATE OF size ON cache"
+        " BEGIN UPDATE cache_size SET total = total - OLD.size + NEW.size; END",
+    )
+
+    def __init__(self, db_path: str, max_bytes: int | None = None):
+        """
+        初始化磁碟快取
+
+        Args:
+            db_path: SQLite 檔案路徑
+            max_bytes: 快取內容總大小上限
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes or config.EXTRACTION_CACHE_MAX_BYTES
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_access ON cache (last_access)")
+            # 內容總大小由觸發器維護，寫入時不必加總整個資料表（既有快取於首次開啟時加總一次）
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_size ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER NOT NULL)"
+            )
+            conn.execute("INSERT OR IGNORE INTO cache_size (id, total)"
+                         " SELECT 0, COALESCE(SUM(size), 0) FROM cache")
+            for trigger in self._SIZE_TRIGGERS:
+                conn.execute(trigger)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> str | None:
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        size = len(value.encode('utf-8'))
+        with self._connect() as conn:
+            # 以 UPSERT 而非 REPLACE，取代時觸發 UPDATE 觸發器（REPLACE 的刪除不會觸發）
+            conn.execute(
+                "INSERT INTO cache (key, value, size, last_access) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value,"
+                " size = excluded.size, last_access = excluded.last_access",
+                (key, value, size, time.time())
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """總大小超過容量上限時，依存取時間索引淘汰最久未存取的項目"""
+        total = conn.execute("SELECT total FROM cache_size").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        stale = []
+        for key, size in conn.execute("SELECT key, size FROM cache ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM cache WHERE key = ?", stale)
+
+
+class RedisExtractionCache(ExtractionCache):
+    """Redis 快取，以 sorted set 記錄存取時間，超過筆數上限時淘汰最舊項目"""
+
+    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0,
+                 prefix: str = 'extract:', max_entries: int | None = None,
+                 ttl: int | None = None):
+        """
+        初始化 Redis 快取
+
+        Args:
+            host: Redis 主機
+            port: Redis 端口
+            db: Redis 資料庫編號
+            prefix: Key 前綴
+            max_entries: 快取筆數上限
+            ttl: 項目過期時間（秒）
+        """
+        try:
+            import redis
+            self._redis = redis.Redis(host=host, port=port, db=db, decode_responses=True)
+            self._redis.ping()
+        except Exception as e:
+            raise ConnectionError(f"無法連接 Redis: {e}")
+
+        self._prefix = prefix
+        self._lru_key = f"{prefix}lru"
+        self._max_entries = max_entries or config.EXTRACTION_CACHE_MAX_ENTRIES
+        self._ttl = ttl or config.EXTRACTION_CACHE_TTL
+
+    def get(self, key: str) -> str | None:
+        value = self._redis.get(f"{self._prefix}{key}")
+        if value is not None:
+            self._redis.zadd(self._lru_key, {key: time.time()})
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        pipe = self._redis.pipeline()
+        pipe.setex(f"{self._prefix}{key}", self._ttl, value)
+        pipe.zadd(self._lru_key, {key: time.time()})
+        pipe.zcard(self._lru_key)
+        count = pipe.execute()[-1]
+
+        overflow = count - self._max_entries
+        if overflow > 0:
+            stale = self._redis.zrange(self._lru_key, 0, overflow - 1)
+            if stale:
+                pipe = self._redis.pipeline()
+                pipe.delete(*[f"{self._prefix}{k}" for k in stale])
+                pipe.zrem(self._lru_key, *stale)
+                pipe.execute()
+
+
+def create_extraction_cache(cache_dir: str) -> ExtractionCache | None:
+    """
+    根據環境變數建立提取結果快取
+
+    環境變數:
+        EXTRACTION_CACHE: off / disk / redis（預設 auto：有 REDIS_HOST 用 Redis，否則磁碟）
+        REDIS_HOST / REDIS_PORT / REDIS_DB: Redis 連線設定
+
+    Args:
+        cache_dir: 磁碟快取的存放目錄
+
+    Returns:
+        快取實例，停用時回傳 None
+    """
+    backend = config.EXTRACTION_CACHE_BACKEND
+    if backend == 'off':
+        return None
+
+    redis_host = os.getenv('REDIS_HOST')
+    if backend == 'redis' or (backend == 'auto' and redis_host):
+        try:
+            return RedisExtractionCache(
+                host=redis_host or 'localhost',
+                port=int(os.getenv('REDIS_PORT', '6379')),
+                db=int(os.getenv('REDIS_DB', '0'))
+            )
+        except ConnectionError as e:
+            print(f"警告: Redis 連接失敗，回退到磁碟快取: {e}")
+
+    return DiskExtractionCache(os.path.join(cache_dir, 'extraction_cache.db'))
@@ -0,0 +1,138 @@
+"""
+模擬 Gemini 後端（GEMINI_BACKEND=fake）
+不連網、不需 API Key 額度，以可設定的延遲與錯誤率回傳與真實模型相同格式的回應，
+供排程器、管線與效能測試使用
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Optional
+
+from google.api_core import exceptions as api_exceptions  # type: ignore[import-untyped]
+
+import config
+from .token_planner import estimate_tokens
+
+_TERM = re.compile(r'[一-鿿]{2,6}|[A-Za-z][A-Za-z0-9\-]{2,}')
+_CONTENT_MARKER = '文件內容：\n'
+_JUDGE_LINE = re.compile(r'^\d+\. \[', re.MULTILINE)
+
+
+@dataclass
+class FakeUsage:
+    prompt_token_count: int
+    candidates_token_count: int
+    total_token_count: int
+
+
+@dataclass
+class FakeTokenCount:
+    total_tokens: int
+
+
+@dataclass
+class FakeResponse:
+    text: str
+    usage_metadata: FakeUsage
+
+
+class FakeStream:
+    """模擬串流回應：延遲平均分散在各段之間，迭代完成後可讀取 text / usage_metadata"""
+
+    PIECES = 5
+
+    def __init__(self, response: FakeResponse, latency: float):
+        self.text = response.text
+        self.usage_metadata = response.usage_metadata
+        self._latency = latency
+
+    async def __aiter__(self) -> AsyncIterator[FakeResponse]:
+        size = max(1, -(-len(self.text) // self.PIECES))
+        for start in range(0, len(self.text) or 1, size):
+            await asyncio.sleep(self._latency / self.PIECES)
+            yield FakeResponse(self.text[start:start + size], self.usage_metadata)
+
+
+class FakeGenerativeModel:
+    """與 GenaiModel（client_pool）的 generate_content / generate_content_async 介面相容的模擬模型"""
+
+    def __init__(self, model_name: str, latency: Optional[float] = None,
+                 error_rate: Optional[float] = None):
+        """
+        Args:
+            model_name: 模型名稱（僅供顯示）
+            latency: 平均延遲秒數（實際為 0.5–1.5 倍），預設依 GEMINI_FAKE_LATENCY
+            error_rate: 回傳暫時性錯誤（429 / 503）的機率，預設依 GEMINI_FAKE_ERROR_RATE
+        """
+        self.model_name = model_name
+        self.latency = config.GEMINI_FAKE_LATENCY if latency is None else latency
+        self.error_rate = config.GEMINI_FAKE_ERROR_RATE if error_rate is None else error_rate
+
+    def generate_content(self, prompt: str, generation_config: Any = None,
+                         **_kwargs: Any) -> FakeResponse:
+        if self.latency > 0:
+            time.sleep(self.latency * random.uniform(0.5, 1.5))
+        self._maybe_fail()
+        return self._respond(prompt)
+
+    async def generate_content_async(self, prompt: str, generation_config: Any = None,
+                                     stream: bool = False, **_kwargs: Any) -> Any:
+        self._maybe_fail()
+        response = self._respond(prompt)
+        latency = self.latency * random.uniform(0.5, 1.5)
+        if not stream:
+            await asyncio.sleep(latency)
+            return response
+        return FakeStream(response, latency)
+
+    def count_tokens(self, contents: str, **_kwargs: Any) -> FakeTokenCount:
+        return FakeTokenCount(estimate_tokens(contents))
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate > 0 and random.random() < self.error_rate:
+            if random.random() < 0.5:
+                raise api_exceptions.ResourceExhausted('fake backend: quota exceeded')
+            raise api_exceptions.ServiceUnavailable('fake backend: unavailable')
+
+    def _respond(self, prompt: str) -> FakeResponse:
+        if _JUDGE_LINE.search(prompt) and 'JSON' in prompt:
+            text = json.dumps([False] * len(_JUDGE_LINE.findall(prompt)))
+        else:
+            text = self._extract(prompt.split(_CONTENT_MARKER, 1)[-1])
+
+        prompt_tokens = estimate_tokens(prompt)
+        output_tokens = estimate_tokens(text)
+        return FakeResponse(text, FakeUsage(prompt_tokens, output_tokens,
+                                            prompt_tokens + output_tokens))
+
+    @staticmethod
+    def _extract(content: str) -> str:
+        """以內容中出現最多的詞作為術語，依詞的雜湊分配類別（相同內容產生相同結果）"""
+        categories = config.CATEGORIES
+        terms = [term for term, _ in Counter(_TERM.findall(content)).most_common(8)]
+
+        sections: dict = {}
+        for term in terms:
+            digest = int(hashlib.md5(term.encode('utf-8')).hexdigest(), 16)
+            sections.setdefault(categories[digest % len(categories)], []).append(term)
+
+        lines = []
+        for category, items in sections.items():
+            lines.append(f"### {category}\n")
+            for term in items:
+                lines.extend([
+                    f"#### {term}",
+                    f"**內容**：{term}",
+                    f"**定義/說明**：文件中出現的「{term}」",
+                    "**使用場景**：內部報告",
+                    f"**範例**：我們需要持續推進{term}。",
+                    "",
+                    "---",
+                    "",
+                ])
+        return '\n'.join(lines)
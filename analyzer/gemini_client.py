@@ -1,11 +1,28 @@
 """
 Gemini API 客戶端
 """
-import google.generativeai as genai  # type: ignore[import-untyped]
-from typing import Optional
+import json
+import re
+from functools import lru_cache
+from google.api_core import exceptions as api_exceptions  # type: ignore[import-untyped]
+from typing import Any, List, Optional, Tuple
+from .client_pool import get_client_pool
+from .scheduler import get_scheduler, is_retryable
+from .token_planner import get_token_counter
+from tracing import span
 import config
 
 
+class GeminiAPIError(Exception):
+    """Gemini 呼叫失敗（已依排程器設定重試）"""
+
+    def __init__(self, message: str, retryable: bool = False, status_code: Optional[int] = None):
+        super().__init__(message)
+        # 錯誤本身是否為暫時性（重試次數用盡時仍為 True）
+        self.retryable = retryable
+        self.status_code = status_code
+
+
 class GeminiClient:
     """Gemini API 調用封裝"""
 
@@ -16,48 +33,104 @@ class GeminiClient:
         if not self.api_key:
             raise ValueError("Gemini API Key 未設定，請輸入 API Key")
 
-        genai.configure(api_key=self.api_key)  # type: ignore[attr-defined]
-        self.model = genai.GenerativeModel(self.model_name)  # type: ignore[attr-defined]
+        # 由客戶端池取得綁定此 Key 的模型，重用連線且不影響其他任務的 Key
+        self.model = get_client_pool().get_model(self.api_key, self.model_name)
+        # 此客戶端（單一任務）的呼叫統計：requests / retries / failures / queue_wait_seconds
+        self.stats: dict = {}
 
-    def analyze_content(self, content: str, prompt: str) -> str:
+    def analyze_content(self, content: str, prompt: str, priority: Optional[int] = None) -> str:
         """
-        使用 Gemini 分析內容
+        使用 Gemini 分析內容（經由排程器限速與重試）
 
         Args:
             content: 要分析的文件內容
             prompt: 分析指令
+            priority: 排程優先序權重（通常為整份文件的 token 數），越小越先執行
 
         Returns:
             AI 分析結果
+
+        Raises:
+            GeminiAPIError: 呼叫失敗或回應無法取得文字
         """
-        try:
-            full_prompt = f"{prompt}\n\n文件內容：\n{content}"
+        full_prompt = self.build_request(content, prompt)
 
-            response = self.model.generate_content(
-                full_prompt,
-                generation_config=genai.types.GenerationConfig(  # type: ignore[attr-defined]
-                    temperature=config.GEMINI_TEMPERATURE,
-                    max_output_tokens=config.GEMINI_MAX_TOKENS,
-                )
+        def generate():
+            return self.model.generate_content(
+                full_prompt, generation_config=self.generation_config()
             )
 
-            return response.text
+        tokens = get_token_counter().count(full_prompt, self.model_name)
+        try:
+            with span('gemini.request', cat='gemini', model=self.model_name,
+                      prompt_chars=len(full_prompt), prompt_tokens=tokens) as info:
+                response = get_scheduler().call(
+                    self.api_key, self.model_name, generate,
+                    tokens=tokens, priority=priority, stats=self.stats
+                )
+                text = response.text
+                if not text:
+                    raise ValueError('Gemini 未回傳任何內容')
+                info['response_chars'] = len(text)
+            return text
 
         except Exception as e:
-            raise Exception(f"Gemini API 調用失敗: {str(e)}")
+            raise self.wrap_error(e) from e
 
-    def extract_phrases(self, content: str, categories: list) -> str:
+    def count_tokens(self, text: str) -> int:
+        """以 SDK count_tokens 取得精確 token 數（TOKEN_COUNT_MODE=api 時由規劃器使用）"""
+        try:
+            return self.model.count_tokens(text).total_tokens
+        except Exception as e:
+            raise self.wrap_error(e) from e
+
+    @staticmethod
+    def build_request(content: str, prompt: str) -> str:
+        """組合送出的完整內容"""
+        return f"{prompt}\n\n文件內容：\n{content}"
+
+    @staticmethod
+    def generation_config() -> Any:
+        """生成設定（genai GenerateContentConfig 的欄位）"""
+        return {
+            'temperature': config.GEMINI_TEMPERATURE,
+            'max_output_tokens': config.GEMINI_MAX_TOKENS,
+        }
+
+    @staticmethod
+    def wrap_error(error: Exception) -> GeminiAPIError:
+        """將 SDK / 排程器拋出的例外轉為 GeminiAPIError"""
+        return GeminiAPIError(
+            f"Gemini API 調用失敗: {str(error)}",
+            retryable=is_retryable(error),
+            status_code=error.code if isinstance(error, api_exceptions.GoogleAPICallError) else None,
+        )
+
+    def extract_phrases(self, content: str, categories: list, priority: Optional[int] = None) -> str:
         """
         提煉話術並分類
 
         Args:
             content: 文件內容
             categories: 分類列表
+            priority: 排程優先序權重，見 analyze_content
 
         Returns:
             結構化的話術字典
         """
-        prompt = f"""
+        prompt = self.build_extract_prompt(categories)
+        result = self.analyze_content(content, prompt, priority)
+        return result
+
+    @staticmethod
+    def build_extract_prompt(categories: list) -> str:
+        """話術提煉的指令（不含文件內容），相同類別只組合一次"""
+        return GeminiClient._render_extract_prompt(tuple(categories))
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _render_extract_prompt(categories: Tuple[str, ...]) -> str:
+        return f"""
 你是一位專業的企業文件分析師，擅長識別商業報告中的專業用語、官方話術和行業術語。請仔細分析以下報告文件，提煉出各類話術和術語。
 
 ## 任務要求
@@ -93,45 +166,36 @@ class GeminiClient:
 - 保持繁體中文輸出
 """
 
-        result = self.analyze_content(content, prompt)
-        return result
-
-    def compare_and_deduplicate(self, existing_content: str, new_content: str) -> str:
+    def judge_duplicates(self, pairs: List[Tuple[str, str, str]]) -> List[bool]:
         """
-        比對現有知識庫與新內容，進行去重與合併
+        判斷本地去重無法確定的術語配對是否為同一概念
 
         Args:
-            existing_content: 現有知識庫內容
-            new_content: 新提煉的內容
+            pairs: (類別, 新術語, 既有術語) 列表
 
         Returns:
-            合併後的內容
+            與 pairs 對應的判斷結果（True 表示應合併）
         """
+        lines = [f"{i}. [{category}] 「{new}」 vs 「{existing}」"
+                 for i, (category, new, existing) in enumerate(pairs, 1)]
         prompt = f"""
-你是知識庫管理專家，需要將新內容與現有知識庫進行智能合併。
-
-## 任務
-1. 比對「現有知識庫」與「新內容」
-2. 識別重複或相似的話術/術語
-3. 保留更完整、更準確的版本
-4. 補充新的話術，避免重複
-5. 維持原有的分類結構
+你是知識庫管理專家。以下每一行是同一類別中兩個相似的術語/話術，
+請判斷它們是否指同一個概念（僅表述、繁簡或用字不同）。
 
-## 去重原則
-- 完全相同：保留一個
-- 語意相似但表述不同：保留更專業的版本，可在說明中提及變體
-- 補充說明：合併到同一項目中
-- 全新內容：直接加入對應類別
-
-## 現有知識庫
-{existing_content}
-
-## 新內容
-{new_content}
+{chr(10).join(lines)}
 
 ## 輸出要求
-輸出完整的合併後知識庫，保持 Markdown 格式，結構清晰。
+只輸出一個 JSON 陣列，依序對應每一行，同一概念為 true，否則為 false。
+例如：[true, false]
 """
 
         result = self.analyze_content("", prompt)
-        return result
+        match = re.search(r'\[.*?\]', result, re.DOTALL)
+        try:
+            verdicts = json.loads(match.group(0)) if match else []
+        except json.JSONDecodeError:
+            verdicts = []
+
+        # 無法解析時保守地視為不同術語
+        return [bool(verdicts[i]) if i < len(verdicts) else False
+                for i in range(len(pairs))]
@@ -1,17 +1,33 @@
 """
 話術提取器
 """
-from typing import Optional
-from .gemini_client import GeminiClient
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .async_client import AsyncGeminiClient, run_coroutine
+from .extraction_cache import ExtractionCache, make_cache_key
+from .gemini_client import GeminiAPIError
+from .token_planner import PromptPlanner, RequestPlan, estimate_tokens
+from knowledge_base import DeduplicationEngine, DifyFormatter, KBEntry
 import config
+import tracing
 
 
 class PhraseExtractor:
     """從文件中提取話術和術語"""
 
-    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
-        self.client = GeminiClient(api_key, model)
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None,
+                 cache: Optional[ExtractionCache] = None):
+        self.client = AsyncGeminiClient(api_key, model)
         self.categories = config.CATEGORIES
+        self.cache = cache
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        self._stats_lock = threading.Lock()
+        # 各區塊目前已產生的內容（供任務預覽）
+        self._partials: List[str] = []
+        self._partial_sent = 0.0
 
     def extract(self, content: str) -> str:
         """
@@ -28,21 +44,236 @@ class PhraseExtractor:
         print("✅ 話術提煉完成")
         return result
 
-    def merge_with_existing(self, existing_kb: str, new_content: str) -> str:
+    def plan(self, parsed: Dict[str, Any], budget: Optional[int] = None) -> RequestPlan:
         """
-        將新內容與現有知識庫合併
+        依 token 預算規劃文件的提取請求：小區塊合併、過大區塊切開
 
         Args:
-            existing_kb: 現有知識庫內容
-            new_content: 新提煉的內容
+            parsed: WordParser / PPTParser 的解析結果
+            budget: 單一請求的輸入 token 上限，預設依 EXTRACT_TOKEN_BUDGET
 
         Returns:
-            合併後的知識庫
+            RequestPlan（chunks 可直接交給 extract_chunks）
         """
-        if not existing_kb or existing_kb.strip() == "":
-            return new_content
+        return self._planner(budget).plan(parsed, self.client.build_extract_prompt(self.categories))
 
-        print("🔄 正在合併與去重...")
-        merged = self.client.compare_and_deduplicate(existing_kb, new_content)
-        print("✅ 合併完成")
-        return merged
+    def plan_units(self, units: List[str], budget: Optional[int] = None) -> RequestPlan:
+        """
+        規劃指定結構單元的提取請求（增量提取時只傳入變更或新增的單元）
+
+        Returns:
+            RequestPlan，chunk_units 為各區塊包含的單元索引
+        """
+        return self._planner(budget).plan_units(
+            units, self.client.build_extract_prompt(self.categories)
+        )
+
+    def _planner(self, budget: Optional[int]) -> PromptPlanner:
+        count_tokens = self.client.count_tokens if config.TOKEN_COUNT_MODE == 'api' else None
+        return PromptPlanner(self.client.model_name, budget, count_tokens=count_tokens)
+
+    def extract_chunks(self, chunks: List[str], max_concurrency: Optional[int] = None,
+                       on_progress: Optional[Callable[[int, int], None]] = None,
+                       on_partial: Optional[Callable[[str], None]] = None,
+                       chunk_units: Optional[List[List[str]]] = None
+                       ) -> List[KBEntry]:
+        """
+        並行提取多個區塊並在本地歸併（map-reduce）
+
+        GEMINI_ASYNC 啟用時所有區塊在背景事件迴圈以串流方式分析，否則使用執行緒池
+
+        Args:
+            chunks: 依結構邊界切分的區塊
+            max_concurrency: 同時分析的區塊數上限
+            on_progress: 進度回呼 (已完成數, 總數)
+            on_partial: 目前已產生的 Markdown（依區塊順序串接），最多每
+                        PARTIAL_CONTENT_INTERVAL 秒呼叫一次
+            chunk_units: 各區塊包含的單元指紋，提供時記錄於條目的 units（增量重新匯入用）
+
+        Returns:
+            歸併後的條目（完全/高度相似的重複已合併）
+        """
+        if not chunks:
+            return []
+
+        workers = min(max_concurrency or config.EXTRACT_MAX_CONCURRENCY, len(chunks))
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        self._partials = [''] * len(chunks)
+        self._partial_sent = 0.0
+        # 排程優先序依整份文件大小，小文件的區塊不會排在大文件之後
+        priority = sum(estimate_tokens(chunk) for chunk in chunks)
+
+        print(f"🤖 正在使用 Gemini 分析文件（{len(chunks)} 個區塊，並行 {workers}）...")
+        if config.GEMINI_ASYNC:
+            outputs = run_coroutine(self._extract_all_async(
+                chunks, workers, priority, on_progress, on_partial
+            )).result()
+        else:
+            outputs = self._extract_all(chunks, workers, priority, on_progress, on_partial)
+
+        if chunk_units is not None:
+            for chunk_entries, units in zip(outputs, chunk_units):
+                for entry in chunk_entries:
+                    entry.units = list(units)
+
+        # reduce：依區塊順序歸併，可疑配對保留給後續與知識庫去重時判斷
+        reduced = DeduplicationEngine().deduplicate(
+            [entry for chunk_entries in outputs for entry in chunk_entries], []
+        )
+        if self.cache:
+            print(f"✅ 話術提煉完成（快取命中 {self.cache_stats['hits']}/{len(chunks)}）")
+        else:
+            print("✅ 話術提煉完成")
+        return reduced.resolve()
+
+    def _extract_all(self, chunks: List[str], workers: int, priority: int,
+                     on_progress: Optional[Callable[[int, int], None]],
+                     on_partial: Optional[Callable[[str], None]]) -> List[List[KBEntry]]:
+        """以執行緒池並行提取，任一區塊失敗時取消尚未開始的區塊，不等待其餘區塊完成"""
+        results: List[List[KBEntry]] = [[] for _ in chunks]
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {
+                pool.submit(tracing.bind(self._extract_chunk), chunk, priority): i
+                for i, chunk in enumerate(chunks)
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                index = futures[future]
+                try:
+                    text = future.result()
+                except GeminiAPIError as e:
+                    raise self._chunk_error(index, len(chunks), e) from e
+                results[index] = DifyFormatter.parse_entries(text)
+                self._report_partial(index, text, on_partial, force=True)
+                if on_progress:
+                    on_progress(done, len(chunks))
+        except BaseException:
+            # 執行中的區塊無法中斷，於背景完成後結果即捨棄
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+        return results
+
+    async def _extract_all_async(self, chunks: List[str], workers: int, priority: int,
+                                 on_progress: Optional[Callable[[int, int], None]],
+                                 on_partial: Optional[Callable[[str], None]]
+                                 ) -> List[List[KBEntry]]:
+        """於事件迴圈並行串流提取，快取與回呼等阻塞操作交給執行緒執行"""
+        client = self.client
+        semaphore = asyncio.Semaphore(workers)
+        done = 0
+
+        async def extract(index: int, chunk: str) -> List[KBEntry]:
+            nonlocal done
+            async with semaphore:
+                key = make_cache_key(chunk, client.model_name) if self.cache else None
+                cached = await asyncio.to_thread(self.cache.get, key) if self.cache else None
+                if self.cache:
+                    self._count_cache(hit=cached is not None)
+
+                if cached is not None:
+                    text = cached
+                else:
+                    try:
+                        text = await client.extract_phrases_async(
+                            chunk, self.categories, priority,
+                            on_partial=lambda partial: self._report_partial_async(
+                                index, partial, on_partial
+                            )
+                        )
+                    except GeminiAPIError as e:
+                        raise self._chunk_error(index, len(chunks), e) from e
+                    if self.cache:
+                        await asyncio.to_thread(self.cache.set, key, text)
+
+            await self._report_partial_async(index, text, on_partial, force=True)
+            done += 1
+            if on_progress:
+                await asyncio.to_thread(on_progress, done, len(chunks))
+            return DifyFormatter.parse_entries(text)
+
+        tasks = [asyncio.ensure_future(extract(i, chunk)) for i, chunk in enumerate(chunks)]
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+    @staticmethod
+    def _chunk_error(index: int, total: int, error: GeminiAPIError) -> GeminiAPIError:
+        """加上區塊位置的 GeminiAPIError（保留 retryable / status_code，其他例外原樣拋出）"""
+        return GeminiAPIError(f"第 {index + 1}/{total} 個區塊分析失敗: {error}",
+                              retryable=error.retryable, status_code=error.status_code)
+
+    def _report_partial(self, index: int, text: str, on_partial: Optional[Callable[[str], None]],
+                        force: bool = False) -> None:
+        """記錄區塊的部分結果，距上次回報超過間隔（或 force）時回報串接內容"""
+        content = self._collect_partial(index, text, on_partial, force)
+        if content is not None and on_partial:
+            on_partial(content)
+
+    async def _report_partial_async(self, index: int, text: str,
+                                    on_partial: Optional[Callable[[str], None]],
+                                    force: bool = False) -> None:
+        content = self._collect_partial(index, text, on_partial, force)
+        if content is not None and on_partial:
+            await asyncio.to_thread(on_partial, content)
+
+    def _collect_partial(self, index: int, text: str, on_partial: Optional[Callable[[str], None]],
+                         force: bool) -> Optional[str]:
+        with self._stats_lock:
+            self._partials[index] = text
+            now = time.monotonic()
+            if on_partial is None:
+                return None
+            if not force and now - self._partial_sent < config.PARTIAL_CONTENT_INTERVAL:
+                return None
+            self._partial_sent = now
+            content = '\n'.join(part for part in self._partials if part)
+        return content[:config.PARTIAL_CONTENT_MAX_CHARS]
+
+    @property
+    def gemini_stats(self) -> dict:
+        """本次提取的 Gemini 呼叫統計（請求數、重試數、排隊秒數、實際 token 用量）"""
+        stats = dict(self.client.stats)
+        if 'queue_wait_seconds' in stats:
+            stats['queue_wait_seconds'] = round(stats['queue_wait_seconds'], 2)
+        return stats
+
+    def _extract_chunk(self, chunk: str, priority: Optional[int] = None) -> str:
+        """提取單一區塊，未變更的區塊直接使用快取結果"""
+        if self.cache is None:
+            return self.client.extract_phrases(chunk, self.categories, priority)
+
+        key = make_cache_key(chunk, self.client.model_name)
+        cached = self.cache.get(key)
+        self._count_cache(hit=cached is not None)
+        if cached is not None:
+            return cached
+
+        result = self.client.extract_phrases(chunk, self.categories, priority)
+        self.cache.set(key, result)
+        return result
+
+    def _count_cache(self, hit: bool) -> None:
+        with self._stats_lock:
+            self.cache_stats['hits' if hit else 'misses'] += 1
+
+    def resolve_duplicates(self, pairs: List[Tuple[str, str, str]]) -> List[bool]:
+        """
+        交由 Gemini 判斷本地去重無法確定的配對
+
+        Args:
+            pairs: (類別, 新術語, 既有術語) 列表
+
+        Returns:
+            與 pairs 對應的判斷結果
+        """
+        if not pairs:
+            return []
+
+        print(f"🔍 正在判斷 {len(pairs)} 組相似術語...")
+        verdicts = self.client.judge_duplicates(pairs)
+        print("✅ 相似術語判斷完成")
+        return verdicts
@@ -0,0 +1,417 @@
+"""
+Gemini 請求排程器
+所有 Gemini 呼叫經由同一個排程器：依 (API Key, 模型) 以 token bucket 限制 RPM 與 TPM（輸入 token），
+等待中的請求依文件大小排優先序（小文件先、等待越久越優先），
+可重試的錯誤以指數退避加隨機抖動重試，收到 429 時自動降低該 Key 的速率
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from google.api_core import exceptions as api_exceptions  # type: ignore[import-untyped]
+
+import config
+from metrics import get_metrics
+from tracing import span
+from .token_planner import get_token_counter
+
+T = TypeVar('T')
+
+# 暫時性錯誤：429、5xx、逾時與連線中斷
+# google-genai 的 httpx 逾時與傳輸錯誤不屬於內建 ConnectionError / TimeoutError，
+# 由 client_pool 轉為 DeadlineExceeded / ServiceUnavailable（ServerError）後重試
+RETRYABLE_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.ServerError,
+    api_exceptions.Aborted,
+    ConnectionError,
+    TimeoutError,
+)
+RATE_LIMIT_ERRORS = (api_exceptions.TooManyRequests,)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """是否為可重試的暫時性錯誤（429、5xx、逾時、連線中斷）"""
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class TokenBucket:
+    """每分鐘補充 per_minute 個額度的 token bucket，速率可依 429 動態調整"""
+
+    MIN_FACTOR = 0.1
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.factor = 1.0
+        self._updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        """目前每秒補充量"""
+        return self.capacity * self.factor / 60.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """取得 amount 額度前需等待的秒數（超過容量的請求只需等到額度全滿）"""
+        self._refill(now)
+        needed = min(amount, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def consume(self, amount: float, now: float) -> None:
+        """扣除額度（可為負值以退回，或使額度暫時為負以償還超用）"""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def throttle(self) -> None:
+        """收到 429：速率減半並清空現有額度"""
+        self.factor = max(self.MIN_FACTOR, self.factor * 0.5)
+        self.tokens = min(self.tokens, 0.0)
+
+    def recover(self) -> None:
+        """成功呼叫後逐步恢復速率"""
+        self.factor = min(1.0, self.factor + 0.05)
+
+
+@dataclass
+class _Limiter:
+    """單一 (API Key, 模型) 的速率限制與等待佇列"""
+    rpm: TokenBucket
+    tpm: TokenBucket
+    waiting: List[Tuple[float, int]] = field(default_factory=list)
+    # 進行中的呼叫數與最後使用時間（閒置移除用）
+    active: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        return max(self.rpm.wait_time(1, now), self.tpm.wait_time(tokens, now))
+
+    def consume(self, tokens: int, now: float) -> None:
+        self.rpm.consume(1, now)
+        self.tpm.consume(tokens, now)
+
+    def throttle(self) -> None:
+        self.rpm.throttle()
+        self.tpm.throttle()
+
+    def recover(self) -> None:
+        self.rpm.recover()
+        self.tpm.recover()
+
+
+class GeminiScheduler:
+    """Gemini 呼叫的速率限制、優先序與重試（同步與 asyncio 呼叫共用額度與佇列）"""
+
+    # asyncio 呼叫等待輪到自己時的輪詢間隔（秒）
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None,
+                 max_retries: Optional[int] = None, base_delay: Optional[float] = None,
+                 max_delay: Optional[float] = None, aging: Optional[float] = None):
+        """
+        Args:
+            rpm: 每個 (Key, 模型) 每分鐘請求數上限
+            tpm: 每個 (Key, 模型) 每分鐘 token 數上限
+            max_retries: 可重試錯誤的最大重試次數
+            base_delay: 退避基準秒數（第 n 次重試最多等待 base_delay * 2^n）
+            max_delay: 單次退避上限秒數
+            aging: 優先序老化速度，等待 1 秒相當於文件少 aging 個 token
+        """
+        self.rpm = rpm or config.GEMINI_RPM_LIMIT
+        self.tpm = tpm or config.GEMINI_TPM_LIMIT
+        self.max_retries = config.GEMINI_MAX_RETRIES if max_retries is None else max_retries
+        self.base_delay = config.GEMINI_RETRY_BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = max_delay or config.GEMINI_RETRY_MAX_DELAY
+        self.aging = aging or config.GEMINI_PRIORITY_AGING
+
+        self.idle_seconds = config.GEMINI_LIMITER_IDLE_SECONDS
+        # 以 API Key 的雜湊為鍵，不保留原始 Key；閒置的項目定期移除
+        self._limiters: Dict[Tuple[str, str], _Limiter] = {}
+        self._last_sweep = time.monotonic()
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._metrics = {
+            'requests': 0, 'retries': 0, 'failures': 0, 'rate_limited': 0,
+            'queue_wait_seconds': 0.0, 'queue_wait_max_seconds': 0.0,
+            'input_tokens': 0, 'output_tokens': 0,
+        }
+
+    def call(self, api_key: str, model: str, fn: Callable[[], T], tokens: int,
+             priority: Optional[int] = None, stats: Optional[Dict[str, Any]] = None) -> T:
+        """
+        排程並執行一次 Gemini 呼叫（阻塞至完成）
+
+        Args:
+            api_key: Gemini API Key
+            model: 模型名稱
+            fn: 實際呼叫，回傳值若有 usage_metadata 則以實際輸入 token 數校正額度
+            tokens: 預估輸入 token 數（預先扣除 TPM 額度）
+            priority: 優先序權重（通常為整份文件的 token 數），越小越優先，預設同 tokens
+            stats: 呼叫端的統計 dict，累加 requests / retries / queue_wait_seconds
+                   與實際用量 input_tokens / output_tokens
+
+        Raises:
+            最後一次嘗試的原始例外（不可重試或已用盡重試次數）
+        """
+        limiter = self._checkout(api_key, model)
+        weight = tokens if priority is None else priority
+
+        attempt = 0
+        try:
+            while True:
+                waited = self._acquire(limiter, tokens, weight)
+                self._record(stats, requests=1, queue_wait_seconds=waited)
+                started = time.perf_counter()
+                try:
+                    with span('gemini.attempt', cat='gemini', model=model, attempt=attempt + 1,
+                              queue_wait_ms=round(waited * 1000, 1)):
+                        result = fn()
+                except Exception as e:
+                    self._observe_latency(model, started, e)
+                    delay = self._retry_delay(limiter, e, attempt, stats)
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+
+                self._on_success(limiter, model, result, tokens, stats, started)
+                return result
+        finally:
+            self._checkin(limiter)
+
+    async def call_async(self, api_key: str, model: str, fn: Callable[[], Awaitable[T]],
+                         tokens: int, priority: Optional[int] = None,
+                         stats: Optional[Dict[str, Any]] = None) -> T:
+        """
+        call() 的 asyncio 版本：排隊與退避期間不佔用執行緒
+
+        Args:
+            fn: 回傳 coroutine 的函式（每次重試重新呼叫）
+            其餘參數同 call()
+        """
+        limiter = self._checkout(api_key, model)
+        weight = tokens if priority is None else priority
+
+        attempt = 0
+        try:
+            while True:
+                waited = await self._acquire_async(limiter, tokens, weight)
+                self._record(stats, requests=1, queue_wait_seconds=waited)
+                started = time.perf_counter()
+                try:
+                    with span('gemini.attempt', cat='gemini', model=model, attempt=attempt + 1,
+                              queue_wait_ms=round(waited * 1000, 1)):
+                        result = await fn()
+                except Exception as e:
+                    self._observe_latency(model, started, e)
+                    delay = self._retry_delay(limiter, e, attempt, stats)
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+
+                self._on_success(limiter, model, result, tokens, stats, started)
+                return result
+        finally:
+            self._checkin(limiter)
+
+    def _retry_delay(self, limiter: _Limiter, error: Exception, attempt: int,
+                     stats: Optional[Dict[str, Any]]) -> float:
+        """
+        處理失敗的呼叫，回傳重試前的等待秒數
+
+        Raises:
+            error: 不可重試或已用盡重試次數
+        """
+        with self._cond:
+            if isinstance(error, RATE_LIMIT_ERRORS):
+                limiter.throttle()
+                self._metrics['rate_limited'] += 1
+        if not is_retryable(error) or attempt >= self.max_retries:
+            self._record(stats, failures=1)
+            raise error
+
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        self._record(stats, retries=1)
+        print(f"⏳ Gemini 暫時性錯誤，{delay:.1f} 秒後重試（第 {attempt + 1} 次）: {error}")
+        return delay
+
+    @staticmethod
+    def _observe_latency(model: str, started: float, error: Optional[Exception] = None) -> None:
+        if error is None:
+            outcome = 'ok'
+        elif isinstance(error, RATE_LIMIT_ERRORS):
+            outcome = 'rate_limited'
+        else:
+            outcome = 'error'
+        get_metrics().observe('kb_gemini_request_duration_seconds',
+                              time.perf_counter() - started, model=model, outcome=outcome)
+
+    def _on_success(self, limiter: _Limiter, model: str, result: Any, tokens: int,
+                    stats: Optional[Dict[str, Any]], started: float) -> None:
+        """
+        恢復速率，並以回應的實際用量校正 TPM 額度與 token 估算
+        （預先扣除的是預估的輸入 token，校正時同樣只比較輸入 token）
+        """
+        self._observe_latency(model, started)
+        usage = getattr(result, 'usage_metadata', None)
+        prompt_tokens = _token_count(usage, 'prompt_token_count')
+        output_tokens = _token_count(usage, 'candidates_token_count')
+
+        with self._cond:
+            limiter.recover()
+            if prompt_tokens:
+                limiter.tpm.consume(prompt_tokens - tokens, time.monotonic())
+        if prompt_tokens:
+            get_token_counter().observe(model, tokens, prompt_tokens)
+        if prompt_tokens or output_tokens:
+            self._record(stats, input_tokens=prompt_tokens, output_tokens=output_tokens)
+            metrics = get_metrics()
+            metrics.inc('kb_gemini_tokens_total', prompt_tokens, model=model, direction='input')
+            metrics.inc('kb_gemini_tokens_total', output_tokens, model=model, direction='output')
+
+    def metrics(self) -> Dict[str, Any]:
+        """全域統計與各 (Key, 模型) 的目前速率"""
+        with self._cond:
+            snapshot: Dict[str, Any] = dict(self._metrics)
+            snapshot['limiters'] = {
+                f"{key[:8]}/{model}": {
+                    'waiting': len(limiter.waiting),
+                    'rate_factor': round(limiter.rpm.factor, 2),
+                }
+                for (key, model), limiter in self._limiters.items()
+            }
+        return snapshot
+
+    def _checkout(self, api_key: str, model: str) -> _Limiter:
+        """取得 (Key, 模型) 的額度狀態並標記使用中，呼叫結束後需 _checkin"""
+        key = (_key_id(api_key), model)
+        with self._cond:
+            now = time.monotonic()
+            self._sweep(now)
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                rpm, tpm = config.GEMINI_MODEL_RATE_LIMITS.get(model, (self.rpm, self.tpm))
+                limiter = _Limiter(rpm=TokenBucket(rpm), tpm=TokenBucket(tpm))
+                self._limiters[key] = limiter
+            limiter.active += 1
+            limiter.last_used = now
+            return limiter
+
+    def _checkin(self, limiter: _Limiter) -> None:
+        with self._cond:
+            limiter.active -= 1
+            limiter.last_used = time.monotonic()
+
+    def _sweep(self, now: float) -> None:
+        """移除閒置超過 idle_seconds 的額度狀態（呼叫端需持有鎖，每半個閒置期最多掃描一次）"""
+        if now - self._last_sweep < self.idle_seconds / 2:
+            return
+        self._last_sweep = now
+        for key, limiter in list(self._limiters.items()):
+            if (limiter.active == 0 and not limiter.waiting
+                    and now - limiter.last_used > self.idle_seconds):
+                del self._limiters[key]
+
+    def _acquire(self, limiter: _Limiter, tokens: int, weight: int) -> float:
+        """排隊取得額度，回傳等待秒數"""
+        start = time.monotonic()
+        ticket = (start + weight / self.aging, next(self._seq))
+
+        with self._cond:
+            heapq.heappush(limiter.waiting, ticket)
+            while True:
+                wait = self._try_take(limiter, ticket, tokens)
+                if wait == 0:
+                    break
+                self._cond.wait(wait)
+
+        return time.monotonic() - start
+
+    async def _acquire_async(self, limiter: _Limiter, tokens: int, weight: int) -> float:
+        """_acquire 的 asyncio 版本，以短間隔輪詢代替條件變數等待"""
+        start = time.monotonic()
+        ticket = (start + weight / self.aging, next(self._seq))
+
+        with self._cond:
+            heapq.heappush(limiter.waiting, ticket)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(limiter, ticket, tokens)
+                if wait == 0:
+                    break
+                await asyncio.sleep(min(wait or self.POLL_INTERVAL, self.POLL_INTERVAL * 10))
+        except asyncio.CancelledError:
+            with self._cond:
+                if ticket in limiter.waiting:
+                    limiter.waiting.remove(ticket)
+                    heapq.heapify(limiter.waiting)
+                    self._cond.notify_all()
+            raise
+
+        return time.monotonic() - start
+
+    def _try_take(self, limiter: _Limiter, ticket: Tuple[float, int], tokens: int) -> Optional[float]:
+        """
+        輪到此 ticket 且額度足夠時取得額度並回傳 0（呼叫端需持有鎖）
+
+        Returns:
+            0 表示已取得；正數為輪到但需等待的秒數；None 表示尚未輪到
+        """
+        if limiter.waiting[0] != ticket:
+            return None
+        now = time.monotonic()
+        wait = limiter.wait_time(tokens, now)
+        if wait > 0:
+            return wait
+        heapq.heappop(limiter.waiting)
+        limiter.consume(tokens, now)
+        self._cond.notify_all()
+        return 0
+
+    def _record(self, stats: Optional[Dict[str, Any]], **counts: float) -> None:
+        with self._cond:
+            for name, value in counts.items():
+                self._metrics[name] += value
+                if stats is not None:
+                    stats[name] = stats.get(name, 0) + value
+            waited = counts.get('queue_wait_seconds')
+            if waited is not None:
+                self._metrics['queue_wait_max_seconds'] = max(
+                    self._metrics['queue_wait_max_seconds'], waited
+                )
+
+
+def _token_count(usage: Any, name: str) -> int:
+    """usage_metadata 中的 token 數（串流回應在迭代完成前可能尚未提供）"""
+    value = getattr(usage, name, None)
+    return value if isinstance(value, int) and value > 0 else 0
+
+
+def _key_id(api_key: str) -> str:
+    """以雜湊代表 API Key（額度狀態的鍵與統計輸出，不保留原始 Key）"""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+_scheduler: Optional[GeminiScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> GeminiScheduler:
+    """取得共用的排程器"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = GeminiScheduler()
+    return _scheduler
@@ -0,0 +1,168 @@
+"""
+Token 預算規劃
+送出前估算每個請求的 token 數：依結構切分文件後，將小區塊合併、過大區塊切開，
+使每個請求（指令 + 內容）都在模型預算內。估算以本地規則為主，並依實際回應的
+usage_metadata 持續校正；TOKEN_COUNT_MODE=api 時另以 SDK count_tokens 逐一確認
+"""
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import config
+from .chunker import document_units, pack_units
+
+_CJK = re.compile(r'[⺀-鿿가-힯豈-﫿＀-￯]')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗估 token 數：CJK 字元約 1 token，其餘約 4 字元 1 token"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class TokenCounter:
+    """本地 token 估算，各模型依實際用量校正比例"""
+
+    # 每次觀測對校正比例的權重
+    SMOOTHING = 0.2
+
+    def __init__(self):
+        self._factors: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def count(self, text: str, model: Optional[str] = None) -> int:
+        """估算 text 的 token 數（已套用該模型的校正比例）"""
+        return max(1, round(estimate_tokens(text) * self.factor(model)))
+
+    def factor(self, model: Optional[str]) -> float:
+        return self._factors.get(model or '', 1.0)
+
+    def observe(self, model: str, counted: int, actual: int) -> None:
+        """
+        以實際 token 數校正
+
+        Args:
+            model: 模型名稱
+            counted: 送出前以 count() 估算的數量
+            actual: 回應 usage_metadata 或 count_tokens 的實際數量
+        """
+        if counted <= 0 or actual <= 0:
+            return
+        with self._lock:
+            current = self._factors.get(model, 1.0)
+            observed = current * actual / counted
+            self._factors[model] = current + (observed - current) * self.SMOOTHING
+
+
+_counter: Optional[TokenCounter] = None
+_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    """取得共用的 token 計數器"""
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = TokenCounter()
+    return _counter
+
+
+@dataclass
+class RequestPlan:
+    """一份文件的請求規劃"""
+    chunks: List[str]
+    # 各請求的估算輸入 token 數（含指令）
+    request_tokens: List[int] = field(default_factory=list)
+    prompt_tokens: int = 0
+    # 各請求包含的單元索引（plan / plan_units 規劃時提供）
+    chunk_units: List[List[int]] = field(default_factory=list)
+
+    @property
+    def estimated_tokens(self) -> int:
+        return sum(self.request_tokens)
+
+
+class PromptPlanner:
+    """依模型的輸入 token 預算規劃請求"""
+
+    def __init__(self, model: Optional[str] = None, budget: Optional[int] = None,
+                 counter: Optional[TokenCounter] = None,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        """
+        Args:
+            model: 模型名稱（用於校正比例）
+            budget: 單一請求的輸入 token 上限（指令 + 內容），預設依 EXTRACT_TOKEN_BUDGET
+            counter: token 計數器，預設使用共用計數器
+            count_tokens: 精確計數函式（例如 SDK count_tokens），提供時逐一確認規劃結果
+        """
+        self.model = model or config.GEMINI_MODEL
+        self.budget = budget or config.EXTRACT_TOKEN_BUDGET
+        self.counter = counter or get_token_counter()
+        self.count_tokens = count_tokens
+
+    def measure(self, text: str) -> int:
+        return self.counter.count(text, self.model)
+
+    def plan(self, parsed: Dict[str, Any], prompt: str) -> RequestPlan:
+        """
+        規劃文件的請求
+
+        Args:
+            parsed: WordParser / PPTParser 的解析結果
+            prompt: 每個請求共用的指令
+
+        Returns:
+            RequestPlan，chunks 中每個區塊加上指令後都不超過預算
+        """
+        return self.plan_units(document_units(parsed), prompt)
+
+    def plan_units(self, units: List[str], prompt: str) -> RequestPlan:
+        """
+        規劃指定結構單元的請求（增量提取時只包含變更的單元）
+
+        Returns:
+            RequestPlan，chunk_units 為各區塊包含的單元索引
+        """
+        prompt_tokens = self.measure(prompt)
+        content_budget = max(self.budget - prompt_tokens, 1)
+        owners: List[List[int]] = []
+        chunks = pack_units(units, content_budget, self.measure, owners)
+        return self._finalize(chunks, prompt_tokens, content_budget, owners)
+
+    def pack(self, texts: List[str], prompt: str) -> RequestPlan:
+        """將多段文字依序合併為盡量少的請求（過大者切開）"""
+        prompt_tokens = self.measure(prompt)
+        content_budget = max(self.budget - prompt_tokens, 1)
+        chunks = pack_units([t for t in texts if t.strip()], content_budget, self.measure)
+        return self._finalize(chunks, prompt_tokens, content_budget)
+
+    def _finalize(self, chunks: List[str], prompt_tokens: int, content_budget: int,
+                  owners: Optional[List[List[int]]] = None) -> RequestPlan:
+        """計算各請求的估算值；有精確計數時確認並切開仍超出預算的區塊"""
+        if self.count_tokens is not None:
+            verified: List[str] = []
+            verified_owners: List[List[int]] = []
+            for i, chunk in enumerate(chunks):
+                counted = self.measure(chunk)
+                actual = self.count_tokens(chunk)
+                self.counter.observe(self.model, counted, actual)
+                if actual > content_budget:
+                    # 依實際比例縮小上限後重新切分（各段沿用原區塊的單元）
+                    scaled = max(int(content_budget * counted / actual), 1)
+                    pieces = pack_units([chunk], scaled, self.measure)
+                else:
+                    pieces = [chunk]
+                verified.extend(pieces)
+                if owners is not None:
+                    verified_owners.extend(owners[i] for _ in pieces)
+            chunks = verified
+            owners = verified_owners if owners is not None else None
+
+        return RequestPlan(
+            chunks=chunks,
+            request_tokens=[prompt_tokens + self.measure(chunk) for chunk in chunks],
+            prompt_tokens=prompt_tokens,
+            chunk_units=owners or [],
+        )
@@ -18,13 +18,18 @@ from flask import Flask, render_template
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 # 添加當前目錄到 Python 路徑
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from routes import upload_bp, tasks_bp, download_bp
-from services import create_task_store, DocumentProcessor, shutdown_executor
+from routes import upload_bp, tasks_bp, download_bp, metrics_bp
+from services import (
+    create_task_store, create_job_queue, DocumentProcessor, shutdown_executor,
+    IngestRequest, sweep_orphaned_uploads
+)
 from version import VERSION, get_version_info
+import config
 
 
 def create_app(config_override: dict | None = None) -> Flask:
@@ -38,17 +43,24 @@ def create_app(config_override: dict | None = None) -> Flask:
         Flask 應用實例
     """
     app = Flask(__name__)
+    # 上傳檔案串流寫入記憶體緩衝區並同步檢查，不經過 uploads/ 資料夾
+    app.request_class = IngestRequest
 
     # 基本配置
     app.config['UPLOAD_FOLDER'] = 'uploads'
     app.config['OUTPUT_FOLDER'] = 'output'
-    app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB 上傳限制
+    app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB 上傳限制（批次上傳另依 BATCH_MAX_REQUEST_BYTES）
     app.config['ALLOWED_EXTENSIONS'] = {'docx', 'pptx'}
 
     # 覆蓋配置
     if config_override:
         app.config.update(config_override)
 
+    # 位於反向代理後方時以 X-Forwarded-* 取得真實來源 IP（否則所有使用者共用代理的 IP）
+    if config.TRUSTED_PROXY_HOPS:
+        hops = config.TRUSTED_PROXY_HOPS
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
     # 初始化 CORS
     CORS(app)
 
@@ -69,17 +81,29 @@ def create_app(config_override: dict | None = None) -> Flask:
     task_store = create_task_store()
     app.config['TASK_STORE'] = task_store
 
-    # 初始化文件處理器
-    processor = DocumentProcessor(task_store, app.config['OUTPUT_FOLDER'])
+    # 初始化文件處理器（設定 JOB_QUEUE 時只入列，由 python -m services.worker 處理）
+    job_queue = create_job_queue()
+    processor = DocumentProcessor(
+        task_store, app.config['OUTPUT_FOLDER'], job_queue=job_queue
+    )
     app.config['DOCUMENT_PROCESSOR'] = processor
 
+    # 非佇列模式下 uploads/ 只有處理中的 zip 解出檔與大型上傳，沒有其他行程使用時過舊的檔案為當機遺留
+    if job_queue is None:
+        removed = sweep_orphaned_uploads(app.config['UPLOAD_FOLDER'])
+        if removed:
+            print(f"🧹 已清除 {removed} 個遺留的上傳檔案")
+
     # 註冊 Blueprint
     app.register_blueprint(upload_bp)
     app.register_blueprint(tasks_bp)
     app.register_blueprint(download_bp)
+    app.register_blueprint(metrics_bp)
 
     # 對特定路由套用限制
     limiter.limit("10 per minute")(upload_bp)
+    # 指標由 Prometheus 定期抓取，不受預設限制
+    limiter.exempt(metrics_bp)
 
     # 首頁路由
     @app.route('/')
@@ -0,0 +1,4 @@
+"""
+效能基準測試
+於專案根目錄執行，例如：python -m benchmarks.bench_dedup
+"""
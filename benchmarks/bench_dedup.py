@@ -0,0 +1,104 @@
+"""
+本地去重引擎基準測試
+
+以合成知識庫（10k–100k 條目）測量：
+- 一次上傳（500 條新條目）對既有知識庫去重的耗時
+- 整個知識庫自我去重的耗時
+
+用法：
+    python -m benchmarks.bench_dedup [--sizes 10000 50000 100000] [--batch 500]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from knowledge_base import DeduplicationEngine, KBEntry  # noqa: E402
+from knowledge_base.normalizer import DEFAULT_FOLD_TABLE  # noqa: E402
+
+_TRADITIONAL = list(DEFAULT_FOLD_TABLE.keys())
+_SIMPLIFIED = {v: k for k, v in DEFAULT_FOLD_TABLE.items()}
+
+
+def _random_term(rng: random.Random) -> str:
+    """隨機 CJK 術語，混入繁體字以便測試繁簡折疊"""
+    length = rng.randint(2, 8)
+    chars = []
+    for _ in range(length):
+        if rng.random() < 0.3:
+            chars.append(rng.choice(_TRADITIONAL))
+        else:
+            chars.append(chr(rng.randint(0x4E00, 0x9FA5)))
+    return ''.join(chars)
+
+
+def _variant(term: str, rng: random.Random) -> str:
+    """產生變體：繁轉簡、全形英數、或增刪一字"""
+    roll = rng.random()
+    if roll < 0.4:
+        return ''.join(DEFAULT_FOLD_TABLE.get(ch, ch) for ch in term)
+    if roll < 0.6:
+        return f"{term}ＫＰＩ" if rng.random() < 0.5 else f" {term} "
+    if roll < 0.8:
+        return term + chr(rng.randint(0x4E00, 0x9FA5))
+    return term[:-1] if len(term) > 3 else term
+
+
+def make_kb(size: int, rng: random.Random) -> list:
+    """生成合成知識庫"""
+    categories = config.CATEGORIES
+    return [
+        KBEntry(category=rng.choice(categories), term=_random_term(rng), definition="說明")
+        for _ in range(size)
+    ]
+
+
+def make_batch(existing: list, size: int, rng: random.Random) -> list:
+    """生成新上傳的條目：一半為既有條目的變體，一半為全新條目"""
+    batch = []
+    for _ in range(size):
+        if existing and rng.random() < 0.5:
+            base = rng.choice(existing)
+            batch.append(KBEntry(category=base.category, term=_variant(base.term, rng)))
+        else:
+            batch.append(KBEntry(category=rng.choice(config.CATEGORIES),
+                                 term=_random_term(rng)))
+    return batch
+
+
+def run(sizes: list, batch_size: int, seed: int) -> None:
+    rng = random.Random(seed)
+    engine = DeduplicationEngine()
+
+    print(f"{'KB 條目':>10} {'上傳去重(ms)':>14} {'合併':>6} {'可疑':>6} {'全庫自我去重(s)':>16}")
+    for size in sizes:
+        kb = make_kb(size, rng)
+        batch = make_batch(kb, batch_size, rng)
+
+        start = time.perf_counter()
+        result = engine.deduplicate(batch, kb)
+        upload_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        engine.deduplicate(kb, [])
+        full_s = time.perf_counter() - start
+
+        print(f"{size:>10} {upload_ms:>14.1f} {len(result.merged):>6} "
+              f"{len(result.ambiguous):>6} {full_s:>16.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='本地去重引擎基準測試')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 100000])
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    run(args.sizes, args.batch, args.seed)
+
+
+if __name__ == '__main__':
+    main()
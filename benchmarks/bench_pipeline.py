@@ -0,0 +1,341 @@
+"""
+文件處理管線端對端基準測試
+
+以 corpus 產生指定大小的 .pptx / .docx（含表格、備註、群組圖形），透過 DocumentProcessor
+（解析行程池 → AI 分析 → 知識庫合併）重複處理，Gemini 使用模擬後端（GEMINI_BACKEND=fake），
+延遲可設定。每個情境在獨立的子行程執行（設定不互相影響，峰值 RSS 只包含該情境），報告：
+- 吞吐量（文件/秒）
+- 單一文件從提交到完成的 p50 / p99 延遲
+- 主行程與解析行程的峰值 RSS
+
+結果可存成 JSON（含 commit 與參數），並比較兩次結果找出退步的情境。
+其餘設定沿用環境變數，例如 WORD_PARSER_FAST_MODE=false、REDIS_HOST（使用 Redis 任務存儲）。
+
+用法：
+    python -m benchmarks.bench_pipeline [--pptx 10 100 1000] [--docx 10 100 1000] \\
+        [--docs 8] [--concurrency 4] [--latency 0.2] [--output results.json]
+    python -m benchmarks.bench_pipeline --compare base.json head.json [--threshold 10]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpus import make_docx, make_pptx  # noqa: E402
+
+RESULT_VERSION = 1
+
+_GENERATORS = {'pptx': make_pptx, 'docx': make_docx}
+
+# 比較時的指標：(欄位, 名稱, 數值越大越好)
+_COMPARED = [
+    ('throughput', '吞吐量(文件/s)', True),
+    ('latency_p50', 'p50(s)', False),
+    ('latency_p99', 'p99(s)', False),
+    ('peak_rss_mb', '峰值RSS(MB)', False),
+    ('peak_parse_rss_mb', '解析行程RSS(MB)', False),
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """線性內插的百分位數（q 為 0–100）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _max_rss_mb(who: int) -> float:
+    """峰值 RSS（Linux 以 KB 回報，macOS 以 bytes 回報）"""
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+
+def corpus_file(corpus_dir: str, kind: str, size: int, seed: int) -> str:
+    """取得合成文件，已產生過時沿用（相同參數的語料在不同 commit 間一致）"""
+    path = os.path.join(corpus_dir, f"{kind}_{size}_s{seed}.{kind}")
+    if not os.path.exists(path):
+        os.makedirs(corpus_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        started = time.perf_counter()
+        _GENERATORS[kind](tmp_path, size, seed=seed)
+        os.replace(tmp_path, path)
+        print(f"📄 產生語料 {os.path.basename(path)}（{time.perf_counter() - started:.1f}s）")
+    return path
+
+
+def run_scenario(path: str, docs: int, concurrency: int) -> Dict:
+    """
+    在目前行程中以 DocumentProcessor 處理 docs 份相同文件（子行程呼叫）
+
+    Args:
+        path: 文件路徑
+        docs: 處理份數
+        concurrency: 同時處理的文件數上限
+    """
+    # config 於匯入時讀取環境變數，須在子行程設定好環境後才匯入
+    from services import DocumentProcessor, create_task_store, shutdown_executor
+
+    task_store = create_task_store()
+    with open(path, 'rb') as f:
+        content = f.read()
+    filename = os.path.basename(path)
+
+    latencies: List[float] = []
+    task_ids: List[str] = []
+    lock = threading.Lock()
+    slots = threading.BoundedSemaphore(concurrency)
+
+    with tempfile.TemporaryDirectory() as output_folder:
+        processor = DocumentProcessor(task_store, output_folder)
+
+        def done(submitted: float) -> None:
+            with lock:
+                latencies.append(time.perf_counter() - submitted)
+            slots.release()
+
+        started = time.perf_counter()
+        for _ in range(docs):
+            slots.acquire()
+            task_id = str(uuid.uuid4())
+            task_ids.append(task_id)
+            task_store.set(task_id, {
+                'task_id': task_id,
+                'filename': filename,
+                'status': 'queued',
+                'message': '任務已加入佇列',
+                'created_at': datetime.now().isoformat()
+            })
+            submitted = time.perf_counter()
+            future = processor.process_async(
+                task_id=task_id,
+                file_path=os.path.join(output_folder, filename),
+                filename=filename,
+                api_key='benchmark',
+                content=content,
+            )
+            future.add_done_callback(lambda _f, submitted=submitted: done(submitted))
+
+        for _ in range(concurrency):
+            slots.acquire()
+        elapsed = time.perf_counter() - started
+
+        tasks = [task_store.get(task_id) or {} for task_id in task_ids]
+        shutdown_executor()
+
+    failed = [task for task in tasks if task.get('status') != 'completed']
+    return {
+        'file_bytes': len(content),
+        'docs': docs,
+        'completed': docs - len(failed),
+        'failed': len(failed),
+        'errors': sorted({task.get('error') or task.get('status', '') for task in failed}),
+        'seconds': round(elapsed, 3),
+        'throughput': round(docs / elapsed, 3),
+        'latency_p50': round(percentile(latencies, 50), 3),
+        'latency_p99': round(percentile(latencies, 99), 3),
+        'latency_mean': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+        'gemini_requests': sum((task.get('gemini') or {}).get('requests', 0) for task in tasks),
+        'peak_rss_mb': round(_max_rss_mb(resource.RUSAGE_SELF), 1),
+        # 解析行程已於 shutdown_executor 結束並回收，取其中最大者
+        'peak_parse_rss_mb': round(_max_rss_mb(resource.RUSAGE_CHILDREN), 1),
+    }
+
+
+def _scenario_env(args: argparse.Namespace) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        'GEMINI_BACKEND': 'fake',
+        'GEMINI_FAKE_LATENCY': str(args.latency),
+        'GEMINI_FAKE_ERROR_RATE': str(args.error_rate),
+        # 每次都實際呼叫（模擬）Gemini，且不受真實配額限制
+        'EXTRACTION_CACHE': 'off',
+        'GEMINI_RPM_LIMIT': str(args.rpm),
+        'GEMINI_TPM_LIMIT': str(args.rpm * 100000),
+        'PARSE_WORKERS': str(args.parse_workers),
+        'ANALYZE_WORKERS': str(args.analyze_workers),
+    })
+    if not args.verbose:
+        env.setdefault('PYTHONWARNINGS', 'ignore::FutureWarning')
+    return env
+
+
+def _spawn(args: argparse.Namespace, path: str) -> Dict:
+    """在子行程執行單一情境"""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        result_path = f.name
+    try:
+        command = [sys.executable, '-m', 'benchmarks.bench_pipeline', '--scenario', path,
+                   '--docs', str(args.docs), '--concurrency', str(args.concurrency),
+                   '--result-file', result_path]
+        completed = subprocess.run(
+            command, cwd=ROOT, env=_scenario_env(args),
+            stdout=None if args.verbose else subprocess.DEVNULL,
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"情境執行失敗（exit {completed.returncode}）: {path}")
+        with open(result_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+
+def _git_commit() -> Optional[str]:
+    """目前的 commit（工作目錄有未提交變更時加上 -dirty）"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def run(args: argparse.Namespace) -> Dict:
+    params = {
+        'docs': args.docs,
+        'concurrency': args.concurrency,
+        'latency': args.latency,
+        'error_rate': args.error_rate,
+        'rpm': args.rpm,
+        'parse_workers': args.parse_workers,
+        'analyze_workers': args.analyze_workers,
+        'seed': args.seed,
+    }
+    results = {
+        'version': RESULT_VERSION,
+        'meta': {
+            'commit': _git_commit(),
+            'created_at': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'task_store': 'redis' if os.getenv('REDIS_HOST') else 'memory',
+            'word_parser_fast_mode': os.getenv('WORD_PARSER_FAST_MODE', 'true'),
+        },
+        'params': params,
+        'scenarios': [],
+    }
+
+    print(f"{'情境':>12} {'大小(KB)':>9} {'完成':>6} {'文件/s':>8} {'p50(s)':>8} "
+          f"{'p99(s)':>8} {'Gemini':>7} {'RSS(MB)':>8} {'解析RSS':>8}")
+    for kind, sizes in (('pptx', args.pptx), ('docx', args.docx)):
+        for size in sizes:
+            path = corpus_file(args.corpus_dir, kind, size, args.seed)
+            scenario = {'name': f"{kind}-{size}", 'kind': kind, 'size': size,
+                        **_spawn(args, path)}
+            results['scenarios'].append(scenario)
+            print(f"{scenario['name']:>12} {scenario['file_bytes'] / 1024:>9.0f} "
+                  f"{scenario['completed']:>3}/{scenario['docs']:<2} {scenario['throughput']:>8.2f} "
+                  f"{scenario['latency_p50']:>8.2f} {scenario['latency_p99']:>8.2f} "
+                  f"{scenario['gemini_requests']:>7} {scenario['peak_rss_mb']:>8.0f} "
+                  f"{scenario['peak_parse_rss_mb']:>8.0f}")
+            for error in scenario['errors']:
+                print(f"    ❌ {error}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 結果已寫入 {args.output}（commit {results['meta']['commit']}）")
+    return results
+
+
+def compare(base_path: str, head_path: str, threshold: float) -> int:
+    """
+    比較兩次結果，列出各情境的變化
+
+    Returns:
+        退步超過 threshold% 的指標數
+    """
+    with open(base_path, 'r', encoding='utf-8') as f:
+        base = json.load(f)
+    with open(head_path, 'r', encoding='utf-8') as f:
+        head = json.load(f)
+
+    print(f"基準 {base['meta'].get('commit')} → 目前 {head['meta'].get('commit')}")
+    if base['params'] != head['params']:
+        print(f"⚠️ 參數不同，結果不可直接比較：{base['params']} → {head['params']}")
+
+    base_scenarios = {s['name']: s for s in base['scenarios']}
+    regressions = 0
+    print(f"{'情境':>12} {'指標':>16} {'基準':>10} {'目前':>10} {'變化':>9}")
+    for scenario in head['scenarios']:
+        before = base_scenarios.get(scenario['name'])
+        if before is None:
+            print(f"{scenario['name']:>12} （基準中沒有此情境）")
+            continue
+        for key, label, higher_is_better in _COMPARED:
+            old, new = before.get(key), scenario.get(key)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            worse = -change if higher_is_better else change
+            mark = ''
+            if worse > threshold:
+                mark = ' ❌'
+                regressions += 1
+            elif worse < -threshold:
+                mark = ' ✅'
+            print(f"{scenario['name']:>12} {label:>16} {old:>10.2f} {new:>10.2f} "
+                  f"{change:>+8.1f}%{mark}")
+        if scenario.get('failed') and not before.get('failed'):
+            print(f"{scenario['name']:>12} ❌ 失敗 {scenario['failed']} 份（基準無失敗）")
+            regressions += 1
+
+    print(f"\n{'❌' if regressions else '✅'} 退步超過 {threshold:g}% 的指標：{regressions}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='文件處理管線端對端基準測試')
+    parser.add_argument('--pptx', type=int, nargs='*', default=[10, 100, 1000],
+                        help='簡報投影片數')
+    parser.add_argument('--docx', type=int, nargs='*', default=[10, 100, 1000],
+                        help='Word 文件頁數')
+    parser.add_argument('--docs', type=int, default=8, help='每個情境處理的文件份數')
+    parser.add_argument('--concurrency', type=int, default=4, help='同時處理的文件數上限')
+    parser.add_argument('--latency', type=float, default=0.2, help='模擬 Gemini 平均延遲（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='模擬 Gemini 暫時性錯誤機率')
+    parser.add_argument('--rpm', type=int, default=100000, help='Gemini 每分鐘請求上限')
+    parser.add_argument('--parse-workers', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--analyze-workers', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--corpus-dir', default=os.path.join(tempfile.gettempdir(), 'kb-bench-corpus'),
+                        help='合成語料快取資料夾')
+    parser.add_argument('--output', help='結果 JSON 路徑')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'HEAD'), help='比較兩個結果 JSON')
+    parser.add_argument('--threshold', type=float, default=10.0, help='視為退步的變化百分比')
+    parser.add_argument('--verbose', action='store_true', help='顯示處理過程的輸出')
+    # 子行程內部使用
+    parser.add_argument('--scenario', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        result = run_scenario(args.scenario, args.docs, args.concurrency)
+        with open(args.result_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        return
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
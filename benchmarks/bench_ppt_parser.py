@@ -0,0 +1,92 @@
+"""
+PPTX 解析器基準測試
+
+比較舊版（兩次走訪投影片樹）與單次走訪解析器的耗時與峰值記憶體。
+
+用法：
+    python -m benchmarks.bench_ppt_parser [--slides 100 300 600]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pptx import Presentation  # type: ignore[import-untyped]  # noqa: E402
+
+from benchmarks.corpus import make_pptx  # noqa: E402
+from parsers import PPTParser  # noqa: E402
+
+
+def legacy_parse(path: str) -> dict:
+    """舊版解析流程：slides 與 full_text 各走訪一次，且不含群組/表格/圖表"""
+    prs = Presentation(path)
+
+    def extract_slides():
+        slides = []
+        for idx, slide in enumerate(prs.slides, 1):
+            title = slide.shapes.title.text.strip() if slide.shapes.title else ""
+            texts = [s.text.strip() for s in slide.shapes
+                     if hasattr(s, "text") and s.text.strip()]
+            notes = ""
+            if slide.has_notes_slide and slide.notes_slide.notes_text_frame:
+                notes = slide.notes_slide.notes_text_frame.text.strip()
+            slides.append({'slide_number': idx, 'title': title, 'texts': texts, 'notes': notes})
+        return slides
+
+    slides = extract_slides()
+    parts = []
+    for data in extract_slides():
+        if data['title']:
+            parts.append(f"# {data['title']}")
+        parts.extend(data['texts'])
+        if data['notes']:
+            parts.append(f"備註: {data['notes']}")
+    return {'slides': slides, 'full_text': '\n\n'.join(parts)}
+
+
+def measure(fn, path: str, repeat: int) -> tuple:
+    """回傳 (最佳耗時秒數, 峰值記憶體 MB, 結果)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(path)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1024 / 1024, result
+
+
+def run(slide_counts: list, repeat: int) -> None:
+    print(f"{'投影片':>8} {'舊版(s)':>10} {'新版(s)':>10} {'舊版峰值(MB)':>14} "
+          f"{'新版峰值(MB)':>14} {'舊版字元':>10} {'新版字元':>10}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in slide_counts:
+            path = os.path.join(tmp, f"deck_{count}.pptx")
+            make_pptx(path, count)
+
+            old_t, old_mem, old = measure(legacy_parse, path, repeat)
+            new_t, new_mem, new = measure(lambda p: PPTParser(p).parse(), path, repeat)
+
+            print(f"{count:>8} {old_t:>10.2f} {new_t:>10.2f} {old_mem:>14.1f} "
+                  f"{new_mem:>14.1f} {len(old['full_text']):>10} {len(new['full_text']):>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='PPTX 解析器基準測試')
+    parser.add_argument('--slides', type=int, nargs='+', default=[100, 300, 600])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.slides, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""
+記憶體任務存儲壓力測試
+
+測量：
+- 不同任務數下的記憶體用量（tracemalloc，每筆任務平均位元組）
+- 多執行緒同時更新狀態、讀取與分頁列表時的吞吐量
+- 超過上限時的 LRU 淘汰是否維持任務數與索引一致
+
+用法：
+    python -m benchmarks.bench_task_store [--sizes 10000 50000] [--threads 1 4 8] [--seconds 3]
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.task_store import MemoryTaskStore  # noqa: E402
+
+_STATUSES = ['queued', 'parsing', 'analyzing', 'merging', 'completed']
+
+
+def _task(task_id: str, created_at: datetime) -> dict:
+    """與 upload 路由建立的任務相同的欄位"""
+    return {
+        'task_id': task_id,
+        'filename': f'{task_id[:8]}.docx',
+        'status': 'queued',
+        'message': '等待處理...',
+        'created_at': created_at.isoformat(),
+        'mode': 'append',
+        'model': 'gemini-2.5-flash-lite',
+    }
+
+
+def fill(store: MemoryTaskStore, size: int) -> list:
+    base = datetime.now() - timedelta(hours=1)
+    task_ids = [str(uuid.uuid4()) for _ in range(size)]
+    for i, task_id in enumerate(task_ids):
+        store.set(task_id, _task(task_id, base + timedelta(milliseconds=i)))
+    return task_ids
+
+
+def measure_memory(size: int) -> float:
+    """每筆任務平均位元組"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = MemoryTaskStore(max_entries=size)
+    fill(store, size)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / size
+
+
+def measure_throughput(size: int, threads: int, seconds: float, seed: int) -> dict:
+    """writer 與 reader 各 threads 個執行緒同時運作，回傳每秒操作數"""
+    store = MemoryTaskStore(max_entries=size)
+    task_ids = fill(store, size)
+    stop = threading.Event()
+    counts = {'update': 0, 'get': 0, 'list': 0}
+    errors: list = []
+    lock = threading.Lock()
+
+    def writer(worker: int) -> None:
+        rng = random.Random(seed + worker)
+        done = 0
+        try:
+            while not stop.is_set():
+                store.update(rng.choice(task_ids), {
+                    'status': rng.choice(_STATUSES), 'message': f'進度 {done}'
+                })
+                done += 1
+        except Exception as e:
+            errors.append(e)
+        with lock:
+            counts['update'] += done
+
+    def reader(worker: int) -> None:
+        rng = random.Random(seed - worker)
+        gets = lists = 0
+        try:
+            while not stop.is_set():
+                if rng.random() < 0.9:
+                    store.get(rng.choice(task_ids))
+                    gets += 1
+                else:
+                    store.list(limit=50, status=rng.choice(_STATUSES))
+                    lists += 1
+        except Exception as e:
+            errors.append(e)
+        with lock:
+            counts['get'] += gets
+            counts['list'] += lists
+
+    workers = [threading.Thread(target=writer, args=(i,)) for i in range(threads)]
+    workers += [threading.Thread(target=reader, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in workers:
+        t.join()
+
+    if errors:
+        raise errors[0]
+    return {op: count / seconds for op, count in counts.items()}
+
+
+def check_eviction(size: int) -> None:
+    """寫入兩倍上限的任務，確認任務數與索引一致"""
+    store = MemoryTaskStore(max_entries=size)
+    fill(store, size * 2)
+    listed = 0
+    cursor = None
+    while True:
+        page, cursor = store.list(cursor=cursor, limit=200)
+        listed += len(page)
+        if not cursor:
+            break
+    status = '✅' if len(store) == size and listed == size else '❌'
+    print(f"{status} 淘汰檢查：上限 {size}，存儲 {len(store)} 筆，列表 {listed} 筆")
+    if status == '❌':
+        sys.exit(1)
+
+
+def run(sizes: list, threads: list, seconds: float, seed: int) -> None:
+    print(f"{'任務數':>10} {'每筆記憶體(bytes)':>18}")
+    for size in sizes:
+        print(f"{size:>10} {measure_memory(size):>18.0f}")
+
+    print()
+    print(f"{'任務數':>10} {'執行緒':>6} {'update/s':>12} {'get/s':>12} {'list/s':>10}")
+    for size in sizes:
+        for count in threads:
+            result = measure_throughput(size, count, seconds, seed)
+            print(f"{size:>10} {count:>6} {result['update']:>12.0f} "
+                  f"{result['get']:>12.0f} {result['list']:>10.0f}")
+
+    print()
+    check_eviction(min(sizes))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='記憶體任務存儲壓力測試')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--seconds', type=float, default=3.0)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    run(args.sizes, args.threads, args.seconds, args.seed)
+
+
+if __name__ == '__main__':
+    main()
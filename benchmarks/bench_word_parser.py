@@ -0,0 +1,86 @@
+"""
+Word 解析器基準測試與一致性檢查
+
+比較 python-docx 路徑與 XML 串流快速路徑：
+- 兩者輸出的 paragraphs / tables / headings / sections / full_text 必須一致
+- 以 MB/s（document.xml 解壓後大小）與峰值記憶體比較吞吐量
+
+涵蓋標題、合併與巢狀表格、超連結、換行與 Tab、回退路徑的一致性測試見
+tests/test_word_parser_parity.py（python -m pytest tests）
+
+用法：
+    python -m benchmarks.bench_word_parser [--pages 50 200 800]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import make_docx  # noqa: E402
+from parsers import WordParser  # noqa: E402
+
+PARITY_KEYS = ('paragraphs', 'tables', 'headings', 'sections', 'full_text')
+
+
+def check_parity(path: str) -> list:
+    """回傳兩種模式輸出不一致的欄位"""
+    slow = WordParser(path, fast=False).parse()
+    fast = WordParser(path, fast=True).parse()
+    return [key for key in PARITY_KEYS if slow[key] != fast[key]]
+
+
+def measure(path: str, fast: bool, repeat: int) -> tuple:
+    """回傳 (最佳耗時秒數, 峰值記憶體 MB)"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        WordParser(path, fast=fast).parse()
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    WordParser(path, fast=fast).parse()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak / 1024 / 1024
+
+
+def run(page_counts: list, repeat: int) -> int:
+    print(f"{'頁數':>6} {'XML(MB)':>8} {'python-docx(MB/s)':>18} {'快速(MB/s)':>11} "
+          f"{'python-docx峰值(MB)':>20} {'快速峰值(MB)':>13} {'一致':>6}")
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in page_counts:
+            path = os.path.join(tmp, f"doc_{pages}.docx")
+            make_docx(path, pages)
+            with zipfile.ZipFile(path) as archive:
+                xml_mb = archive.getinfo('word/document.xml').file_size / 1024 / 1024
+
+            mismatched = check_parity(path)
+            failures += bool(mismatched)
+
+            slow_t, slow_mem = measure(path, False, repeat)
+            fast_t, fast_mem = measure(path, True, repeat)
+
+            print(f"{pages:>6} {xml_mb:>8.2f} {xml_mb / slow_t:>18.2f} {xml_mb / fast_t:>11.2f} "
+                  f"{slow_mem:>20.1f} {fast_mem:>13.1f} "
+                  f"{'✓' if not mismatched else ','.join(mismatched):>6}")
+
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Word 解析器基準測試')
+    parser.add_argument('--pages', type=int, nargs='+', default=[50, 200, 800])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    sys.exit(1 if run(args.pages, args.repeat) else 0)
+
+
+if __name__ == '__main__':
+    main()
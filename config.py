@@ -12,6 +12,13 @@ GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 # 輸出設定
 OUTPUT_DIR = 'output'
 OUTPUT_FILENAME = 'knowledge_base.md'
+KB_STORE_FILENAME = 'knowledge_base.db'  # 結構化知識庫存儲（SQLite）
+
+# 本地去重設定
+TERM_FOLD_TABLE_PATH = os.getenv('TERM_FOLD_TABLE_PATH', '')  # 額外的繁簡對照表（JSON）
+DEDUP_SHINGLE_SIZE = 2            # 字元 n-gram 大小
+DEDUP_AUTO_MERGE_THRESHOLD = 0.8  # Jaccard 相似度 >= 此值直接合併
+DEDUP_AMBIGUOUS_THRESHOLD = 0.5   # 介於兩者之間交由 Gemini 判斷
 
 # 分類設定
 CATEGORIES = [
@@ -46,3 +53,108 @@ CATEGORIES = [
 GEMINI_MODEL = 'gemini-2.5-flash-lite'
 GEMINI_TEMPERATURE = 0.7
 GEMINI_MAX_TOKENS = 8000
+GEMINI_CLIENT_IDLE_SECONDS = int(os.getenv('GEMINI_CLIENT_IDLE_SECONDS', '1800'))  # 客戶端池中 Key 閒置多久後釋放
+GEMINI_HTTP_TIMEOUT = float(os.getenv('GEMINI_HTTP_TIMEOUT', '300'))  # 單次 Gemini 請求的 HTTP 逾時（秒）
+
+# Gemini 請求排程（每個 API Key + 模型各自計算）
+GEMINI_RPM_LIMIT = int(os.getenv('GEMINI_RPM_LIMIT', '60'))
+GEMINI_TPM_LIMIT = int(os.getenv('GEMINI_TPM_LIMIT', '1000000'))
+GEMINI_MODEL_RATE_LIMITS: dict = {}  # 個別模型覆寫，格式 {模型名稱: (RPM, TPM)}
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '4'))  # 429 / 5xx / 逾時的重試次數
+GEMINI_RETRY_BASE_DELAY = 1.0   # 第 n 次重試隨機等待 0 ~ base * 2^n 秒
+GEMINI_RETRY_MAX_DELAY = 30.0
+GEMINI_PRIORITY_AGING = 2000    # 排隊每 1 秒相當於文件少 N 個 token，避免大文件餓死
+GEMINI_LIMITER_IDLE_SECONDS = int(os.getenv('GEMINI_LIMITER_IDLE_SECONDS', '600'))  # 閒置超過此秒數的 (Key, 模型) 額度狀態即移除
+
+# 模擬後端（GEMINI_BACKEND=fake，測試與效能基準用，不呼叫真實 API）
+GEMINI_BACKEND = os.getenv('GEMINI_BACKEND', 'live')  # live / fake
+GEMINI_FAKE_LATENCY = float(os.getenv('GEMINI_FAKE_LATENCY', '0.5'))        # 平均回應秒數
+GEMINI_FAKE_ERROR_RATE = float(os.getenv('GEMINI_FAKE_ERROR_RATE', '0'))    # 暫時性錯誤機率
+
+# 文件解析
+WORD_PARSER_FAST_MODE = os.getenv('WORD_PARSER_FAST_MODE', 'true').lower() == 'true'  # docx XML 串流解析
+
+# 處理管線（解析行程池 → 有界佇列 → AI 分析執行緒池）
+PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', str(min(4, os.cpu_count() or 1))))  # 0 = 不使用行程池
+ANALYZE_WORKERS = int(os.getenv('ANALYZE_WORKERS', '4'))
+STAGE_QUEUE_SIZE = int(os.getenv('STAGE_QUEUE_SIZE', str(ANALYZE_WORKERS * 2)))
+
+# 公平排程（管線依租戶排隊：使用者自己的 API Key，共用伺服器 Key 時為來源 IP）
+FAIR_ESTIMATED_CHARS = int(os.getenv('FAIR_ESTIMATED_CHARS', '20000'))  # 解析前預扣的處理量，解析後依實際字元數補扣或退還
+FAIR_AGING = int(os.getenv('FAIR_AGING', '2000'))            # 等待 AI 分析每 1 秒相當於文件少 N 個字元，避免大文件餓死
+FAIR_BATCH_WEIGHT = float(os.getenv('FAIR_BATCH_WEIGHT', '0.5'))  # 批次上傳的權重，小於 1 時互動上傳優先
+# 個別租戶權重，格式 "ip:10.0.0.5=2,key:<API Key SHA-256 前 12 碼>=4"
+FAIR_TENANT_WEIGHTS = {
+    tenant.strip(): float(weight)
+    for tenant, _, weight in (
+        item.rpartition('=') for item in os.getenv('FAIR_TENANT_WEIGHTS', '').split(',') if '=' in item
+    )
+}
+
+# 反向代理（Render 等平台為 1）：信任 X-Forwarded-For 等標頭的層數，用於取得真實來源 IP（速率限制與公平排程）
+TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+
+# 持久化工作佇列（設定後 Web 只入列，由 python -m services.worker 處理）
+JOB_QUEUE_BACKEND = os.getenv('JOB_QUEUE', '')  # redis / sqlite，空字串表示由 Web 行程直接處理
+JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', os.path.join(OUTPUT_DIR, 'jobs.db'))
+JOB_LEASE_SECONDS = int(os.getenv('JOB_LEASE_SECONDS', '300'))  # worker 每 1/3 租期續租一次
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+# 使用者自己的 API Key 入列前以此密鑰加密（需安裝 cryptography，Web 與 worker 須設定相同的值）；
+# 伺服器的 GEMINI_API_KEY 不放入佇列，由 worker 使用自己的環境變數
+JOB_QUEUE_SECRET = os.getenv('JOB_QUEUE_SECRET', '')
+
+# 知識庫寫入（寫入鎖 + 版本號，鎖外去重、鎖內確認版本，衝突時以新版本重新去重）
+KB_LOCK_BACKEND = os.getenv('KB_LOCK', 'auto')  # auto（有 REDIS_HOST 用 Redis）/ file / redis
+KB_LOCK_TIMEOUT = float(os.getenv('KB_LOCK_TIMEOUT', '60'))  # 等待寫入鎖的秒數上限
+KB_LOCK_TTL = 120           # Redis 鎖自動過期秒數（持有者當機時）
+KB_MERGE_MAX_RETRIES = 3    # 版本衝突且出現新的可疑配對時，重新詢問 Gemini 的次數上限
+SNAPSHOT_DIR = 'snapshots'  # 各版本快照（內容定址區塊），位於輸出資料夾下
+SNAPSHOT_RETENTION = int(os.getenv('SNAPSHOT_RETENTION', '500'))  # 保留的版本數，0 表示全部保留
+SNAPSHOT_PRUNE_GRACE = int(os.getenv('SNAPSHOT_PRUNE_GRACE', '600'))  # 版本過期後延後多少秒才刪除其區塊（進行中的下載仍可讀取）
+
+# 批次上傳（多檔或 zip，所有檔案提取完成後一次合併）
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', '100'))  # 單一批次的檔案數上限（含 zip 內檔案）
+BATCH_MAX_UNCOMPRESSED_BYTES = int(os.getenv('BATCH_MAX_UNCOMPRESSED_BYTES', str(500 * 1024 * 1024)))  # zip 解壓後總大小上限
+UPLOAD_MAX_FILE_BYTES = int(os.getenv('UPLOAD_MAX_FILE_BYTES', str(50 * 1024 * 1024)))  # 單一上傳檔案大小上限
+BATCH_MAX_REQUEST_BYTES = int(os.getenv('BATCH_MAX_REQUEST_BYTES', str(500 * 1024 * 1024)))  # 批次上傳單次請求大小上限（單一 zip 檔亦依此上限）
+UPLOAD_SPOOL_THRESHOLD = int(os.getenv('UPLOAD_SPOOL_THRESHOLD', str(10 * 1024 * 1024)))  # 上傳內容超過此大小才轉存暫存檔
+UPLOAD_ORPHAN_MAX_AGE = int(os.getenv('UPLOAD_ORPHAN_MAX_AGE', '3600'))  # 啟動時清除 uploads/ 中超過此秒數的遺留檔案（非佇列模式，其他行程仍在使用時不清除）
+
+# 任務存儲
+TASK_TTL = int(os.getenv('TASK_TTL', '86400'))  # 最後一次更新後保留的秒數（Redis 與記憶體存儲相同）
+TASK_STORE_MAX_ENTRIES = int(os.getenv('TASK_STORE_MAX_ENTRIES', '10000'))  # 記憶體存儲上限，超過時淘汰最久未更新者
+
+# 任務狀態串流（SSE）
+STATUS_STREAM_KEEPALIVE = 15   # 無變更時送出 keep-alive 的間隔（秒）
+STATUS_STREAM_MAX_SECONDS = 600  # 單一連線上限，逾時由瀏覽器自動重連
+
+# 非同步串流分析（區塊在背景事件迴圈並行分析，不佔用執行緒）
+GEMINI_ASYNC = os.getenv('GEMINI_ASYNC', 'true').lower() == 'true'
+PARTIAL_CONTENT_INTERVAL = 1.0      # 分析中預覽內容寫回任務的最短間隔（秒）
+PARTIAL_CONTENT_MAX_CHARS = 10000   # 分析中預覽內容上限（與預覽 API 相同）
+
+# 大型文件分塊提取
+CHUNK_MAX_CHARS = int(os.getenv('CHUNK_MAX_CHARS', '12000'))             # 未指定 token 預算時每個區塊的字元上限
+EXTRACT_TOKEN_BUDGET = int(os.getenv('EXTRACT_TOKEN_BUDGET', '12000'))   # 每個提取請求的輸入 token 上限（指令 + 內容）
+TOKEN_COUNT_MODE = os.getenv('TOKEN_COUNT_MODE', 'local')  # local：本地估算並依實際用量校正；api：另以 count_tokens 確認
+EXTRACT_MAX_CONCURRENCY = int(os.getenv('EXTRACT_MAX_CONCURRENCY', '4'))  # 單一任務同時分析的區塊數
+
+# 增量重新匯入（同一文件再次上傳時只提取變更或新增的投影片/章節，移除已刪除部分獨有的條目）
+# 預設關閉：文件以原始檔名（或 document 欄位）比對，同名的不同文件會被視為同一文件的新版本
+INCREMENTAL_INGEST = os.getenv('INCREMENTAL_INGEST', 'false').lower() == 'true'
+
+# 提取結果快取
+EXTRACT_PROMPT_VERSION = '1'  # 修改 extract_phrases 的 Prompt 時遞增，使舊快取失效
+EXTRACTION_CACHE_BACKEND = os.getenv('EXTRACTION_CACHE', 'auto')  # auto / disk / redis / off
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv('EXTRACTION_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv('EXTRACTION_CACHE_MAX_ENTRIES', '20000'))
+EXTRACTION_CACHE_TTL = int(os.getenv('EXTRACTION_CACHE_TTL', str(30 * 86400)))
+
+# 執行指標（/metrics）
+METRICS_BACKEND = os.getenv('METRICS', 'auto')  # auto（已安裝 prometheus_client 時使用）/ prometheus / local / off
+
+# 任務追蹤（上傳時指定 trace=1 / profile 或 X-Trace 標頭）
+TRACE_MAX_EVENTS = int(os.getenv('TRACE_MAX_EVENTS', '20000'))   # 單一任務記錄的 span 數上限
+TRACE_MAX_SAMPLES = int(os.getenv('TRACE_MAX_SAMPLES', '20000'))  # 單一任務的堆疊取樣數上限（profile 模式）
+TRACE_PROFILE_INTERVAL = float(os.getenv('TRACE_PROFILE_INTERVAL', '0.005'))  # 堆疊取樣間隔（秒）
+TRACE_DIR = 'traces'  # 追蹤紀錄檔（不放入任務，任務只記錄路徑），位於輸出資料夾下，超過 TASK_TTL 的檔案自動清除
@@ -1,7 +1,30 @@
 """
 知識庫管理模組
 """
-from .merger import KnowledgeBaseMerger
+from .merger import KnowledgeBaseMerger, DeduplicationEngine, DeduplicationResult, DedupIndex
 from .dify_formatter import DifyFormatter
+from .store import KnowledgeBaseStore, KBEntry, DocumentRevision, unit_fingerprint
+from .normalizer import TermNormalizer
+from .lock import KBLock, FileLock, RedisLock, create_kb_lock
+from .snapshots import SnapshotStore
+from .writer import KnowledgeBaseWriter, MergeResult
 
-__all__ = ['KnowledgeBaseMerger', 'DifyFormatter']
+__all__ = [
+    'KnowledgeBaseMerger',
+    'DeduplicationEngine',
+    'DeduplicationResult',
+    'DedupIndex',
+    'DifyFormatter',
+    'KnowledgeBaseStore',
+    'KBEntry',
+    'DocumentRevision',
+    'unit_fingerprint',
+    'TermNormalizer',
+    'KBLock',
+    'FileLock',
+    'RedisLock',
+    'create_kb_lock',
+    'SnapshotStore',
+    'KnowledgeBaseWriter',
+    'MergeResult',
+]
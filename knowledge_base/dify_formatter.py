@@ -1,6 +1,21 @@
 """
 Dify 格式化器
 """
+import re
+from typing import List
+
+import config
+from .store import KBEntry
+
+# 條目欄位標籤對應
+_FIELD_LABELS = {
+    '內容': 'term',
+    '定義/說明': 'definition',
+    '使用場景': 'scenario',
+    '範例': 'example',
+}
+_FIELD_PATTERN = re.compile(r'^\s*[-*]?\s*\*\*(內容|定義/說明|使用場景|範例)\*\*\s*[：:]\s*(.*)$')
+_HEADING_NUMBER_PATTERN = re.compile(r'^(術語/話術|話術|術語)\s*\d+\s*[：:]?\s*')
 
 
 class DifyFormatter:
@@ -83,3 +98,98 @@ A: {definition}
             index += f"{i}. [{category}](#{category})\n"
 
         return index + "\n---\n\n"
+
+    @staticmethod
+    def parse_entries(content: str) -> List[KBEntry]:
+        """
+        將 AI 輸出的 Markdown 解析為結構化條目
+
+        Args:
+            content: 依 extract_phrases 格式輸出的 Markdown
+
+        Returns:
+            條目列表（無法辨識類別的條目會被略過）
+        """
+        entries: List[KBEntry] = []
+        category = ""
+        current: dict | None = None
+        last_field = ""
+
+        def flush():
+            if current and category:
+                term = current.get('term') or current.get('heading', '')
+                if term.strip():
+                    entries.append(KBEntry(
+                        category=category,
+                        term=term.strip(),
+                        definition=current.get('definition', '').strip(),
+                        scenario=current.get('scenario', '').strip(),
+                        example=current.get('example', '').strip(),
+                    ))
+
+        for line in content.split('\n'):
+            stripped = line.strip()
+
+            if stripped.startswith('#### '):
+                flush()
+                heading = _HEADING_NUMBER_PATTERN.sub('', stripped[5:].strip())
+                current = {'heading': heading}
+                last_field = ""
+            elif stripped.startswith('### ') or stripped.startswith('## '):
+                flush()
+                current = None
+                name = stripped.lstrip('#').strip().strip('[]').strip()
+                # 只接受分類標題，其他二級標題（如目錄）重置類別
+                if stripped.startswith('### ') or name in config.CATEGORIES:
+                    category = name
+                else:
+                    category = ""
+            elif current is not None:
+                match = _FIELD_PATTERN.match(line)
+                if match:
+                    last_field = _FIELD_LABELS[match.group(1)]
+                    current[last_field] = match.group(2).strip()
+                elif stripped == '---':
+                    last_field = ""
+                elif stripped and last_field and last_field != 'term':
+                    # 多行說明接續到上一個欄位
+                    current[last_field] = f"{current[last_field]}\n{stripped}"
+
+        flush()
+        return entries
+
+    @staticmethod
+    def render_entries(entries: List[KBEntry]) -> str:
+        """
+        將結構化條目渲染為 Markdown（格式與 parse_entries 互逆）
+
+        Args:
+            entries: 條目列表
+
+        Returns:
+            依分類分組的 Markdown 內容
+        """
+        grouped: dict[str, List[KBEntry]] = {}
+        for entry in entries:
+            grouped.setdefault(entry.category, []).append(entry)
+
+        # 依設定檔的分類順序排列，未知分類排在最後
+        order = {cat: i for i, cat in enumerate(config.CATEGORIES)}
+        categories = sorted(grouped, key=lambda c: (order.get(c, len(order)), c))
+
+        sections = [DifyFormatter.create_index(categories).rstrip('\n')]
+        for category in categories:
+            lines = [f"### {category}", ""]
+            for entry in grouped[category]:
+                lines.append(f"#### {entry.term}")
+                lines.append(f"**內容**：{entry.term}")
+                if entry.definition:
+                    lines.append(f"**定義/說明**：{entry.definition}")
+                if entry.scenario:
+                    lines.append(f"**使用場景**：{entry.scenario}")
+                if entry.example:
+                    lines.append(f"**範例**：{entry.example}")
+                lines.extend(["", "---", ""])
+            sections.append('\n'.join(lines).rstrip('\n'))
+
+        return '\n\n'.join(sections) + '\n'
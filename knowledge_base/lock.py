@@ -0,0 +1,245 @@
+"""
+知識庫寫入鎖
+同一知識庫的寫入（upsert + 渲染 Markdown）須序列化：單機使用檔案鎖，
+多台主機共用知識庫時使用 Redis 鎖
+"""
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+import config
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+
+class KBLock(ABC):
+    """知識庫寫入鎖抽象基類（可用於 with 敘述）"""
+
+    # 等待鎖時的輪詢間隔（秒）
+    POLL_INTERVAL = 0.05
+
+    @abstractmethod
+    def acquire(self, timeout: float | None = None) -> None:
+        """
+        取得鎖
+
+        Raises:
+            TimeoutError: 超過 timeout 秒仍無法取得
+        """
+        pass
+
+    @abstractmethod
+    def release(self) -> None:
+        """釋放鎖"""
+        pass
+
+    def __enter__(self) -> 'KBLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.release()
+
+
+class FileLock(KBLock):
+    """以 flock（Windows 為 msvcrt.locking）鎖定檔案，同一主機的多行程與多執行緒皆互斥"""
+
+    def __init__(self, path: str, timeout: float | None = None):
+        """
+        Args:
+            path: 鎖檔路徑（不存在時建立）
+            timeout: 預設等待秒數，預設依 KB_LOCK_TIMEOUT
+        """
+        self.path = path
+        self.timeout = config.KB_LOCK_TIMEOUT if timeout is None else timeout
+        # 同一實例被多個執行緒共用時，先在行程內排隊
+        self._thread_lock = threading.Lock()
+        self._fd: int | None = None
+
+    def acquire(self, timeout: float | None = None) -> None:
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        if not self._thread_lock.acquire(timeout=timeout):
+            raise TimeoutError(f"等待知識庫寫入鎖逾時: {self.path}")
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while not self._try_lock(fd):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"等待知識庫寫入鎖逾時: {self.path}")
+                time.sleep(self.POLL_INTERVAL)
+        except BaseException:
+            os.close(fd)
+            self._thread_lock.release()
+            raise
+        self._fd = fd
+
+    def release(self) -> None:
+        fd, self._fd = self._fd, None
+        if fd is None:
+            return
+        try:
+            if os.name == 'nt':
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+            self._thread_lock.release()
+
+    @staticmethod
+    def _try_lock(fd: int) -> bool:
+        try:
+            if os.name == 'nt':
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+
+# 共用的 Redis 連線：(主機, 端口, 資料庫) → 客戶端（內含連線池），每次合併不必重新連線與 PING
+_redis_clients: dict = {}
+_redis_clients_lock = threading.Lock()
+
+
+def _redis_client(host: str, port: int, db: int):
+    key = (host, port, db)
+    with _redis_clients_lock:
+        client = _redis_clients.get(key)
+        if client is None:
+            import redis
+            client = redis.Redis(host=host, port=port, db=db, decode_responses=True)
+            client.ping()
+            _redis_clients[key] = client
+        return client
+
+
+class RedisLock(KBLock):
+    """
+    以 SET NX PX 實作的 Redis 鎖，持有者當機時於 ttl 後自動釋放；
+    持有期間由背景執行緒每 ttl/3 秒延長一次，合併時間超過 ttl 也不會被他人取得
+    """
+
+    # 只刪除自己持有的鎖（避免逾時後誤刪他人的鎖）
+    _RELEASE_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('DEL', KEYS[1])
+        end
+        return 0
+    """
+    # 只延長自己持有的鎖
+    _EXTEND_SCRIPT = """
+        if redis.call('GET', KEYS[1]) == ARGV[1] then
+            return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+
+    def __init__(self, name: str, host: str = 'localhost', port: int = 6379, db: int = 0,
+                 ttl: int | None = None, timeout: float | None = None):
+        """
+        Args:
+            name: 鎖名稱（同一知識庫須相同）
+            host: Redis 主機
+            port: Redis 端口
+            db: Redis 資料庫編號
+            ttl: 鎖自動過期秒數，預設依 KB_LOCK_TTL
+            timeout: 預設等待秒數，預設依 KB_LOCK_TIMEOUT
+        """
+        try:
+            self._redis = _redis_client(host, port, db)
+        except Exception as e:
+            raise ConnectionError(f"無法連接 Redis: {e}")
+
+        self._key = f"kblock:{name}"
+        self._release = self._redis.register_script(self._RELEASE_SCRIPT)
+        self._extend = self._redis.register_script(self._EXTEND_SCRIPT)
+        self.ttl = ttl or config.KB_LOCK_TTL
+        self.timeout = config.KB_LOCK_TIMEOUT if timeout is None else timeout
+        self._thread_lock = threading.Lock()
+        self._token: str | None = None
+        self._renewer: threading.Thread | None = None
+        self._released = threading.Event()
+
+    def acquire(self, timeout: float | None = None) -> None:
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        if not self._thread_lock.acquire(timeout=timeout):
+            raise TimeoutError(f"等待知識庫寫入鎖逾時: {self._key}")
+
+        token = uuid.uuid4().hex
+        try:
+            while not self._redis.set(self._key, token, nx=True, px=int(self.ttl * 1000)):
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"等待知識庫寫入鎖逾時: {self._key}")
+                time.sleep(self.POLL_INTERVAL)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._token = token
+        self._released = threading.Event()
+        self._renewer = threading.Thread(target=self._renew, args=(token, self._released),
+                                         daemon=True, name='kb-lock-renew')
+        self._renewer.start()
+
+    def release(self) -> None:
+        token, self._token = self._token, None
+        if token is None:
+            return
+        self._released.set()
+        renewer, self._renewer = self._renewer, None
+        try:
+            if renewer is not None:
+                renewer.join()
+            self._release(keys=[self._key], args=[token])
+        finally:
+            self._thread_lock.release()
+
+    def _renew(self, token: str, released: threading.Event) -> None:
+        """持有期間定期延長鎖的過期時間，直到 release"""
+        while not released.wait(self.ttl / 3):
+            try:
+                if not self._extend(keys=[self._key], args=[token, int(self.ttl * 1000)]):
+                    print(f"⚠️ 知識庫寫入鎖已失效（已過期或被其他持有者取得）: {self._key}")
+                    return
+            except Exception as e:
+                print(f"⚠️ 延長知識庫寫入鎖失敗: {e}")
+
+
+def create_kb_lock(output_folder: str) -> KBLock:
+    """
+    根據環境變數建立知識庫寫入鎖
+
+    環境變數:
+        KB_LOCK: file / redis（預設 auto：有 REDIS_HOST 用 Redis，否則檔案鎖）
+        REDIS_HOST / REDIS_PORT / REDIS_DB: Redis 連線設定
+
+    Args:
+        output_folder: 知識庫所在資料夾（檔案鎖建立於此，Redis 鎖以其絕對路徑命名）
+    """
+    backend = config.KB_LOCK_BACKEND
+    redis_host = os.getenv('REDIS_HOST')
+    if backend == 'redis' or (backend == 'auto' and redis_host):
+        try:
+            return RedisLock(
+                os.path.abspath(output_folder),
+                host=redis_host or 'localhost',
+                port=int(os.getenv('REDIS_PORT', '6379')),
+                db=int(os.getenv('REDIS_DB', '0'))
+            )
+        except ConnectionError as e:
+            print(f"警告: Redis 連接失敗，回退到檔案鎖: {e}")
+
+    return FileLock(os.path.join(output_folder, 'knowledge_base.lock'))
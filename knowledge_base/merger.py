@@ -1,8 +1,55 @@
 """
-知識庫合併器 - 支援增量更新
+知識庫合併器 - 支援增量更新與本地去重
 """
+import math
 import os
+import stat
+import tempfile
+from dataclasses import dataclass, field, replace
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+import config
+from tracing import traced
+from .normalizer import TermNormalizer, get_normalizer
+from .store import KBEntry
+
+
+def _current_umask() -> int:
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# 行程的 umask（匯入時讀取一次，避免寫入時暫改 umask 影響其他執行緒）
+_UMASK = _current_umask()
+
+
+def atomic_write(path: str, content: str) -> None:
+    """
+    寫入暫存檔後以 os.replace 取代，讀取端只會看到完整的舊檔或新檔
+
+    mkstemp 建立的暫存檔權限為 0600，取代前改為原檔的權限（新檔依 umask，通常為 0644），
+    其他帳號執行的服務（例如提供知識庫下載的 Web 伺服器）仍可讀取
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_UMASK
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 
 class KnowledgeBaseMerger:
@@ -18,17 +65,22 @@ class KnowledgeBaseMerger:
                 return f.read()
         return ""
 
-    def save(self, content: str, source_file: str):
+    @traced('KnowledgeBaseMerger.save', cat='kb')
+    def save(self, content: str, source_file: str, version: Optional[int] = None) -> str:
         """
-        儲存知識庫
+        儲存知識庫（原子替換）
 
         Args:
             content: 知識庫內容
             source_file: 來源文件名稱
+            version: 知識庫版本號（寫入標頭）
+
+        Returns:
+            實際寫入的內容（含標頭）
         """
         # 添加更新日誌
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        header = self._generate_header(source_file, timestamp)
+        header = self._generate_header(source_file, timestamp, version)
 
         # 檢查內容是否已有 header
         if not content.startswith('# '):
@@ -36,42 +88,19 @@ class KnowledgeBaseMerger:
         else:
             final_content = content
 
-        # 確保輸出目錄存在
-        os.makedirs(os.path.dirname(self.output_path), exist_ok=True)
-
-        with open(self.output_path, 'w', encoding='utf-8') as f:
-            f.write(final_content)
+        atomic_write(self.output_path, final_content)
 
         print(f"✅ 知識庫已儲存至: {self.output_path}")
+        return final_content
 
-    def append_update_log(self, source_file: str):
-        """在知識庫中追加更新紀錄"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        if os.path.exists(self.output_path):
-            with open(self.output_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # 在文件開頭添加更新紀錄
-            log_entry = f"\n> 📝 更新時間: {timestamp} | 來源: {source_file}\n"
-
-            # 找到 metadata 區域並插入
-            if '---' in content:
-                parts = content.split('---', 2)
-                if len(parts) >= 2:
-                    content = f"{parts[0]}---{parts[1]}---{log_entry}{parts[2]}"
-            else:
-                content = log_entry + content
-
-            with open(self.output_path, 'w', encoding='utf-8') as f:
-                f.write(content)
-
-    def _generate_header(self, source_file: str, timestamp: str) -> str:
+    def _generate_header(self, source_file: str, timestamp: str,
+                         version: Optional[int] = None) -> str:
         """生成知識庫標頭"""
+        version_line = f"\n  version: {version}" if version is not None else ""
         header = f"""---
 metadata:
   title: 專案知識庫
-  last_updated: {timestamp}
+  last_updated: {timestamp}{version_line}
   source: {source_file}
   format: Dify Knowledge Base (Markdown)
 ---
@@ -86,3 +115,221 @@ metadata:
 ---
 """
         return header
+
+
+@dataclass
+class DeduplicationResult:
+    """本地去重結果"""
+    # 無重複的新條目（直接寫入）
+    unique: List[KBEntry] = field(default_factory=list)
+    # 已在本地判定重複的條目，術語已改寫為既有的標準術語
+    merged: List[KBEntry] = field(default_factory=list)
+    # 需要 Gemini 判斷的可疑配對：(新條目, 候選既有條目, 相似度)
+    ambiguous: List[Tuple[KBEntry, KBEntry, float]] = field(default_factory=list)
+
+    def resolve(self, verdicts: Optional[List[bool]] = None) -> List[KBEntry]:
+        """
+        套用 Gemini 對可疑配對的判斷，回傳最終要寫入的條目
+
+        Args:
+            verdicts: 與 ambiguous 對應的判斷結果（True 表示為同一術語），
+                      未提供時全部視為不同術語
+
+        Returns:
+            要 upsert 的條目列表
+        """
+        verdicts = verdicts or []
+        resolved = [*self.unique, *self.merged]
+        for i, (entry, candidate, _score) in enumerate(self.ambiguous):
+            same = i < len(verdicts) and verdicts[i]
+            resolved.append(replace(entry, term=candidate.term) if same else entry)
+        return resolved
+
+
+class DedupIndex:
+    """
+    去重用的條目索引：(類別, 正規化術語) → 標準條目，以及字元 shingle 的倒排索引
+    既有條目的索引可重複使用（KnowledgeBaseWriter 依存儲版本快取），去重時新增的條目另建索引
+    """
+
+    def __init__(self, frequency: Optional[Dict[str, int]] = None):
+        self.canonical: Dict[Tuple[str, str], KBEntry] = {}
+        self.owners: List[KBEntry] = []
+        self.shingles: List[frozenset] = []
+        self.postings: Dict[Tuple[str, str], List[int]] = {}
+        # 全域 shingle 頻率（prefix filtering 的排序依據），共用同一頻率的索引間可互相查詢
+        self.frequency: Dict[str, int] = {} if frequency is None else frequency
+
+    def __len__(self) -> int:
+        return len(self.owners)
+
+
+class DeduplicationEngine:
+    """
+    本地確定性去重引擎
+
+    1. 正規化後以雜湊比對完全重複
+    2. 以字元 n-gram shingle 的倒排索引（prefix filtering）找出近似重複
+    3. 相似度介於門檻之間的配對才交由 Gemini 判斷
+    """
+
+    def __init__(self, normalizer: Optional[TermNormalizer] = None,
+                 shingle_size: Optional[int] = None,
+                 auto_threshold: Optional[float] = None,
+                 ambiguous_threshold: Optional[float] = None):
+        self.normalizer = normalizer or get_normalizer()
+        self.shingle_size = config.DEDUP_SHINGLE_SIZE if shingle_size is None else shingle_size
+        self.auto_threshold = (config.DEDUP_AUTO_MERGE_THRESHOLD
+                               if auto_threshold is None else auto_threshold)
+        self.ambiguous_threshold = (config.DEDUP_AMBIGUOUS_THRESHOLD
+                                    if ambiguous_threshold is None else ambiguous_threshold)
+
+    @traced('DeduplicationEngine.build_index', cat='kb')
+    def build_index(self, entries: List[KBEntry],
+                    queries: Optional[List[KBEntry]] = None) -> DedupIndex:
+        """
+        建立既有條目的索引
+
+        Args:
+            entries: 既有條目
+            queries: 僅供這批新條目查詢時提供：只索引其類別，其 shingle 亦計入頻率；
+                     未提供時索引所有類別（可供之後任意條目重複使用）
+
+        Returns:
+            DedupIndex
+        """
+        categories = {entry.category for entry in queries} if queries is not None else None
+        pending = []
+        seen = set()
+        for entry in entries:
+            if categories is not None and entry.category not in categories:
+                continue
+            key = self.normalizer.normalize(entry.term)
+            if (entry.category, key) not in seen:
+                seen.add((entry.category, key))
+                pending.append((entry, key, frozenset(self._shingles(key))))
+
+        # 依全域 shingle 頻率排序（罕見的在前），prefix filtering 需要一致的順序
+        index = DedupIndex()
+        for _entry, _key, tokens in pending:
+            for token in tokens:
+                index.frequency[token] = index.frequency.get(token, 0) + 1
+        for entry in queries or ():
+            for token in set(self._shingles(self.normalizer.normalize(entry.term))):
+                index.frequency[token] = index.frequency.get(token, 0) + 1
+
+        for entry, key, tokens in pending:
+            self._add(index, entry, key, tokens)
+        return index
+
+    def extend(self, index: DedupIndex, entries: List[KBEntry]) -> None:
+        """
+        將寫入知識庫的條目加入既有索引（已有的標準術語略過），寫入後不必重建整個索引
+
+        不更新 shingle 頻率，新的 token 視為最罕見，與查詢時的排序仍一致
+        """
+        for entry in entries:
+            key = self.normalizer.normalize(entry.term)
+            if key and (entry.category, key) not in index.canonical:
+                self._add(index, entry, key, frozenset(self._shingles(key)))
+
+    @traced('DeduplicationEngine.deduplicate', cat='kb')
+    def deduplicate(self, new_entries: List[KBEntry],
+                    existing: Union[List[KBEntry], DedupIndex]) -> DeduplicationResult:
+        """
+        將新條目與既有條目（及彼此）去重
+
+        Args:
+            new_entries: 新提煉的條目
+            existing: 知識庫中既有的條目，或以 build_index 預先建立的索引（不會被修改）
+
+        Returns:
+            DeduplicationResult
+        """
+        result = DeduplicationResult()
+        base = existing if isinstance(existing, DedupIndex) else \
+            self.build_index(existing, queries=new_entries)
+        # 本次新增的標準條目另建索引，與既有索引共用頻率以維持一致的排序
+        added = DedupIndex(base.frequency)
+
+        for entry in new_entries:
+            key = self.normalizer.normalize(entry.term)
+            if not key:
+                result.unique.append(entry)
+                continue
+
+            # 完全重複（正規化後雜湊相同）
+            target = base.canonical.get((entry.category, key)) or \
+                added.canonical.get((entry.category, key))
+            if target is not None:
+                result.merged.append(replace(entry, term=target.term))
+                continue
+
+            tokens = frozenset(self._shingles(key))
+            best, best_score = self._best_match(base, entry.category, tokens)
+            other, other_score = self._best_match(added, entry.category, tokens)
+            if other_score > best_score:
+                best, best_score = other, other_score
+
+            if best is not None and best_score >= self.auto_threshold:
+                result.merged.append(replace(entry, term=best.term))
+            elif best is not None and best_score >= self.ambiguous_threshold:
+                result.ambiguous.append((entry, best, best_score))
+            else:
+                result.unique.append(entry)
+                self._add(added, entry, key, tokens)
+
+        return result
+
+    def _add(self, index: DedupIndex, entry: KBEntry, key: str, tokens: frozenset) -> None:
+        """將標準條目加入索引（只索引 prefix token）"""
+        record_id = len(index.owners)
+        index.canonical[(entry.category, key)] = entry
+        index.owners.append(entry)
+        index.shingles.append(tokens)
+        for token in self._prefix(tokens, index.frequency):
+            index.postings.setdefault((entry.category, token), []).append(record_id)
+
+    def _shingles(self, key: str) -> List[str]:
+        """字元 n-gram（短於 n 的字串以整串為單一 shingle）"""
+        n = self.shingle_size
+        if len(key) <= n:
+            return [key] if key else []
+        return [key[i:i + n] for i in range(len(key) - n + 1)]
+
+    def _prefix(self, tokens: frozenset, frequency: Dict[str, int]) -> List[str]:
+        """
+        取 prefix filtering 的前綴 token
+
+        兩集合 Jaccard >= t 時，依全域順序排序後的前 |s| - ceil(t*|s|) + 1 個
+        token 必有交集，因此只需索引前綴
+        """
+        ordered = sorted(tokens, key=lambda t: (frequency.get(t, 0), t))
+        size = len(ordered)
+        prefix_len = size - math.ceil(self.ambiguous_threshold * size) + 1
+        return ordered[:max(prefix_len, 1)]
+
+    def _best_match(self, index: DedupIndex, category: str,
+                    tokens: frozenset) -> Tuple[Optional[KBEntry], float]:
+        """找出索引中同類別且 Jaccard 相似度最高的候選"""
+        best_id: Optional[int] = None
+        best_score = 0.0
+        seen = set()
+
+        for token in self._prefix(tokens, index.frequency):
+            for record_id in index.postings.get((category, token), ()):
+                if record_id in seen:
+                    continue
+                seen.add(record_id)
+
+                other = index.shingles[record_id]
+                # 長度過濾：大小差距過大不可能達到門檻
+                if min(len(tokens), len(other)) < self.ambiguous_threshold * max(len(tokens), len(other)):
+                    continue
+
+                intersection = len(tokens & other)
+                score = intersection / (len(tokens) + len(other) - intersection)
+                if score > best_score:
+                    best_id, best_score = record_id, score
+
+        return (index.owners[best_id] if best_id is not None else None), best_score
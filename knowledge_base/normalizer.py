@@ -0,0 +1,104 @@
+"""
+術語正規化
+全形/半形折疊、大小寫折疊、繁簡折疊（可插拔對照表）
+"""
+import hashlib
+import json
+import unicodedata
+from typing import Dict, Optional
+
+import config
+
+# 正規化步驟變更時遞增，使既有知識庫的術語鍵重新計算
+NORMALIZE_VERSION = 1
+
+# 常見商業用語的繁 → 簡對照（單字），可透過 TERM_FOLD_TABLE_PATH 擴充
+DEFAULT_FOLD_TABLE: Dict[str, str] = {
+    '賦': '赋', '閉': '闭', '環': '环', '數': '数', '據': '据', '戰': '战',
+    '體': '体', '構': '构', '級': '级', '產': '产', '業': '业', '務': '务',
+    '發': '发', '開': '开', '會': '会', '議': '议', '質': '质', '國': '国',
+    '內': '内', '協': '协', '應': '应', '過': '过', '後': '后', '與': '与',
+    '為': '为', '對': '对', '實': '实', '現': '现', '資': '资', '訊': '讯',
+    '網': '网', '絡': '络', '經': '经', '濟': '济', '營': '营', '運': '运',
+    '區': '区', '標': '标', '準': '准', '點': '点', '價': '价', '鏈': '链',
+    '態': '态', '億': '亿', '萬': '万', '長': '长', '優': '优', '進': '进',
+    '設': '设', '計': '计', '劃': '划', '層': '层', '頂': '顶', '佈': '布',
+    '導': '导', '轉': '转', '場': '场', '維': '维', '齊': '齐', '聯': '联',
+    '動': '动', '復': '复', '雙': '双', '給': '给', '側': '侧', '關': '关',
+    '鍵': '键', '號': '号', '報': '报', '總': '总', '結': '结', '論': '论',
+    '問': '问', '題': '题', '風': '风', '險': '险', '戶': '户', '費': '费',
+    '銷': '销', '創': '创', '規': '规', '範': '范', '項': '项', '團': '团',
+    '隊': '队', '組': '组', '織': '织', '門': '门', '戲': '戏', '線': '线',
+    '邏': '逻', '輯': '辑', '趨': '趋', '勢': '势', '競': '竞', '爭': '争',
+    '觸': '触', '達': '达', '賽': '赛', '軌': '轨', '鬆': '松', '緊': '紧',
+    '廣': '广', '閱': '阅', '讀': '读', '說': '说', '話': '话', '術': '术',
+    '語': '语', '詞': '词', '彙': '汇', '匯': '汇', '際': '际', '處': '处',
+    '決': '决', '執': '执', '獲': '获', '頭': '头', '腦': '脑', '機': '机',
+    '製': '制', '電': '电', '車': '车', '貨': '货', '幣': '币', '銀': '银',
+    '證': '证', '買': '买', '賣': '卖', '貿': '贸',
+}
+
+
+def load_fold_table(path: Optional[str] = None) -> Dict[str, str]:
+    """
+    載入折疊對照表
+
+    Args:
+        path: 額外的 JSON 對照表路徑（{"繁": "简"}），未指定時讀取設定
+
+    Returns:
+        合併後的對照表
+    """
+    table = dict(DEFAULT_FOLD_TABLE)
+    path = path if path is not None else config.TERM_FOLD_TABLE_PATH
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            table.update(json.load(f))
+    return table
+
+
+class TermNormalizer:
+    """將術語正規化為比對用的鍵"""
+
+    def __init__(self, fold_table: Optional[Dict[str, str]] = None):
+        table = fold_table if fold_table is not None else load_fold_table()
+        # 正規化方式的識別（步驟版本 + 對照表），存儲據此判斷術語鍵是否需要重算
+        self.signature = hashlib.sha256(json.dumps(
+            [NORMALIZE_VERSION, sorted(table.items())], ensure_ascii=False
+        ).encode('utf-8')).hexdigest()[:16]
+        # 單字使用 str.translate，多字詞條依長度由長到短取代
+        self._char_table = str.maketrans({k: v for k, v in table.items() if len(k) == 1})
+        self._phrases = sorted(
+            ((k, v) for k, v in table.items() if len(k) > 1),
+            key=lambda item: len(item[0]), reverse=True
+        )
+
+    def normalize(self, term: str) -> str:
+        """
+        正規化術語
+
+        Args:
+            term: 原始術語
+
+        Returns:
+            NFKC + casefold + 繁簡折疊後、去除標點與空白的字串
+        """
+        text = unicodedata.normalize('NFKC', term).casefold()
+        for source, target in self._phrases:
+            text = text.replace(source, target)
+        text = text.translate(self._char_table)
+        return ''.join(
+            ch for ch in text
+            if unicodedata.category(ch)[0] not in ('P', 'Z', 'C')
+        )
+
+
+_default_normalizer: Optional[TermNormalizer] = None
+
+
+def get_normalizer() -> TermNormalizer:
+    """取得共用的預設正規化器"""
+    global _default_normalizer
+    if _default_normalizer is None:
+        _default_normalizer = TermNormalizer()
+    return _default_normalizer
@@ -0,0 +1,249 @@
+"""
+知識庫版本快照
+每個版本的 Markdown 依內容切成區塊（以行為單位、由內容決定邊界），區塊以 SHA-256 定址
+且只存一份；版本清單（manifest）只記錄區塊雜湊。相鄰版本通常只有標頭與新增條目附近的
+區塊不同，其餘區塊共用，保留大量版本也只佔少量空間
+"""
+import hashlib
+import json
+import os
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+import config
+from .merger import atomic_write
+
+
+class SnapshotStore:
+    """內容定址的知識庫版本快照"""
+
+    # 區塊大小範圍（位元組），邊界只落在行尾
+    MIN_CHUNK = 1024
+    MAX_CHUNK = 16 * 1024
+    # 行雜湊低位元為 0 時切分（平均約每 16 行一個邊界）
+    BOUNDARY_MASK = 0x0F
+    # 版本數超過保留數的此比例後才清除（分攤讀取保留版本清單的成本）
+    PRUNE_SLACK = 0.1
+    # 過期版本清單的副檔名（已不提供下載，區塊待寬限期過後刪除）
+    EXPIRED_SUFFIX = '.json.expired'
+
+    def __init__(self, root: str, retention: Optional[int] = None,
+                 grace: Optional[float] = None):
+        """
+        Args:
+            root: 快照資料夾
+            retention: 保留的版本數，超過時刪除最舊的版本與不再被引用的區塊，
+                       預設依 SNAPSHOT_RETENTION（0 表示不刪除）
+            grace: 版本過期後延後刪除區塊的秒數，預設依 SNAPSHOT_PRUNE_GRACE
+        """
+        self.root = root
+        self.retention = config.SNAPSHOT_RETENTION if retention is None else retention
+        self.grace = config.SNAPSHOT_PRUNE_GRACE if grace is None else grace
+        self._objects = os.path.join(root, 'objects')
+        self._manifests = os.path.join(root, 'manifests')
+
+    def save(self, version: int, content: str) -> Dict[str, Any]:
+        """
+        保存版本快照（已存在的區塊不重複寫入）
+
+        Args:
+            version: 知識庫版本號（同一版本號只應保存一次）
+            content: 該版本的完整 Markdown
+
+        Returns:
+            版本清單
+        """
+        data = content.encode('utf-8')
+        chunks = self.split(data)
+        digests = []
+        for chunk in chunks:
+            digest = hashlib.sha256(chunk).hexdigest()
+            self._write_object(digest, chunk)
+            digests.append(digest)
+
+        manifest = {
+            'version': version,
+            'size': len(data),
+            'sha256': hashlib.sha256(data).hexdigest(),
+            'chunks': digests,
+            'created_at': datetime.now().isoformat(),
+        }
+        atomic_write(self._manifest_path(version), json.dumps(manifest))
+        return manifest
+
+    def manifest(self, version: int) -> Optional[Dict[str, Any]]:
+        """取得版本清單，版本不存在（或已被清除）時回傳 None"""
+        try:
+            with open(self._manifest_path(version), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def iter_chunks(self, manifest: Dict[str, Any]) -> Iterator[bytes]:
+        """
+        依序讀出版本的各區塊（UTF-8，區塊邊界皆在行尾）
+
+        Raises:
+            FileNotFoundError: 區塊已被清除（版本過期且超過寬限期）
+        """
+        for digest in manifest['chunks']:
+            with open(self._object_path(digest), 'rb') as f:
+                yield zlib.decompress(f.read())
+
+    def has_chunks(self, manifest: Dict[str, Any]) -> bool:
+        """版本的區塊是否都還在（下載開始前確認，避免送出部分內容後才失敗）"""
+        return all(os.path.exists(self._object_path(digest)) for digest in manifest['chunks'])
+
+    def read(self, version: int, max_chars: Optional[int] = None) -> Optional[str]:
+        """
+        讀取版本內容
+
+        Args:
+            version: 知識庫版本號
+            max_chars: 只讀取前 max_chars 個字元（預覽用，不需讀出所有區塊）
+
+        Returns:
+            內容，版本不存在或區塊已被清除時回傳 None
+        """
+        manifest = self.manifest(version)
+        if manifest is None:
+            return None
+
+        parts: List[str] = []
+        length = 0
+        try:
+            for chunk in self.iter_chunks(manifest):
+                text = chunk.decode('utf-8')
+                parts.append(text)
+                length += len(text)
+                if max_chars is not None and length >= max_chars:
+                    break
+        except FileNotFoundError:
+            return None
+        content = ''.join(parts)
+        return content[:max_chars] if max_chars is not None else content
+
+    def versions(self) -> List[int]:
+        """已保存的版本號（由小到大）"""
+        if not os.path.isdir(self._manifests):
+            return []
+        return sorted(int(name[:-5]) for name in os.listdir(self._manifests)
+                      if name.endswith('.json') and name[:-5].isdigit())
+
+    def latest_version(self) -> int:
+        """最新的版本號，尚無快照時為 0"""
+        versions = self.versions()
+        return versions[-1] if versions else 0
+
+    def prune(self) -> int:
+        """
+        刪除超過保留數的舊版本與其不再被引用的區塊（呼叫端需持有知識庫寫入鎖）
+
+        版本數超過保留數加上緩衝（PRUNE_SLACK）時才一次清除至保留數。清除分兩階段：
+        過期版本的清單先改名為 .json.expired（不再提供下載），已讀取清單的下載仍可讀取區塊；
+        之後的清除再刪除過期超過寬限期（grace）的清單與其不再被引用的區塊。
+        只檢查待刪區塊是否仍被保留版本或寬限期內的過期版本引用，不掃描整個區塊目錄
+
+        Returns:
+            本次過期的版本數
+        """
+        if not self.retention:
+            return 0
+
+        self._delete_expired()
+
+        versions = self.versions()
+        if len(versions) <= self.retention + max(1, int(self.retention * self.PRUNE_SLACK)):
+            return 0
+        expired = versions[:-self.retention]
+        for version in expired:
+            path = self._manifest_path(version)
+            expired_path = self._expired_path(version)
+            os.replace(path, expired_path)
+            # 寬限期自過期時起算
+            os.utime(expired_path)
+        return len(expired)
+
+    def _delete_expired(self) -> None:
+        """刪除過期超過寬限期的版本清單與其不再被引用的區塊"""
+        if not os.path.isdir(self._manifests):
+            return
+        cutoff = time.time() - self.grace
+        ready: List[str] = []
+        waiting: List[str] = []
+        for name in os.listdir(self._manifests):
+            if not name.endswith(self.EXPIRED_SUFFIX):
+                continue
+            path = os.path.join(self._manifests, name)
+            try:
+                (ready if os.path.getmtime(path) < cutoff else waiting).append(path)
+            except FileNotFoundError:
+                continue
+        if not ready:
+            return
+
+        candidates = set()
+        for path in ready:
+            candidates.update(self._load(path).get('chunks', []))
+
+        # 寬限期內的過期版本可能仍在下載；保留的版本由新到舊讀取，所有候選區塊都確認仍被引用時即可停止
+        referencing = waiting + [self._manifest_path(v) for v in reversed(self.versions())]
+        for path in referencing:
+            if not candidates:
+                break
+            candidates.difference_update(self._load(path).get('chunks', []))
+        for digest in candidates:
+            try:
+                os.remove(self._object_path(digest))
+            except FileNotFoundError:
+                pass
+        for path in ready:
+            os.remove(path)
+
+    @staticmethod
+    def _load(path: str) -> Dict[str, Any]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @classmethod
+    def split(cls, data: bytes) -> List[bytes]:
+        """
+        依內容切分區塊：邊界只取決於該行內容，插入或修改條目只影響附近的區塊
+        """
+        chunks: List[bytes] = []
+        start = 0
+        size = 0
+        for line in data.splitlines(keepends=True):
+            size += len(line)
+            if size >= cls.MAX_CHUNK or (
+                    size >= cls.MIN_CHUNK and zlib.crc32(line) & cls.BOUNDARY_MASK == 0):
+                chunks.append(data[start:start + size])
+                start += size
+                size = 0
+        if size:
+            chunks.append(data[start:])
+        return chunks
+
+    def _write_object(self, digest: str, chunk: bytes) -> None:
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(zlib.compress(chunk))
+        os.replace(tmp_path, path)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self._objects, digest[:2], digest)
+
+    def _manifest_path(self, version: int) -> str:
+        return os.path.join(self._manifests, f"{version}.json")
+
+    def _expired_path(self, version: int) -> str:
+        return os.path.join(self._manifests, f"{version}{self.EXPIRED_SUFFIX}")
@@ -0,0 +1,403 @@
+"""
+結構化知識庫存儲
+以 (類別, 術語) 為鍵的 SQLite 存儲，追加模式只需 upsert 新條目
+
+另記錄各文件的結構單元（投影片、章節）指紋與由各單元提取出的條目，同一文件重新上傳時
+只需提取變更的單元，已刪除單元獨有的條目一併移除
+
+術語鍵由 make_term_key 產生，正規化方式（或繁簡對照表）變更後開啟存儲時會重算既有條目的鍵，
+重算後相同的條目合併為一筆
+"""
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .normalizer import get_normalizer
+
+
+@dataclass
+class KBEntry:
+    """知識庫條目"""
+    category: str
+    term: str
+    definition: str = ""
+    scenario: str = ""
+    example: str = ""
+    sources: List[str] = field(default_factory=list)
+    # 提取出此條目的結構單元指紋（增量重新匯入用，不渲染至 Markdown）
+    units: List[str] = field(default_factory=list)
+
+
+@dataclass
+class DocumentRevision:
+    """同一文件（邏輯名稱）一次上傳的結構單元，寫入時與上一版比對"""
+    document: str
+    # 此版本所有單元的指紋（依文件順序）
+    fingerprints: List[str]
+    # 本次實際送交提取的單元指紋，其餘單元沿用上一版的條目
+    extracted: Set[str] = field(default_factory=set)
+    # 寫入後填入：因單元刪除而移除的條目數
+    retracted: int = 0
+
+
+def unit_fingerprint(text: str) -> str:
+    """結構單元的指紋（忽略空白差異）"""
+    return hashlib.sha256(' '.join(text.split()).encode('utf-8')).hexdigest()
+
+
+def make_term_key(term: str) -> str:
+    """生成術語的查找鍵（正規化後的術語，全為標點時退回原字串）"""
+    return get_normalizer().normalize(term) or term.strip()
+
+
+class KnowledgeBaseStore:
+    """以 SQLite 保存知識庫條目，Markdown 由存儲內容渲染"""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            category TEXT NOT NULL,
+            term_key TEXT NOT NULL,
+            term TEXT NOT NULL,
+            definition TEXT NOT NULL DEFAULT '',
+            scenario TEXT NOT NULL DEFAULT '',
+            example TEXT NOT NULL DEFAULT '',
+            sources TEXT NOT NULL DEFAULT '[]',
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            UNIQUE (category, term_key)
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS documents (
+            document TEXT PRIMARY KEY,
+            sources TEXT NOT NULL DEFAULT '[]'
+        );
+        CREATE TABLE IF NOT EXISTS document_units (
+            document TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            PRIMARY KEY (document, fingerprint)
+        );
+        CREATE TABLE IF NOT EXISTS unit_entries (
+            document TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            entry_id INTEGER NOT NULL,
+            PRIMARY KEY (document, fingerprint, entry_id)
+        );
+        CREATE INDEX IF NOT EXISTS unit_entries_entry ON unit_entries (entry_id);
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self._SCHEMA)
+        self._migrate_term_keys()
+
+    @contextmanager
+    def _connect(self, write: bool = False) -> Iterator[sqlite3.Connection]:
+        """
+        建立連線（每次操作獨立連線，確保執行緒安全）
+
+        Args:
+            write: 是否為讀後寫操作，是則以 BEGIN IMMEDIATE 先取得寫入鎖
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                if write:
+                    conn.execute("BEGIN IMMEDIATE")
+                yield conn
+        finally:
+            conn.close()
+
+    def _migrate_term_keys(self) -> None:
+        """以目前的正規化方式重算術語鍵（與上次開啟時相同則略過），鍵相同的條目合併至較早建立者"""
+        scheme = get_normalizer().signature
+        with self._connect() as conn:
+            if self._meta(conn, 'term_key_scheme') == scheme:
+                return
+
+        with self._connect(write=True) as conn:
+            if self._meta(conn, 'term_key_scheme') == scheme:
+                return
+
+            kept: Dict[Tuple[str, str], sqlite3.Row] = {}
+            rekeyed: List[Tuple[str, int]] = []
+            merged = 0
+            for row in conn.execute("SELECT * FROM entries ORDER BY id").fetchall():
+                term_key = make_term_key(row['term'])
+                target = kept.get((row['category'], term_key))
+                if target is None:
+                    kept[(row['category'], term_key)] = row
+                    if term_key != row['term_key']:
+                        rekeyed.append((term_key, row['id']))
+                    continue
+
+                # 新的鍵相同：內容與來源併入較早的條目，單元對應改指向該條目
+                sources = list(dict.fromkeys([*json.loads(target['sources']),
+                                              *json.loads(row['sources'])]))
+                conn.execute(
+                    "UPDATE entries SET definition = ?, scenario = ?, example = ?, sources = ?"
+                    " WHERE id = ?",
+                    (self._prefer_longer(target['definition'], row['definition']),
+                     self._prefer_longer(target['scenario'], row['scenario']),
+                     self._prefer_longer(target['example'], row['example']),
+                     json.dumps(sources, ensure_ascii=False), target['id'])
+                )
+                kept[(row['category'], term_key)] = conn.execute(
+                    "SELECT * FROM entries WHERE id = ?", (target['id'],)
+                ).fetchone()
+                conn.execute("UPDATE OR IGNORE unit_entries SET entry_id = ? WHERE entry_id = ?",
+                             (target['id'], row['id']))
+                conn.execute("DELETE FROM unit_entries WHERE entry_id = ?", (row['id'],))
+                conn.execute("DELETE FROM entries WHERE id = ?", (row['id'],))
+                merged += 1
+
+            # 先改為暫時的唯一鍵，避免新舊鍵互換時違反 UNIQUE 限制
+            conn.executemany("UPDATE entries SET term_key = ? WHERE id = ?",
+                             [(f'\x00{entry_id}', entry_id) for _key, entry_id in rekeyed])
+            conn.executemany("UPDATE entries SET term_key = ? WHERE id = ?", rekeyed)
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('term_key_scheme', ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value", (scheme,)
+            )
+            if rekeyed or merged:
+                self._bump_version(conn)
+                print(f"🔄 已重算 {len(rekeyed)} 個術語鍵，合併 {merged} 個重複條目")
+
+    def count(self) -> int:
+        """取得條目數量"""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def version(self) -> int:
+        """目前版本號（每次寫入遞增）"""
+        with self._connect() as conn:
+            value = self._meta(conn, 'version')
+        return int(value) if value is not None else 0
+
+    def advance_version(self, floor: int) -> None:
+        """使版本號不小於 floor（不視為一次寫入）"""
+        with self._connect(write=True) as conn:
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('version', ?)"
+                " ON CONFLICT (key) DO UPDATE"
+                " SET value = MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))",
+                (str(floor),)
+            )
+
+    def document_fingerprints(self, document: str) -> Set[str]:
+        """文件上一版已提取的單元指紋"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT fingerprint FROM document_units WHERE document = ?", (document,)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def clear(self) -> None:
+        """清空知識庫（new 模式使用）"""
+        with self._connect(write=True) as conn:
+            self._reset(conn)
+            self._bump_version(conn)
+
+    def upsert_entries(self, entries: Iterable[KBEntry], source_file: str | None,
+                       reset: bool = False,
+                       revision: Optional[DocumentRevision] = None) -> int:
+        """
+        插入或更新條目（同一交易內遞增版本號）
+
+        Args:
+            entries: 新提煉的條目
+            source_file: 來源文件名稱，None 表示來源已記錄在各條目的 sources（批次合併）
+            reset: 是否先清空知識庫（new 模式，與寫入在同一交易內）
+            revision: 文件的結構單元，提供時記錄條目來自哪些單元，並移除上一版已刪除單元
+                      獨有的條目（移除數記錄於 revision.retracted）
+
+        Returns:
+            新增的條目數量
+        """
+        now = datetime.now().isoformat()
+        inserted = 0
+        extra_sources = [source_file] if source_file else []
+        # 本次寫入的條目 id 與其單元指紋
+        links: List[tuple] = []
+
+        with self._connect(write=True) as conn:
+            if reset:
+                self._reset(conn)
+            self._bump_version(conn)
+            for entry in entries:
+                term_key = make_term_key(entry.term)
+                if not term_key:
+                    continue
+
+                row = conn.execute(
+                    "SELECT * FROM entries WHERE category = ? AND term_key = ?",
+                    (entry.category, term_key)
+                ).fetchone()
+
+                if row is None:
+                    sources = list(dict.fromkeys([*entry.sources, *extra_sources]))
+                    cursor = conn.execute(
+                        "INSERT INTO entries (category, term_key, term, definition, scenario,"
+                        " example, sources, created_at, updated_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (entry.category, term_key, entry.term.strip(), entry.definition,
+                         entry.scenario, entry.example,
+                         json.dumps(sources, ensure_ascii=False), now, now)
+                    )
+                    inserted += 1
+                    links.append((cursor.lastrowid, entry.units))
+                    continue
+
+                sources = list(dict.fromkeys([*json.loads(row['sources']),
+                                              *entry.sources, *extra_sources]))
+                conn.execute(
+                    "UPDATE entries SET definition = ?, scenario = ?, example = ?,"
+                    " sources = ?, updated_at = ? WHERE id = ?",
+                    (self._prefer_longer(row['definition'], entry.definition),
+                     self._prefer_longer(row['scenario'], entry.scenario),
+                     self._prefer_longer(row['example'], entry.example),
+                     json.dumps(sources, ensure_ascii=False), now, row['id'])
+                )
+                links.append((row['id'], entry.units))
+
+            if revision is not None:
+                revision.retracted = self._apply_revision(conn, revision, source_file, links)
+
+        return inserted
+
+    def _apply_revision(self, conn: sqlite3.Connection, revision: DocumentRevision,
+                        source_file: Optional[str], links: List[tuple]) -> int:
+        """
+        記錄文件此版本的單元與條目來源，移除已刪除單元獨有的條目
+
+        Returns:
+            移除的條目數
+        """
+        document = revision.document
+        stored = {row[0] for row in conn.execute(
+            "SELECT fingerprint FROM document_units WHERE document = ?", (document,)
+        )}
+        current = set(revision.fingerprints)
+
+        row = conn.execute("SELECT sources FROM documents WHERE document = ?",
+                           (document,)).fetchone()
+        document_sources = json.loads(row['sources']) if row else []
+        if source_file:
+            document_sources = list(dict.fromkeys([*document_sources, source_file]))
+        conn.execute(
+            "INSERT INTO documents (document, sources) VALUES (?, ?)"
+            " ON CONFLICT (document) DO UPDATE SET sources = excluded.sources",
+            (document, json.dumps(document_sources, ensure_ascii=False))
+        )
+
+        # 只記錄已提取（本次或上一版）的單元；比對後才被其他上傳刪除的單元不記錄，下次上傳時重新提取
+        conn.executemany(
+            "INSERT OR IGNORE INTO document_units (document, fingerprint) VALUES (?, ?)",
+            [(document, fingerprint) for fingerprint in current
+             if fingerprint in revision.extracted or fingerprint in stored]
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO unit_entries (document, fingerprint, entry_id) VALUES (?, ?, ?)",
+            [(document, fingerprint, entry_id) for entry_id, units in links
+             for fingerprint in units if fingerprint in revision.extracted]
+        )
+
+        deleted = stored - current
+        if not deleted:
+            return 0
+
+        affected: Set[int] = set()
+        for fingerprint in deleted:
+            affected.update(row[0] for row in conn.execute(
+                "SELECT entry_id FROM unit_entries WHERE document = ? AND fingerprint = ?",
+                (document, fingerprint)
+            ))
+            conn.execute("DELETE FROM unit_entries WHERE document = ? AND fingerprint = ?",
+                         (document, fingerprint))
+            conn.execute("DELETE FROM document_units WHERE document = ? AND fingerprint = ?",
+                         (document, fingerprint))
+
+        retracted = 0
+        for entry_id in sorted(affected):
+            others = [row[0] for row in conn.execute(
+                "SELECT DISTINCT document FROM unit_entries WHERE entry_id = ?", (entry_id,)
+            )]
+            if document in others:
+                # 仍有其他單元提取出此條目
+                continue
+
+            row = conn.execute("SELECT sources FROM entries WHERE id = ?", (entry_id,)).fetchone()
+            if row is None:
+                continue
+            # 其他文件同名時保留該來源
+            kept: Set[str] = set()
+            for other in others:
+                other_row = conn.execute("SELECT sources FROM documents WHERE document = ?",
+                                         (other,)).fetchone()
+                if other_row:
+                    kept.update(json.loads(other_row['sources']))
+            sources = [source for source in json.loads(row['sources'])
+                       if source not in document_sources or source in kept]
+
+            if sources:
+                conn.execute("UPDATE entries SET sources = ? WHERE id = ?",
+                             (json.dumps(sources, ensure_ascii=False), entry_id))
+            else:
+                conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+                conn.execute("DELETE FROM unit_entries WHERE entry_id = ?", (entry_id,))
+                retracted += 1
+
+        return retracted
+
+    def get_entries(self) -> List[KBEntry]:
+        """依建立順序取得所有條目"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM entries ORDER BY id").fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    @staticmethod
+    def _meta(conn: sqlite3.Connection, key: str) -> Optional[str]:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _reset(conn: sqlite3.Connection) -> None:
+        for table in ('entries', 'documents', 'document_units', 'unit_entries'):
+            conn.execute(f"DELETE FROM {table}")
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection) -> None:
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('version', '1')"
+            " ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    @staticmethod
+    def _prefer_longer(existing: str, new: str) -> str:
+        """保留較完整的說明"""
+        return new if len(new.strip()) > len(existing.strip()) else existing
+
+    @staticmethod
+    def _row_to_entry(row: sqlite3.Row) -> KBEntry:
+        return KBEntry(
+            category=row['category'],
+            term=row['term'],
+            definition=row['definition'],
+            scenario=row['scenario'],
+            example=row['example'],
+            sources=json.loads(row['sources']),
+        )
@@ -0,0 +1,217 @@
+"""
+知識庫寫入器
+以樂觀並行合併新條目：鎖外依目前版本的快照去重並詢問 Gemini，鎖內確認版本未變才寫入；
+其他任務已先寫入時，以新版本重新去重（rebase）而非覆蓋，只有出現未判斷過的可疑配對時
+才釋放鎖重新詢問。寫入、渲染、Markdown 原子替換與版本快照都在鎖內完成，檔案版本不會倒退
+"""
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import config
+from metrics import get_metrics
+from tracing import span, traced
+from .dify_formatter import DifyFormatter
+from .lock import KBLock, create_kb_lock
+from .merger import DedupIndex, DeduplicationEngine, DeduplicationResult, KnowledgeBaseMerger
+from .snapshots import SnapshotStore
+from .store import DocumentRevision, KBEntry, KnowledgeBaseStore
+
+# (類別, 新術語, 既有術語) → 是否為同一概念
+Judge = Callable[[List[Tuple[str, str, str]]], List[bool]]
+
+# 各知識庫既有條目的去重索引：存儲路徑 → (版本, 索引)。本行程寫入後就地加入新條目，
+# 版本不同（其他行程寫入、清空或移除條目）時重建
+_index_cache: Dict[str, Tuple[int, DedupIndex]] = {}
+
+
+@dataclass
+class MergeResult:
+    """一次合併的結果"""
+    added: int
+    merged: int
+    ambiguous: int
+    version: int
+    content_size: int
+    # 因其他任務先寫入而重新去重的次數
+    rebased: int = 0
+    # 文件重新上傳時，因單元刪除而移除的條目數
+    retracted: int = 0
+
+
+class KnowledgeBaseWriter:
+    """同一知識庫（輸出資料夾）的並行安全寫入"""
+
+    def __init__(self, output_folder: str, lock: Optional[KBLock] = None,
+                 max_retries: Optional[int] = None):
+        """
+        Args:
+            output_folder: 知識庫輸出資料夾
+            lock: 寫入鎖，預設依 KB_LOCK 建立
+            max_retries: 版本衝突時重新詢問 Gemini 的次數上限，預設依 KB_MERGE_MAX_RETRIES
+        """
+        self.output_path = os.path.join(output_folder, config.OUTPUT_FILENAME)
+        self.merger = KnowledgeBaseMerger(self.output_path)
+        self.store = KnowledgeBaseStore(os.path.join(output_folder, config.KB_STORE_FILENAME))
+        self.snapshots = SnapshotStore(os.path.join(output_folder, config.SNAPSHOT_DIR))
+        self.lock = lock or create_kb_lock(output_folder)
+        self.max_retries = config.KB_MERGE_MAX_RETRIES if max_retries is None else max_retries
+
+    @traced('KnowledgeBaseWriter.merge', cat='kb')
+    def merge(self, entries: List[KBEntry], source_file: Optional[str], mode: str = 'append',
+              judge: Optional[Judge] = None, label: Optional[str] = None,
+              revision: Optional[DocumentRevision] = None) -> MergeResult:
+        """
+        去重並寫入條目，重新渲染 Markdown
+
+        Args:
+            entries: 新提取的條目
+            source_file: 來源文件名稱，None 表示各條目的 sources 已記錄來源（批次合併）
+            mode: append 與既有條目合併；new 清空後寫入
+            judge: 判斷可疑配對是否為同一概念（通常為 Gemini），未提供時視為不同
+            label: 寫入標頭的來源說明，預設為 source_file
+            revision: 文件的結構單元（增量重新匯入），移除上一版已刪除單元獨有的條目
+
+        Returns:
+            MergeResult
+        """
+        metrics = get_metrics()
+        merge_started = time.perf_counter()
+        append = mode == 'append'
+        if append:
+            self._import_legacy()
+
+        engine = DeduplicationEngine()
+        verdicts: Dict[Tuple[str, str, str], bool] = {}
+        if append:
+            base_version, existing = self._existing_index(engine)
+        else:
+            base_version, existing = self.store.version(), []
+        rebased = 0
+        retries = 0
+
+        while True:
+            dedup = engine.deduplicate(entries, existing)
+            self._judge(dedup, judge, verdicts)
+
+            with self.lock:
+                version = self._sync_version()
+                if append and version != base_version:
+                    # 其他任務已寫入：以新版本重新去重，判斷過的配對沿用結果
+                    rebased += 1
+                    base_version, existing = self._existing_index(engine)
+                    dedup = engine.deduplicate(entries, existing)
+                    if (judge is not None and retries < self.max_retries
+                            and self._unjudged(dedup, verdicts)):
+                        # 釋放鎖後詢問新的可疑配對，再重試
+                        retries += 1
+                        continue
+
+                resolved = dedup.resolve([verdicts.get(self._pair(item), False)
+                                          for item in dedup.ambiguous])
+                added = self.store.upsert_entries(resolved, source_file, reset=not append,
+                                                  revision=revision)
+                version = self.store.version()
+                self._update_index(engine, existing, base_version, version, resolved, revision)
+                metrics.observe('kb_stage_duration_seconds',
+                                time.perf_counter() - merge_started, stage='merge')
+
+                with metrics.time('kb_stage_duration_seconds', stage='format'), \
+                        span('kb.format', cat='kb'):
+                    content = DifyFormatter.format(
+                        DifyFormatter.render_entries(self.store.get_entries())
+                    )
+                with metrics.time('kb_stage_duration_seconds', stage='save'), \
+                        span('kb.save', cat='kb', version=version):
+                    saved = self.merger.save(content, label or source_file or '', version)
+                    self.snapshots.save(version, saved)
+                    self.snapshots.prune()
+
+                return MergeResult(
+                    added=added,
+                    merged=len(dedup.merged),
+                    ambiguous=len(dedup.ambiguous),
+                    version=version,
+                    content_size=len(content),
+                    rebased=rebased,
+                    retracted=revision.retracted if revision else 0,
+                )
+
+    def version(self) -> int:
+        """目前的知識庫版本號"""
+        return self.store.version()
+
+    def _sync_version(self) -> int:
+        """
+        目前的版本號，且不小於既有快照的最新版本（鎖內呼叫）：
+        存儲被刪除或重建時版本號從頭計算，接續快照的版本號以免覆寫舊版本的快照
+        """
+        version = self.store.version()
+        latest = self.snapshots.latest_version()
+        if latest > version:
+            self.store.advance_version(latest)
+            version = latest
+        return version
+
+    def _existing_index(self, engine: DeduplicationEngine) -> Tuple[int, DedupIndex]:
+        """
+        既有條目的去重索引與其版本，版本未變時沿用快取，不必每次上傳都重新索引整個知識庫
+        （先讀版本再讀條目，條目可能比版本新；寫入前仍會在鎖內確認版本）
+        """
+        version = self.store.version()
+        cached = _index_cache.get(self.store.db_path)
+        if cached is not None and cached[0] == version:
+            return cached
+        cached = (version, engine.build_index(self.store.get_entries()))
+        _index_cache[self.store.db_path] = cached
+        return cached
+
+    def _update_index(self, engine: DeduplicationEngine,
+                      existing: Union[List[KBEntry], DedupIndex], base_version: int,
+                      version: int, resolved: List[KBEntry],
+                      revision: Optional[DocumentRevision]) -> None:
+        """
+        寫入後更新索引快取（鎖內呼叫）：只新增條目時就地加入，其餘情況捨棄快取
+        （鎖外正在去重的其他任務可能看到新加入的條目，寫入前的版本確認會使其重新去重）
+        """
+        cached = _index_cache.get(self.store.db_path)
+        if (isinstance(existing, DedupIndex) and cached is not None and cached[1] is existing
+                and cached[0] == base_version and version == base_version + 1
+                and not (revision and revision.retracted)):
+            engine.extend(existing, resolved)
+            _index_cache[self.store.db_path] = (version, existing)
+        else:
+            _index_cache.pop(self.store.db_path, None)
+
+    def _import_legacy(self) -> None:
+        """存儲為空時，將既有的 Markdown 知識庫匯入存儲（一次性遷移）"""
+        if self.store.count() > 0:
+            return
+
+        with self.lock:
+            if self.store.count() > 0:
+                return
+            existing_kb = self.merger.load_existing()
+            if existing_kb:
+                legacy_entries = DifyFormatter.parse_entries(existing_kb)
+                self.store.upsert_entries(legacy_entries, config.OUTPUT_FILENAME)
+
+    def _judge(self, dedup: DeduplicationResult, judge: Optional[Judge],
+               verdicts: Dict[Tuple[str, str, str], bool]) -> None:
+        """詢問尚未判斷過的可疑配對（鎖外呼叫）"""
+        pairs = self._unjudged(dedup, verdicts)
+        if not pairs or judge is None:
+            return
+        for pair, same in zip(pairs, judge(pairs)):
+            verdicts[pair] = same
+
+    def _unjudged(self, dedup: DeduplicationResult,
+                  verdicts: Dict[Tuple[str, str, str], bool]) -> List[Tuple[str, str, str]]:
+        pairs = [self._pair(item) for item in dedup.ambiguous]
+        return [pair for pair in dict.fromkeys(pairs) if pair not in verdicts]
+
+    @staticmethod
+    def _pair(item: Tuple[KBEntry, KBEntry, float]) -> Tuple[str, str, str]:
+        entry, candidate, _score = item
+        return entry.category, entry.term, candidate.term
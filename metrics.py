@@ -0,0 +1,299 @@
+"""
+執行指標
+文件處理各階段耗時、處理管線的佇列深度與忙碌工作數、Gemini 延遲與 token 用量、
+任務存儲操作延遲，由 /metrics 以 Prometheus 文字格式輸出。
+
+已安裝 prometheus_client 時使用其實作；設定 PROMETHEUS_MULTIPROC_DIR 時為多行程模式，
+gunicorn 各 worker 與解析行程的數值寫入共用目錄並於輸出時合併（gunicorn 設定檔的
+child_exit 需呼叫 mark_process_dead）。未安裝時使用行程內實作，只包含目前行程的數值
+"""
+import bisect
+import functools
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+import config
+
+T = TypeVar('T')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@dataclass(frozen=True)
+class MetricSpec:
+    """指標定義（兩種實作共用）"""
+    kind: str  # counter / gauge / histogram
+    help: str
+    labels: Tuple[str, ...]
+    buckets: Tuple[float, ...] = ()
+
+
+SPECS: Dict[str, MetricSpec] = {
+    'kb_stage_duration_seconds': MetricSpec(
+        'histogram', '文件處理各階段耗時（parse / extract / merge / format / save）', ('stage',),
+        (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+    ),
+    'kb_pipeline_queue_depth': MetricSpec(
+        'gauge', '處理管線中等待該階段的工作數', ('stage',),
+    ),
+    'kb_pipeline_active_workers': MetricSpec(
+        'gauge', '處理管線中正在執行該階段的工作數', ('stage',),
+    ),
+    'kb_gemini_request_duration_seconds': MetricSpec(
+        'histogram', '單次 Gemini 呼叫耗時（不含排隊與退避）', ('model', 'outcome'),
+        (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64),
+    ),
+    'kb_gemini_tokens_total': MetricSpec(
+        'counter', 'Gemini 回應回報的 token 用量', ('model', 'direction'),
+    ),
+    'kb_task_store_duration_seconds': MetricSpec(
+        'histogram', '任務存儲操作耗時', ('operation',),
+        (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1),
+    ),
+}
+
+
+class Metrics(ABC):
+    """指標抽象基類"""
+
+    @abstractmethod
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """記錄一次觀測值（histogram）"""
+        pass
+
+    @abstractmethod
+    def inc(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        """增加計數（counter），或增減 gauge（amount 可為負數）"""
+        pass
+
+    @abstractmethod
+    def render(self) -> bytes:
+        """以 Prometheus 文字格式輸出所有指標"""
+        pass
+
+    @contextmanager
+    def time(self, name: str, **labels: str) -> Iterator[None]:
+        """記錄 with 區塊的耗時（例外時也記錄）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @contextmanager
+    def active(self, name: str, **labels: str) -> Iterator[None]:
+        """with 區塊執行期間 gauge 加 1"""
+        self.inc(name, 1, **labels)
+        try:
+            yield
+        finally:
+            self.inc(name, -1, **labels)
+
+
+class NullMetrics(Metrics):
+    """停用指標（METRICS=off）"""
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        pass
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        pass
+
+    def render(self) -> bytes:
+        return b''
+
+
+class LocalMetrics(Metrics):
+    """行程內指標（未安裝 prometheus_client 時使用）"""
+
+    def __init__(self):
+        # (名稱, 標籤值) → 數值；histogram 為 [各區間計數..., 總和]
+        self._values: Dict[Tuple[str, Tuple[str, ...]], Any] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        spec = SPECS[name]
+        key = (name, self._label_values(spec, labels))
+        index = bisect.bisect_left(spec.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(spec.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        key = (name, self._label_values(SPECS[name], labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> bytes:
+        with self._lock:
+            values = {key: list(value) if isinstance(value, list) else value
+                      for key, value in self._values.items()}
+
+        lines: List[str] = []
+        for name, spec in SPECS.items():
+            lines.append(f"# HELP {name} {spec.help}")
+            lines.append(f"# TYPE {name} {spec.kind}")
+            for (metric, label_values), value in sorted(values.items()):
+                if metric != name:
+                    continue
+                pairs = list(zip(spec.labels, label_values))
+                if spec.kind != 'histogram':
+                    lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                bounds = [_format_value(b) for b in spec.buckets] + ['+Inf']
+                for bound, count in zip(bounds, value[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(pairs + [('le', bound)])} "
+                                 f"{cumulative}")
+                lines.append(f"{name}_sum{_format_labels(pairs)} {_format_value(value[-1])}")
+                lines.append(f"{name}_count{_format_labels(pairs)} {cumulative}")
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    @staticmethod
+    def _label_values(spec: MetricSpec, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, '')) for label in spec.labels)
+
+
+class PrometheusMetrics(Metrics):
+    """prometheus_client 實作（設定 PROMETHEUS_MULTIPROC_DIR 時跨行程合併）"""
+
+    def __init__(self):
+        try:
+            import prometheus_client
+        except ImportError as e:
+            raise ImportError(f"未安裝 prometheus_client: {e}")
+
+        self._client = prometheus_client
+        self.multiprocess = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+        # 多行程模式下數值寫入共用目錄，輸出時另建 registry 讀取
+        self._registry = None if self.multiprocess else prometheus_client.CollectorRegistry()
+        self._metrics: Dict[str, Any] = {}
+        self._children: Dict[Tuple[str, Tuple[str, ...]], Any] = {}
+        self._lock = threading.Lock()
+
+        for name, spec in SPECS.items():
+            kwargs: Dict[str, Any] = {'registry': self._registry}
+            if spec.kind == 'histogram':
+                kwargs['buckets'] = spec.buckets
+                metric_class = prometheus_client.Histogram
+            elif spec.kind == 'gauge':
+                # 各行程的數值相加（已結束的行程不計入）
+                kwargs['multiprocess_mode'] = 'livesum'
+                metric_class = prometheus_client.Gauge
+            else:
+                metric_class = prometheus_client.Counter
+            self._metrics[name] = metric_class(name, spec.help, spec.labels, **kwargs)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        self._child(name, labels).observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, **labels: str) -> None:
+        child = self._child(name, labels)
+        if amount < 0:
+            child.dec(-amount)
+        else:
+            child.inc(amount)
+
+    def render(self) -> bytes:
+        registry = self._registry
+        if registry is None:
+            from prometheus_client import multiprocess
+            registry = self._client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return self._client.generate_latest(registry)
+
+    def _child(self, name: str, labels: Dict[str, str]) -> Any:
+        spec = SPECS[name]
+        values = tuple(str(labels.get(label, '')) for label in spec.labels)
+        child = self._children.get((name, values))
+        if child is None:
+            with self._lock:
+                child = self._metrics[name].labels(*values)
+                self._children[(name, values)] = child
+        return child
+
+
+def create_metrics() -> Metrics:
+    """
+    根據環境變數建立指標實作
+
+    環境變數:
+        METRICS: prometheus / local / off（預設 auto：已安裝 prometheus_client 時使用）
+        PROMETHEUS_MULTIPROC_DIR: 多行程模式的共用目錄（gunicorn 多 worker 時設定）
+    """
+    backend = config.METRICS_BACKEND
+    if backend == 'off':
+        return NullMetrics()
+
+    if backend in ('auto', 'prometheus'):
+        try:
+            return PrometheusMetrics()
+        except ImportError as e:
+            if backend == 'prometheus' or os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+                print(f"警告: {e}，回退到行程內指標（多行程時各 worker 只回報自己的數值）")
+
+    return LocalMetrics()
+
+
+_metrics: Optional[Metrics] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> Metrics:
+    """取得共用的指標實作"""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = create_metrics()
+    return _metrics
+
+
+def timed(name: str, **labels: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """記錄函式耗時的裝飾器"""
+    def decorator(fn: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> T:
+            with get_metrics().time(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def mark_process_dead(pid: int) -> None:
+    """
+    多行程模式下清除已結束行程的 gauge 數值（gunicorn 設定檔的 child_exit 呼叫）
+
+    Example:
+        def child_exit(server, worker):
+            metrics.mark_process_dead(worker.pid)
+    """
+    if not os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        return
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(pid)
+
+
+def _format_labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{label}="{value}"'
+                          for (label, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
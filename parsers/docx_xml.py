@@ -0,0 +1,212 @@
+"""
+Word 快速解析路徑
+直接以 iterparse 串流解析 zip 內的 word/document.xml，不建立 python-docx 物件，
+單次走訪即產生段落、標題、章節、表格與完整文字，記憶體用量與單一區塊大小相關
+"""
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import IO, Any, Dict, List, Union
+
+_W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+_BODY = f'{_W}body'
+_P = f'{_W}p'
+_R = f'{_W}r'
+_TBL = f'{_W}tbl'
+_TR = f'{_W}tr'
+_TC = f'{_W}tc'
+_HYPERLINK = f'{_W}hyperlink'
+_VAL = f'{_W}val'
+
+# 與 python-docx BabelFish 相同的內建樣式名稱轉換（styles.xml 名稱 → UI 名稱）
+_UI_STYLE_NAMES = {
+    'caption': 'Caption', 'footer': 'Footer', 'header': 'Header',
+    **{f'heading {i}': f'Heading {i}' for i in range(1, 10)},
+}
+
+# Run 內文字元素（與 python-docx Run.text 相同的對應）
+_RUN_TEXT = {
+    f'{_W}tab': '\t',
+    f'{_W}ptab': '\t',
+    f'{_W}cr': '\n',
+    f'{_W}noBreakHyphen': '-',
+}
+
+
+def format_table_rows(rows: List[List[str]]) -> str:
+    """表格轉為分析用文字，每列以 | 分隔欄位"""
+    return '\n'.join(' | '.join(row) for row in rows)
+
+
+def parse_docx_xml(source: Union[str, IO[bytes]]) -> Dict[str, Any]:
+    """
+    串流解析 .docx
+
+    Args:
+        source: 檔案路徑或二進位檔案物件
+
+    Returns:
+        與 WordParser.parse() 相同結構的字典（不含 file_name / file_type）
+
+    Raises:
+        zipfile.BadZipFile / KeyError / ET.ParseError: 檔案結構不符時
+    """
+    paragraphs: List[str] = []
+    tables: List[List[List[str]]] = []
+    headings: List[Dict[str, str]] = []
+    sections: List[Dict[str, str]] = []
+    full_text: List[str] = []
+    section = {'heading': '', 'level': '', 'lines': []}
+
+    with zipfile.ZipFile(source) as archive:
+        style_names, default_style = _load_styles(archive)
+
+        with archive.open('word/document.xml') as stream:
+            depth = 0
+            body = None
+            for event, elem in ET.iterparse(stream, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if elem.tag == _BODY:
+                        body = elem
+                    continue
+
+                # body 的直接子元素（depth 3）處理完即釋放
+                if depth == 3 and body is not None:
+                    if elem.tag == _P:
+                        text = _paragraph_text(elem)
+                        full_text.append(text)
+                        stripped = text.strip()
+                        style = _paragraph_style(elem, style_names, default_style)
+
+                        if style.startswith('Heading'):
+                            headings.append({'level': style, 'text': stripped})
+                            if section['heading'] or section['lines']:
+                                sections.append(section)
+                            section = {'heading': stripped, 'level': style, 'lines': []}
+                        elif stripped:
+                            section['lines'].append(stripped)
+
+                        if stripped:
+                            paragraphs.append(stripped)
+
+                    elif elem.tag == _TBL:
+                        rows = _table_rows(elem)
+                        tables.append(rows)
+                        table_text = format_table_rows(rows)
+                        full_text.append(table_text)
+                        if table_text.strip():
+                            section['lines'].append(table_text)
+
+                    body.clear()
+
+                depth -= 1
+
+    if section['heading'] or section['lines']:
+        sections.append(section)
+
+    return {
+        'paragraphs': paragraphs,
+        'tables': tables,
+        'headings': headings,
+        'sections': [
+            {'heading': s['heading'], 'level': s['level'], 'text': '\n'.join(s['lines'])}
+            for s in sections
+        ],
+        'full_text': '\n'.join(full_text).strip(),
+    }
+
+
+def _load_styles(archive: zipfile.ZipFile) -> tuple:
+    """讀取段落樣式 ID → 名稱對照與預設段落樣式名稱"""
+    names: Dict[str, str] = {}
+    default = 'Normal'
+
+    try:
+        stream = archive.open('word/styles.xml')
+    except KeyError:
+        return names, default
+
+    with stream:
+        root = ET.parse(stream).getroot()
+
+    for style in root.iter(f'{_W}style'):
+        if style.get(f'{_W}type') != 'paragraph':
+            continue
+        name_elem = style.find(f'{_W}name')
+        name = name_elem.get(_VAL, '') if name_elem is not None else ''
+        name = _UI_STYLE_NAMES.get(name, name)
+        style_id = style.get(f'{_W}styleId', '')
+        names[style_id] = name
+        if style.get(f'{_W}default') in ('1', 'true', 'on'):
+            default = name
+
+    return names, default
+
+
+def _paragraph_style(p: ET.Element, style_names: Dict[str, str], default: str) -> str:
+    """段落樣式名稱（找不到時回退到預設段落樣式，與 python-docx 一致）"""
+    style = p.find(f'{_W}pPr/{_W}pStyle')
+    if style is None:
+        return default
+    return style_names.get(style.get(_VAL, ''), default)
+
+
+def _paragraph_text(p: ET.Element) -> str:
+    """段落文字：直接子層的 run 與超連結內的 run"""
+    parts = []
+    for child in p:
+        if child.tag == _R:
+            parts.append(_run_text(child))
+        elif child.tag == _HYPERLINK:
+            parts.extend(_run_text(r) for r in child.iter(_R))
+    return ''.join(parts)
+
+
+def _run_text(r: ET.Element) -> str:
+    parts = []
+    for child in r:
+        tag = child.tag
+        if tag == f'{_W}t':
+            parts.append(child.text or '')
+        elif tag == f'{_W}br':
+            # 換頁、分欄不產生文字
+            if child.get(f'{_W}type', 'textWrapping') == 'textWrapping':
+                parts.append('\n')
+        elif tag in _RUN_TEXT:
+            parts.append(_RUN_TEXT[tag])
+    return ''.join(parts)
+
+
+def _table_rows(tbl: ET.Element) -> List[List[str]]:
+    """
+    表格列資料（與 python-docx Row.cells 相同語意）
+
+    水平合併的儲存格依 gridSpan 重複，垂直合併的延續儲存格取上一列同位置的內容
+    """
+    rows: List[List[str]] = []
+    above: Dict[int, str] = {}
+
+    for tr in tbl.findall(_TR):
+        grid_before = tr.find(f'{_W}trPr/{_W}gridBefore')
+        offset = int(grid_before.get(_VAL, '0')) if grid_before is not None else 0
+        cells: List[str] = []
+        current: Dict[int, str] = {}
+
+        for tc in tr.findall(_TC):
+            span_elem = tc.find(f'{_W}tcPr/{_W}gridSpan')
+            span = int(span_elem.get(_VAL, '1')) if span_elem is not None else 1
+            vmerge = tc.find(f'{_W}tcPr/{_W}vMerge')
+
+            if vmerge is not None and vmerge.get(_VAL, 'continue') == 'continue':
+                text = above.get(offset, '')
+            else:
+                text = '\n'.join(_paragraph_text(p) for p in tc.findall(_P)).strip()
+
+            current[offset] = text
+            cells.extend([text] * span)
+            offset += span
+
+        rows.append(cells)
+        above = current
+
+    return rows
@@ -2,31 +2,46 @@
 PowerPoint 文件解析器
 """
 from pptx import Presentation  # type: ignore[import-untyped]
-from typing import Any, Dict, List, Optional
+from pptx.enum.shapes import MSO_SHAPE_TYPE  # type: ignore[import-untyped]
+from typing import IO, Any, Dict, Iterator, List, Optional, Union
+
+from tracing import traced
 
 
 class PPTParser:
     """解析 PowerPoint (.pptx) 文件"""
 
-    def __init__(self, file_path: str):
-        self.file_path = file_path
+    def __init__(self, source: Union[str, IO[bytes]], file_name: Optional[str] = None):
+        """
+        Args:
+            source: 文件路徑或可 seek 的二進位檔案物件（上傳緩衝區）
+            file_name: 檔名（source 為檔案物件時使用）
+        """
+        self.source = source
+        self.file_name = file_name or (source.split('\\')[-1] if isinstance(source, str) else '')
         self.presentation: Any = None
 
     def parse(self) -> Dict[str, Any]:
         """
-        解析 PPT 文件
+        解析 PPT 文件（單次走訪，slides 與 full_text 來自同一批記錄）
 
         Returns:
             包含投影片內容的結構化字典
         """
         try:
-            self.presentation = Presentation(self.file_path)
+            self.presentation = Presentation(self.source)
+
+            slides = []
+            text_parts: List[str] = []
+            for slide_data in self.iter_slides():
+                slides.append(slide_data)
+                text_parts.append(self.slide_text(slide_data))
 
             content = {
-                'file_name': self.file_path.split('\\')[-1],
+                'file_name': self.file_name,
                 'file_type': 'pptx',
-                'slides': self._extract_slides(),
-                'full_text': self._extract_full_text()
+                'slides': slides,
+                'full_text': '\n\n'.join(part for part in text_parts if part)
             }
 
             return content
@@ -34,38 +49,97 @@ class PPTParser:
         except Exception as e:
             raise Exception(f"PPT 文件解析失敗: {str(e)}")
 
-    def _extract_slides(self) -> List[Dict[str, Any]]:
-        """提取每張投影片的內容"""
-        slides = []
+    def iter_slides(self) -> Iterator[Dict[str, Any]]:
+        """逐張產生投影片記錄（延遲求值，每張投影片只走訪一次）"""
         assert self.presentation is not None
 
         for idx, slide in enumerate(self.presentation.slides, 1):
-            slide_content = {
+            yield {
                 'slide_number': idx,
                 'title': self._extract_title(slide),
                 'texts': self._extract_texts(slide),
                 'notes': self._extract_notes(slide)
             }
-            slides.append(slide_content)
-
-        return slides
 
+    @staticmethod
+    def slide_text(slide_data: Dict[str, Any]) -> str:
+        """將投影片記錄轉為分析用文字"""
+        parts = []
+        if slide_data['title']:
+            parts.append(f"# {slide_data['title']}")
+        parts.extend(slide_data['texts'])
+        if slide_data['notes']:
+            parts.append(f"備註: {slide_data['notes']}")
+        return '\n\n'.join(parts)
+
+    @traced(cat='parser')
     def _extract_title(self, slide) -> str:
         """提取投影片標題"""
         if slide.shapes.title:
             return slide.shapes.title.text.strip()
         return ""
 
+    @traced(cat='parser')
     def _extract_texts(self, slide) -> List[str]:
-        """提取投影片中所有文字"""
-        texts = []
+        """提取投影片中所有文字（含群組、表格、圖表）"""
+        texts: List[str] = []
+        self._collect_shape_texts(slide.shapes, texts)
+        return texts
 
-        for shape in slide.shapes:
-            if hasattr(shape, "text") and shape.text.strip():
-                texts.append(shape.text.strip())
+    def _collect_shape_texts(self, shapes, texts: List[str]) -> None:
+        """遞迴走訪圖形，收集文字"""
+        for shape in shapes:
+            if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+                self._collect_shape_texts(shape.shapes, texts)
+            elif getattr(shape, 'has_table', False) and shape.has_table:
+                table_text = self._extract_table(shape.table)
+                if table_text:
+                    texts.append(table_text)
+            elif getattr(shape, 'has_chart', False) and shape.has_chart:
+                chart_text = self._extract_chart(shape.chart)
+                if chart_text:
+                    texts.append(chart_text)
+            elif getattr(shape, 'has_text_frame', False) and shape.has_text_frame:
+                text = shape.text_frame.text.strip()
+                if text:
+                    texts.append(text)
+
+    @staticmethod
+    @traced(cat='parser')
+    def _extract_table(table) -> str:
+        """表格轉為以 | 分隔的文字列"""
+        rows = []
+        for row in table.rows:
+            cells = [cell.text.strip() for cell in row.cells]
+            if any(cells):
+                rows.append(' | '.join(cells))
+        return '\n'.join(rows)
+
+    @staticmethod
+    @traced(cat='parser')
+    def _extract_chart(chart) -> str:
+        """提取圖表標題、類別與數列名稱"""
+        parts = []
+        if chart.has_title and chart.chart_title.has_text_frame:
+            title = chart.chart_title.text_frame.text.strip()
+            if title:
+                parts.append(f"圖表: {title}")
 
-        return texts
+        try:
+            plot = chart.plots[0]
+        except IndexError:
+            return '\n'.join(parts)
+
+        categories = [str(c) for c in plot.categories if str(c).strip()]
+        if categories:
+            parts.append(f"類別: {', '.join(categories)}")
+        series = [s.name for s in plot.series if s.name]
+        if series:
+            parts.append(f"數列: {', '.join(series)}")
+
+        return '\n'.join(parts)
 
+    @traced(cat='parser')
     def _extract_notes(self, slide) -> str:
         """提取投影片備註"""
         if slide.has_notes_slide:
@@ -73,16 +147,3 @@ class PPTParser:
             if notes_frame:
                 return notes_frame.text.strip()
         return ""
-
-    def _extract_full_text(self) -> str:
-        """提取完整文字（用於 AI 分析）"""
-        all_texts = []
-
-        for slide_data in self._extract_slides():
-            if slide_data['title']:
-                all_texts.append(f"# {slide_data['title']}")
-            all_texts.extend(slide_data['texts'])
-            if slide_data['notes']:
-                all_texts.append(f"備註: {slide_data['notes']}")
-
-        return '\n\n'.join(all_texts)
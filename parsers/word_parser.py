@@ -2,14 +2,29 @@
 Word 文件解析器
 """
 from docx import Document  # type: ignore[import-untyped]
-from typing import Any, Dict, List, Optional
+from docx.table import Table  # type: ignore[import-untyped]
+from typing import IO, Any, Dict, List, Optional, Union
+
+from .docx_xml import format_table_rows, parse_docx_xml
+from tracing import span, traced
+import config
 
 
 class WordParser:
     """解析 Word (.docx) 文件"""
 
-    def __init__(self, file_path: str):
-        self.file_path = file_path
+    def __init__(self, source: Union[str, IO[bytes]], fast: Optional[bool] = None,
+                 file_name: Optional[str] = None):
+        """
+        Args:
+            source: 文件路徑或可 seek 的二進位檔案物件（上傳緩衝區）
+            fast: 是否使用 XML 串流快速路徑（預設依 WORD_PARSER_FAST_MODE 設定），
+                  失敗時自動回退到 python-docx
+            file_name: 檔名（source 為檔案物件時使用）
+        """
+        self.source = source
+        self.file_name = file_name or (source.split('\\')[-1] if isinstance(source, str) else '')
+        self.fast = config.WORD_PARSER_FAST_MODE if fast is None else fast
         self.document: Any = None
 
     def parse(self) -> Dict[str, Any]:
@@ -19,15 +34,31 @@ class WordParser:
         Returns:
             包含標題、段落、表格等結構化內容的字典
         """
+        if self.fast:
+            try:
+                with span('WordParser.parse_docx_xml', cat='parser'):
+                    content = parse_docx_xml(self.source)
+                return {
+                    'file_name': self.file_name,
+                    'file_type': 'docx',
+                    **content,
+                }
+            except Exception as e:
+                # 快速路徑只處理常見結構，任何非預期的內容（編碼、屬性值、壓縮格式等）都回退
+                print(f"⚠️ 快速解析失敗，改用 python-docx: {type(e).__name__}: {e}")
+                if not isinstance(self.source, str):
+                    self.source.seek(0)
+
         try:
-            self.document = Document(self.file_path)
+            self.document = Document(self.source)
 
             content = {
-                'file_name': self.file_path.split('\\')[-1],
+                'file_name': self.file_name,
                 'file_type': 'docx',
                 'paragraphs': self._extract_paragraphs(),
                 'tables': self._extract_tables(),
                 'headings': self._extract_headings(),
+                'sections': self._extract_sections(),
                 'full_text': self._extract_full_text()
             }
 
@@ -36,6 +67,7 @@ class WordParser:
         except Exception as e:
             raise Exception(f"Word 文件解析失敗: {str(e)}")
 
+    @traced(cat='parser')
     def _extract_paragraphs(self) -> List[str]:
         """提取所有段落"""
         assert self.document is not None
@@ -46,32 +78,69 @@ class WordParser:
                 paragraphs.append(text)
         return paragraphs
 
+    @traced(cat='parser')
     def _extract_tables(self) -> List[List[List[str]]]:
         """提取所有表格"""
         assert self.document is not None
-        tables = []
-        for table in self.document.tables:
-            table_data = []
-            for row in table.rows:
-                row_data = [cell.text.strip() for cell in row.cells]
-                table_data.append(row_data)
-            tables.append(table_data)
-        return tables
+        return [self._table_rows(table) for table in self.document.tables]
+
+    @staticmethod
+    def _table_rows(table: Table) -> List[List[str]]:
+        return [[cell.text.strip() for cell in row.cells] for row in table.rows]
 
+    @traced(cat='parser')
     def _extract_headings(self) -> List[Dict[str, str]]:
         """提取標題結構"""
         assert self.document is not None
         headings = []
         for para in self.document.paragraphs:
-            if para.style and para.style.name and para.style.name.startswith('Heading'):
+            if self._is_heading(para):
                 headings.append({
                     'level': para.style.name,
                     'text': para.text.strip()
                 })
         return headings
 
+    @staticmethod
+    def _is_heading(para) -> bool:
+        return bool(para.style and para.style.name and para.style.name.startswith('Heading'))
+
+    @traced(cat='parser')
+    def _extract_sections(self) -> List[Dict[str, str]]:
+        """依標題切分章節（標題前的內容歸入無標題章節，表格依文件順序併入）"""
+        assert self.document is not None
+        sections: List[Dict[str, Any]] = []
+        current: Dict[str, Any] = {'heading': '', 'level': '', 'lines': []}
+
+        for block in self.document.iter_inner_content():
+            if isinstance(block, Table):
+                table_text = format_table_rows(self._table_rows(block))
+                if table_text.strip():
+                    current['lines'].append(table_text)
+                continue
+
+            text = block.text.strip()
+            if self._is_heading(block):
+                if current['heading'] or current['lines']:
+                    sections.append(current)
+                current = {'heading': text, 'level': block.style.name, 'lines': []}
+            elif text:
+                current['lines'].append(text)
+
+        if current['heading'] or current['lines']:
+            sections.append(current)
+
+        return [
+            {'heading': s['heading'], 'level': s['level'], 'text': '\n'.join(s['lines'])}
+            for s in sections
+        ]
+
+    @traced(cat='parser')
     def _extract_full_text(self) -> str:
-        """提取完整文字（用於 AI 分析）"""
+        """提取完整文字（用於 AI 分析，表格依文件順序併入）"""
         assert self.document is not None
-        full_text = '\n'.join([para.text for para in self.document.paragraphs])
-        return full_text.strip()
+        blocks = [
+            format_table_rows(self._table_rows(block)) if isinstance(block, Table) else block.text
+            for block in self.document.iter_inner_content()
+        ]
+        return '\n'.join(blocks).strip()
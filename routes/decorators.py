@@ -2,6 +2,7 @@
 路由裝飾器模組
 抽取重複的檢查邏輯
 """
+import hashlib
 from functools import wraps
 from flask import jsonify, request, current_app
 
@@ -28,6 +29,39 @@ def require_task(f):
     return decorated
 
 
+def require_task_owner(f):
+    """
+    檢查任務是否存在且由目前的租戶建立的裝飾器（取消等會影響任務的操作）
+
+    租戶判斷與 require_api_key 相同：提供 API Key 時依其雜湊，否則依來源 IP；
+    未記錄租戶的任務（舊版建立）一律拒絕
+    """
+    @wraps(f)
+    def decorated(task_id, *args, **kwargs):
+        task_store = current_app.config['TASK_STORE']
+        task = task_store.get(task_id)
+
+        if not task:
+            return jsonify({'error': '找不到該任務'}), 404
+
+        if not task.get('tenant') or task['tenant'] != request_tenant():
+            return jsonify({'error': '無權限操作此任務（需使用建立任務時的 API Key 或來源 IP）'}), 403
+
+        return f(task_id, task, *args, **kwargs)
+    return decorated
+
+
+def request_tenant() -> str:
+    """
+    目前請求的租戶：使用者自己的 API Key 以其雜湊區分，使用伺服器的 Key 時以來源 IP 區分
+    （位於反向代理後方時需設定 TRUSTED_PROXY_HOPS，否則所有使用者都是代理的 IP）
+    """
+    api_key = request.headers.get('X-API-Key') or request.form.get('api_key')
+    if api_key:
+        return f"key:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]}"
+    return f"ip:{request.remote_addr}"
+
+
 def require_completed_task(f):
     """
     檢查任務是否存在且已完成的裝飾器
@@ -58,6 +92,9 @@ def require_api_key(f):
     檢查 API Key 的裝飾器
     優先從 Header 取得，其次從環境變數
 
+    同時設定 request.tenant（公平排程的租戶）：使用者自己的 API Key 以其雜湊區分，
+    使用伺服器的 Key 時以來源 IP 區分
+
     Header 格式: X-API-Key: your-api-key
     """
     @wraps(f)
@@ -71,6 +108,8 @@ def require_api_key(f):
         if not api_key:
             api_key = request.form.get('api_key')
 
+        request.tenant = request_tenant()
+
         # 最後從環境變數取得
         if not api_key:
             api_key = os.getenv('GEMINI_API_KEY')
@@ -84,3 +123,19 @@ def require_api_key(f):
         request.api_key = api_key
         return f(*args, **kwargs)
     return decorated
+
+
+def max_request_size(limit: int):
+    """
+    設定端點自己的請求大小上限（取代全域 MAX_CONTENT_LENGTH，由 IngestRequest 讀取）
+
+    使用方式:
+        @bp.route('/api/upload/batch', methods=['POST'])
+        @max_request_size(config.BATCH_MAX_REQUEST_BYTES)
+        def upload_batch():
+            ...
+    """
+    def decorator(f):
+        f.max_content_length = limit
+        return f
+    return decorator
@@ -2,13 +2,43 @@
 下載與預覽路由
 """
 import os
-from flask import Blueprint, jsonify, send_file
+from typing import Iterator
+from flask import Blueprint, Response, jsonify, request, send_file
 
-from .decorators import require_completed_task
+from .decorators import require_completed_task, require_task
+from knowledge_base import SnapshotStore
+import config
 
 download_bp = Blueprint('download', __name__)
 
 
+def _task_snapshot(task: dict) -> tuple[SnapshotStore, dict | None] | None:
+    """
+    任務完成時的知識庫版本快照
+
+    Returns:
+        (快照存儲, 版本清單)，版本清單為 None 表示快照已被清除；
+        沒有記錄版本號的舊任務回傳 None（沿用共用的知識庫檔案）
+    """
+    version = task.get('kb_version')
+    output_file = task.get('output_file')
+    if version is None or not output_file:
+        return None
+    snapshots = SnapshotStore(os.path.join(os.path.dirname(output_file), config.SNAPSHOT_DIR))
+    return snapshots, snapshots.manifest(version)
+
+
+def _stream_snapshot(snapshots: SnapshotStore, manifest: dict) -> Iterator[bytes]:
+    """
+    逐區塊送出快照；區塊只在版本過期超過寬限期後才刪除，下載途中仍被刪除時
+    （下載時間超過寬限期）結束傳輸，用戶端依 Content-Length 判斷內容不完整
+    """
+    try:
+        yield from snapshots.iter_chunks(manifest)
+    except FileNotFoundError:
+        print(f"⚠️ 知識庫快照 v{manifest['version']} 的區塊在下載途中被清除，傳輸中止")
+
+
 @download_bp.route('/api/download/<task_id>', methods=['GET'])
 @require_completed_task
 def download_result(task_id: str, task: dict):
@@ -19,8 +49,20 @@ def download_result(task_id: str, task: dict):
         task_id: 任務 ID
 
     Returns:
-        下載的 Markdown 檔案
+        下載的 Markdown 檔案（任務完成當下的知識庫版本）
     """
+    snapshot = _task_snapshot(task)
+    if snapshot is not None:
+        snapshots, manifest = snapshot
+        if manifest is None or not snapshots.has_chunks(manifest):
+            return jsonify({'error': '此版本的知識庫快照已被清除'}), 404
+
+        response = Response(_stream_snapshot(snapshots, manifest), mimetype='text/markdown')
+        response.headers['Content-Disposition'] = 'attachment; filename=knowledge_base.md'
+        response.headers['Content-Length'] = str(manifest['size'])
+        response.set_etag(manifest['sha256'])
+        return response.make_conditional(request)
+
     output_file = task.get('output_file')
 
     if not output_file or not os.path.exists(output_file):
@@ -35,29 +77,50 @@ def download_result(task_id: str, task: dict):
 
 
 @download_bp.route('/api/preview/<task_id>', methods=['GET'])
-@require_completed_task
+@require_task
 def preview_result(task_id: str, task: dict):
     """
     預覽結果內容 API
 
+    任務完成時回傳知識庫檔案內容；AI 分析中則回傳目前已產生的部分內容
+
     Args:
         task_id: 任務 ID
 
     Returns:
         content: 預覽內容
         truncated: 是否被截斷
+        partial: 是否為分析中的部分內容
     """
-    output_file = task.get('output_file')
-
-    if not output_file or not os.path.exists(output_file):
-        return jsonify({'error': '找不到輸出檔案'}), 404
+    if task['status'] != 'completed':
+        partial = task.get('partial_content')
+        if not partial:
+            return jsonify({'error': '任務尚未完成'}), 400
+        return jsonify({
+            'content': partial,
+            'truncated': len(partial) >= config.PARTIAL_CONTENT_MAX_CHARS,
+            'partial': True
+        }), 200
 
     # 讀取內容（限制預覽大小）
     max_preview_size = 10000
-    with open(output_file, 'r', encoding='utf-8') as f:
-        content = f.read(max_preview_size)
+    snapshot = _task_snapshot(task)
+    if snapshot is not None:
+        snapshots, manifest = snapshot
+        content = snapshots.read(manifest['version'], max_preview_size) if manifest else None
+        if content is None:
+            return jsonify({'error': '此版本的知識庫快照已被清除'}), 404
+    else:
+        output_file = task.get('output_file')
+
+        if not output_file or not os.path.exists(output_file):
+            return jsonify({'error': '找不到輸出檔案'}), 404
+
+        with open(output_file, 'r', encoding='utf-8') as f:
+            content = f.read(max_preview_size)
 
     return jsonify({
         'content': content,
-        'truncated': len(content) >= max_preview_size
+        'truncated': len(content) >= max_preview_size,
+        'partial': False
     }), 200
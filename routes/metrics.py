@@ -0,0 +1,19 @@
+"""
+執行指標路由
+"""
+from flask import Blueprint, Response
+
+from metrics import CONTENT_TYPE, get_metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Prometheus 指標 API
+
+    Returns:
+        Prometheus 文字格式的指標（各階段耗時、管線佇列、Gemini 延遲與用量、任務存儲延遲）
+    """
+    return Response(get_metrics().render(), mimetype=None, content_type=CONTENT_TYPE)
@@ -1,9 +1,17 @@
 """
 任務管理路由
 """
-from flask import Blueprint, jsonify, current_app
+import json
+import os
+import time
 
-from .decorators import require_task
+from flask import Blueprint, Response, jsonify, current_app, request, send_file, stream_with_context
+from pydantic import ValidationError
+
+from .decorators import require_task, require_task_owner
+from services.task_store import TERMINAL_STATUSES
+from services.validators import TaskListQuery
+import config
 
 tasks_bp = Blueprint('tasks', __name__)
 
@@ -18,21 +26,124 @@ def get_task_status(task_id: str, task: dict):
         task_id: 任務 ID
 
     Returns:
-        任務狀態資訊
+        任務狀態資訊（不含追蹤紀錄）
+    """
+    return jsonify(_public(task)), 200
+
+
+@tasks_bp.route('/api/status/<task_id>/stream', methods=['GET'])
+@require_task
+def stream_task_status(task_id: str, task: dict):
+    """
+    任務狀態串流 API（Server-Sent Events）
+
+    每次狀態變更推送一則 data 事件，任務結束（completed / failed / cancelled）後關閉串流
+
+    Args:
+        task_id: 任務 ID
+
+    Returns:
+        text/event-stream 回應
+    """
+    task_store = current_app.config['TASK_STORE']
+
+    def generate():
+        deadline = time.monotonic() + config.STATUS_STREAM_MAX_SECONDS
+        for snapshot in task_store.watch(task_id, timeout=config.STATUS_STREAM_KEEPALIVE):
+            if snapshot is None:
+                yield ': keep-alive\n\n'
+            else:
+                yield f"data: {json.dumps(_public(snapshot), ensure_ascii=False)}\n\n"
+                if snapshot.get('status') in TERMINAL_STATUSES:
+                    return
+            if time.monotonic() >= deadline:
+                return
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@tasks_bp.route('/api/tasks/<task_id>', methods=['DELETE'])
+@require_task_owner
+def cancel_task(task_id: str, task: dict):
+    """
+    取消任務 API（只能取消排隊中、尚未開始解析的任務）
+
+    批次父任務會取消所有尚未開始的子任務，已開始的子任務照常完成並合併；
+    只有建立任務的租戶（相同 X-API-Key，或未提供時相同來源 IP）可以取消
+
+    Args:
+        task_id: 任務 ID
+
+    Returns:
+        取消後的任務狀態；任務已開始處理或已結束時回傳 409
     """
-    return jsonify(task), 200
+    if task.get('status') in TERMINAL_STATUSES:
+        return jsonify({'error': f"任務已結束（{task.get('status')}），無法取消"}), 409
+
+    processor = current_app.config['DOCUMENT_PROCESSOR']
+    if not processor.cancel(task_id):
+        return jsonify({'error': '任務已開始處理，只能取消排隊中的任務'}), 409
+
+    task_store = current_app.config['TASK_STORE']
+    return jsonify(_public(task_store.get(task_id) or task)), 200
+
+
+@tasks_bp.route('/api/tasks/<task_id>/trace', methods=['GET'])
+@require_task
+def get_task_trace(task_id: str, task: dict):
+    """
+    任務追蹤紀錄 API（上傳時指定 trace 的任務）
+
+    Args:
+        task_id: 任務 ID
+
+    Returns:
+        Chrome trace-event 格式的 JSON，可用 chrome://tracing 或 Perfetto 開啟
+    """
+    if not task.get('trace_mode'):
+        return jsonify({'error': '此任務未啟用追蹤（上傳時指定 trace=1 或 X-Trace 標頭）'}), 404
+    trace_file = task.get('trace_file')
+    if not trace_file:
+        return jsonify({'error': '任務尚未結束，追蹤紀錄尚未產生'}), 409
+    if not os.path.exists(trace_file):
+        return jsonify({'error': '追蹤紀錄已清除'}), 404
+
+    response = send_file(os.path.abspath(trace_file), mimetype='application/json', as_attachment=True,
+                         download_name=f'trace-{task_id}.json')
+    return response
 
 
 @tasks_bp.route('/api/tasks', methods=['GET'])
 def list_tasks():
     """
-    列出所有任務 API
+    列出任務 API（依建立時間由新到舊分頁）
+
+    Query:
+        limit: 每頁筆數（1-200，預設 50）
+        cursor: 上一頁回傳的 next_cursor
+        status: 只列出此狀態的任務
+        since: 只列出此時間（ISO 8601）之後建立的任務
 
     Returns:
         tasks: 任務列表
+        next_cursor: 下一頁游標，沒有下一頁時為 null
     """
+    try:
+        query = TaskListQuery(**request.args.to_dict())
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+
     task_store = current_app.config['TASK_STORE']
-    all_tasks = task_store.get_all()
+    try:
+        page, next_cursor = task_store.list(
+            cursor=query.cursor, limit=query.limit, status=query.status, since=query.since
+        )
+    except ValueError as e:
+        return jsonify({'error': f'無效的查詢參數: {e}'}), 400
 
     tasks = [
         {
@@ -41,10 +152,12 @@ def list_tasks():
             'status': task['status'],
             'created_at': task['created_at']
         }
-        for task in all_tasks
+        for task in page
     ]
 
-    # 按建立時間排序
-    tasks.sort(key=lambda x: x['created_at'], reverse=True)
+    return jsonify({'tasks': tasks, 'next_cursor': next_cursor}), 200
+
 
-    return jsonify({'tasks': tasks}), 200
+def _public(task: dict) -> dict:
+    """狀態回應不含追蹤紀錄路徑（由 /api/tasks/<task_id>/trace 取得）與租戶"""
+    return {key: value for key, value in task.items() if key not in ('trace_file', 'tenant')}
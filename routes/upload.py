@@ -3,13 +3,19 @@
 """
 import os
 import uuid
+import zipfile
 from datetime import datetime
 from flask import Blueprint, request, jsonify, current_app
+from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 from pydantic import ValidationError
 
-from .decorators import require_api_key
-from services.validators import UploadRequest
+from .decorators import max_request_size, require_api_key
+from services.ingest import UploadRejected, ingest_upload, inspect_upload, save_upload
+from services.job_queue import BatchFile
+from services.validators import UploadRequest, document_key
+from tracing import parse_mode
+import config
 
 upload_bp = Blueprint('upload', __name__)
 
@@ -29,11 +35,15 @@ def upload_file():
 
     Headers:
         X-API-Key: Gemini API Key
+        X-Trace: 同 trace 參數（選填）
 
     Form Data:
         file: 上傳的檔案 (.docx 或 .pptx)
         mode: 處理模式 (new 或 append，預設 append)
         model: AI 模型名稱 (預設 gemini-2.5-flash-lite)
+        trace: 1 記錄各階段追蹤，profile 另取樣呼叫堆疊（選填，見 /api/tasks/<task_id>/trace）
+        document: 文件的邏輯名稱（選填，預設為檔名），同一文件重新上傳時只提取變更的投影片/章節，
+                  並移除已刪除部分獨有的條目
 
     Returns:
         success: 是否成功
@@ -58,30 +68,42 @@ def upload_file():
     try:
         upload_request = UploadRequest(
             mode=request.form.get('mode', 'append'),
-            model=request.form.get('model', 'gemini-2.5-flash-lite')
+            model=request.form.get('model', 'gemini-2.5-flash-lite'),
+            document=request.form.get('document')
         )
     except ValidationError as e:
         return jsonify({'error': str(e)}), 400
 
-    try:
-        # 儲存檔案
-        filename = secure_filename(original_filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        unique_filename = f"{timestamp}_{filename}"
-        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
+    # 小型內容直接交給處理器，僅佇列模式會寫入此路徑供 worker 讀取；大型內容分段寫入此路徑
+    # 路徑使用 secure_filename，顯示與來源名稱保留原始檔名（secure_filename 會刪除中文字元）
+    filename = document_key(original_filename) or secure_filename(original_filename)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    unique_filename = f"{timestamp}_{uuid.uuid4().hex[:8]}_{secure_filename(original_filename)}"
+    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
 
+    # 檢查內容（大小、檔頭、文件結構）並取得雜湊
+    try:
         # 確保上傳目錄存在
         os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
-        file.save(file_path)
+        upload = ingest_upload(file, original_filename, file_path)
+    except UploadRejected as e:
+        return jsonify({'error': str(e)}), 400
 
+    try:
         # 建立任務
         task_id = str(uuid.uuid4())
+        trace = parse_mode(request.form.get('trace') or request.headers.get('X-Trace'))
+        document = upload_request.document or filename
         task_store = current_app.config['TASK_STORE']
         task_store.set(task_id, {
             'task_id': task_id,
             'filename': filename,
+            'document': document,
             'status': 'queued',
             'message': '任務已加入佇列',
+            'content_sha256': upload.sha256,
+            'trace_mode': trace,
+            'tenant': request.tenant,
             'created_at': datetime.now().isoformat()
         })
 
@@ -93,7 +115,11 @@ def upload_file():
             filename=filename,
             mode=upload_request.mode,
             api_key=request.api_key,
-            model=upload_request.model
+            model=upload_request.model,
+            content=upload.content,
+            trace=trace,
+            tenant=request.tenant,
+            document=document
         )
 
         return jsonify({
@@ -104,3 +130,181 @@ def upload_file():
 
     except Exception as e:
         return jsonify({'error': f'上傳失敗: {str(e)}'}), 500
+
+
+@upload_bp.route('/api/upload/batch', methods=['POST'])
+@max_request_size(config.BATCH_MAX_REQUEST_BYTES)
+@require_api_key
+def upload_batch():
+    """
+    批次上傳 API：各檔案並行解析與提取，全部完成後一次合併至知識庫
+
+    Headers:
+        X-API-Key: Gemini API Key
+
+    Form Data:
+        files: 多個檔案（.docx / .pptx，或內含這些檔案的 .zip）；整個請求上限 BATCH_MAX_REQUEST_BYTES，
+               各文件上限 UPLOAD_MAX_FILE_BYTES
+        mode: 處理模式 (new 或 append，預設 append)
+        model: AI 模型名稱 (預設 gemini-2.5-flash-lite)
+
+    Returns:
+        success: 是否成功
+        batch_id: 父任務 ID（可用 /api/status/<batch_id> 查詢整體進度）
+        tasks: 各檔案的子任務 (task_id, filename)
+        skipped: 與批次中其他檔案內容相同而略過的檔名
+        message: 訊息
+    """
+    uploads = [f for f in request.files.getlist('files') + request.files.getlist('file')
+               if f.filename]
+    if not uploads:
+        return jsonify({'error': '沒有上傳檔案'}), 400
+
+    for file in uploads:
+        if not (_is_zip(file.filename) or allowed_file(file.filename)):
+            return jsonify({
+                'error': f'不支援的檔案格式: {file.filename}，請上傳 .docx、.pptx 或 .zip'
+            }), 400
+
+    try:
+        upload_request = UploadRequest(
+            mode=request.form.get('mode', 'append'),
+            model=request.form.get('model', 'gemini-2.5-flash-lite')
+        )
+    except ValidationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    batch_id = str(uuid.uuid4())
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    os.makedirs(upload_folder, exist_ok=True)
+    prefix = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{batch_id[:8]}"
+
+    files: list[BatchFile] = []
+    skipped: list[str] = []
+    try:
+        _collect_batch_files(uploads, upload_folder, prefix, files, skipped)
+        if not files:
+            raise ValueError('上傳內容中沒有 .docx 或 .pptx 檔案')
+    except Exception as e:
+        for file in files:
+            if os.path.exists(file.file_path):
+                os.remove(file.file_path)
+        if isinstance(e, ValueError):
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'error': f'上傳失敗: {str(e)}'}), 500
+
+    # 建立父任務與子任務
+    task_store = current_app.config['TASK_STORE']
+    created_at = datetime.now().isoformat()
+
+    task_store.set(batch_id, {
+        'task_id': batch_id,
+        'filename': f'{len(files)} 個檔案',
+        'status': 'queued',
+        'message': '批次任務已加入佇列',
+        'created_at': created_at,
+        'children': [file.task_id for file in files],
+        'files_total': len(files),
+        'files_done': 0,
+        'files_failed': 0,
+        'files_skipped': skipped,
+        'tenant': request.tenant,
+    })
+    for file in files:
+        task_store.set(file.task_id, {
+            'task_id': file.task_id,
+            'filename': file.filename,
+            'status': 'queued',
+            'message': '任務已加入佇列',
+            'content_sha256': file.sha256,
+            'created_at': created_at,
+            'batch_id': batch_id,
+            'tenant': request.tenant,
+        })
+
+    processor = current_app.config['DOCUMENT_PROCESSOR']
+    processor.process_batch_async(
+        batch_id=batch_id,
+        files=files,
+        mode=upload_request.mode,
+        api_key=request.api_key,
+        model=upload_request.model,
+        tenant=request.tenant
+    )
+
+    return jsonify({
+        'success': True,
+        'batch_id': batch_id,
+        'task_id': batch_id,
+        'tasks': [{'task_id': file.task_id, 'filename': file.filename} for file in files],
+        'skipped': skipped,
+        'message': f'已上傳 {len(files)} 個檔案，開始處理'
+    }), 200
+
+
+def _is_zip(filename: str) -> bool:
+    return filename.lower().endswith('.zip')
+
+
+def _collect_batch_files(uploads: list[FileStorage], folder: str, prefix: str,
+                         files: list[BatchFile], skipped: list[str]) -> None:
+    """
+    檢查批次上傳的檔案：直接上傳的檔案保留在記憶體（大型檔案分段寫入上傳目錄），
+    zip 內的 .docx / .pptx 逐一解出至上傳目錄（其餘檔案略過）；與先前檔案內容相同（SHA-256 相同）者略過
+
+    Args:
+        uploads: 上傳的檔案
+        folder: 上傳目錄（zip 解出的檔案與佇列模式下的檔案路徑）
+        prefix: 儲存檔名前綴
+        files: 逐一加入 BatchFile，失敗時呼叫端據此清理已寫入的檔案
+        skipped: 逐一加入因內容重複而略過的檔名
+
+    Raises:
+        ValueError: 檔案數或解壓後大小超過上限、內容不合法、zip 損毀
+    """
+    seen: set[str] = set()
+
+    def target(name: str) -> str:
+        # 以序號區分同名檔案
+        if len(files) >= config.BATCH_MAX_FILES:
+            raise ValueError(f'單一批次最多 {config.BATCH_MAX_FILES} 個檔案')
+        return os.path.join(folder, f"{prefix}_{len(files):03d}_{secure_filename(name)}")
+
+    def add(path: str, name: str, sha256: str, content: bytes | None = None) -> None:
+        if sha256 in seen:
+            skipped.append(secure_filename(name))
+            if content is None:
+                os.remove(path)
+            return
+        seen.add(sha256)
+        files.append(BatchFile(task_id=str(uuid.uuid4()), file_path=path,
+                               filename=secure_filename(name), content=content, sha256=sha256))
+
+    for upload in uploads:
+        if not _is_zip(upload.filename):
+            path = target(upload.filename)
+            item = ingest_upload(upload, path=path)
+            add(path, upload.filename, item.sha256, item.content)
+            continue
+
+        inspect_upload(upload)
+        try:
+            archive = zipfile.ZipFile(upload.stream)
+        except zipfile.BadZipFile:
+            raise ValueError(f'無法讀取 zip 檔案: {upload.filename}')
+
+        with archive:
+            members = [info for info in archive.infolist()
+                       if not info.is_dir() and allowed_file(info.filename)
+                       and not info.filename.startswith('__MACOSX/')
+                       and not os.path.basename(info.filename).startswith('.')]
+            # 以標頭宣告的大小預先檢查，解壓時 zipfile 不會讀出超過宣告大小的內容
+            if sum(info.file_size for info in members) > config.BATCH_MAX_UNCOMPRESSED_BYTES:
+                raise ValueError(f'zip 解壓後超過 {config.BATCH_MAX_UNCOMPRESSED_BYTES} bytes 上限')
+
+            for info in members:
+                name = os.path.basename(info.filename)
+                path = target(name)
+                with archive.open(info) as source:
+                    sha256 = save_upload(source, path, name)
+                add(path, name, sha256)
@@ -1,15 +1,32 @@
 """
 服務層模組
 """
-from .task_store import TaskStore, MemoryTaskStore, RedisTaskStore, create_task_store
-from .document_processor import DocumentProcessor, get_executor, shutdown_executor
+from .task_store import (
+    TaskStore, MemoryTaskStore, RedisTaskStore, create_task_store, TERMINAL_STATUSES
+)
+from .job_queue import BatchFile, Job, JobQueue, SQLiteJobQueue, RedisJobQueue, create_job_queue
+from .ingest import IngestRequest, UploadRejected, sweep_orphaned_uploads
+from .document_processor import (
+    DocumentProcessor, get_pipeline, get_executor, shutdown_executor
+)
 
 __all__ = [
     'TaskStore',
     'MemoryTaskStore',
     'RedisTaskStore',
     'create_task_store',
+    'TERMINAL_STATUSES',
+    'BatchFile',
+    'Job',
+    'JobQueue',
+    'SQLiteJobQueue',
+    'RedisJobQueue',
+    'create_job_queue',
+    'IngestRequest',
+    'UploadRejected',
+    'sweep_orphaned_uploads',
     'DocumentProcessor',
+    'get_pipeline',
     'get_executor',
     'shutdown_executor',
 ]
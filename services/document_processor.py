@@ -2,78 +2,327 @@
 文件處理服務
 負責文件解析、AI 分析、知識庫合併
 """
+import io
+import json
 import os
+import threading
+import time
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, Future
-from typing import Callable
+from dataclasses import dataclass, field, replace
+from typing import Any, Callable, Dict, List, Tuple
 
 from parsers import WordParser, PPTParser
 from analyzer import PhraseExtractor
-from knowledge_base import KnowledgeBaseMerger, DifyFormatter
+from analyzer.chunker import document_units
+from analyzer.extraction_cache import create_extraction_cache
+from knowledge_base import (DocumentRevision, KBEntry, KnowledgeBaseStore, KnowledgeBaseWriter,
+                            unit_fingerprint)
+from knowledge_base.merger import atomic_write
+from .job_queue import BatchFile, Job, JobQueue, seal_api_key
+from .pipeline import PipelineJob, StagedPipeline
+from metrics import get_metrics
+from tracing import Tracer, activate, run_traced, span
 import config
 
-# 全域執行緒池
-_executor: ThreadPoolExecutor | None = None
+# 全域處理管線
+_pipeline: StagedPipeline | None = None
 
 
-def get_executor(max_workers: int = 4) -> ThreadPoolExecutor:
-    """取得或建立執行緒池"""
-    global _executor
-    if _executor is None:
-        _executor = ThreadPoolExecutor(max_workers=max_workers)
-    return _executor
+def get_pipeline() -> StagedPipeline:
+    """取得或建立處理管線（延遲建立，避免在 fork 前啟動行程池）"""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = StagedPipeline()
+    return _pipeline
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """取得 AI 分析階段的執行緒池"""
+    return get_pipeline().analyze_executor
 
 
 def shutdown_executor(wait: bool = True) -> None:
-    """關閉執行緒池"""
-    global _executor
-    if _executor:
-        _executor.shutdown(wait=wait)
-        _executor = None
+    """關閉處理管線"""
+    global _pipeline
+    if _pipeline:
+        _pipeline.shutdown(wait=wait)
+        _pipeline = None
+
+
+def parse_document(source: str | bytes, filename: str) -> dict:
+    """
+    解析文件並回傳結構化內容（含 full_text）
+
+    為模組層級函數，可在解析行程池中執行
+
+    Args:
+        source: 文件路徑或上傳的內容
+        filename: 原始檔名
+    """
+    file_ext = os.path.splitext(filename)[1].lower()
+    document = io.BytesIO(source) if isinstance(source, bytes) else source
+
+    with span('parse_document', cat='parse', filename=filename,
+              bytes=len(source) if isinstance(source, bytes) else None):
+        if file_ext == '.docx':
+            parser = WordParser(document, file_name=filename)
+            return parser.parse()
+        elif file_ext == '.pptx':
+            parser = PPTParser(document, file_name=filename)
+            return parser.parse()
+        else:
+            raise ValueError(f"不支援的檔案格式: {file_ext}")
+
+
+def parsed_chars(result: Any) -> int:
+    """解析結果的字元數（公平排程的處理量），追蹤模式下結果為 (解析結果, 追蹤紀錄)"""
+    if isinstance(result, tuple):
+        result = result[0]
+    return len(result.get('full_text') or '') if isinstance(result, dict) else 0
+
+
+@dataclass
+class _BatchState:
+    """批次處理中各子任務的提取結果"""
+    files: List[BatchFile]
+    results: Dict[str, List[KBEntry]] = field(default_factory=dict)
+    failed: int = 0
+    cancelled: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def finish(self, file: BatchFile, entries: List[KBEntry] | None,
+               cancelled: bool = False) -> Tuple[int, bool]:
+        """
+        記錄子任務結果（None 表示失敗或已取消）
+
+        Returns:
+            (已結束的子任務數, 是否為最後一個)
+        """
+        with self.lock:
+            if cancelled:
+                self.cancelled += 1
+            elif entries is None:
+                self.failed += 1
+            else:
+                self.results[file.task_id] = entries
+            finished = len(self.results) + self.failed + self.cancelled
+            return finished, finished == len(self.files)
 
 
 class DocumentProcessor:
     """文件處理器"""
 
-    def __init__(self, task_store, output_folder: str):
+    def __init__(self, task_store, output_folder: str, job_queue: JobQueue | None = None):
         """
         初始化文件處理器
 
         Args:
             task_store: 任務存儲實例
             output_folder: 輸出資料夾路徑
+            job_queue: 持久化工作佇列，設定後 process_async 只入列，由 worker 處理
         """
         self.task_store = task_store
         self.output_folder = output_folder
+        self.job_queue = job_queue
+        self.extraction_cache = create_extraction_cache(os.path.join(output_folder, 'cache'))
 
     def process_async(self, task_id: str, file_path: str, filename: str,
                       mode: str = 'append', api_key: str | None = None,
-                      model: str | None = None) -> Future:
+                      model: str | None = None, content: bytes | None = None,
+                      trace: str | None = None, tenant: str | None = None,
+                      document: str | None = None) -> Future:
         """
         非同步處理文件
 
         Args:
             task_id: 任務 ID
-            file_path: 上傳的文件路徑
+            file_path: 上傳的文件路徑（提供 content 時只在佇列模式下寫入）
             filename: 原始檔名
             mode: new 或 append
             api_key: Gemini API Key
             model: 模型名稱
+            content: 上傳的內容，提供時直接交給解析行程，不經過檔案
+            trace: 追蹤模式（spans / profile），完成時將追蹤紀錄存入任務
+            tenant: 公平排程的租戶（API Key 或來源 IP），同一租戶的任務共用處理量
+            document: 文件的邏輯名稱，提供時只提取與上一版相比變更或新增的單元
 
         Returns:
-            Future 物件
+            Future 物件（佇列模式下為已完成的 Future，結果為 job_id）
         """
-        executor = get_executor()
-        return executor.submit(
-            self._process_document,
-            task_id, file_path, filename, mode, api_key, model
+        if self.job_queue is not None:
+            future: Future = Future()
+            try:
+                sealed_key = seal_api_key(api_key)
+            except ValueError as e:
+                self._mark_failed(task_id, e)
+                future.set_exception(e)
+                return future
+            if content is not None:
+                self._spool(file_path, content)
+            future.set_result(self.job_queue.enqueue(Job(
+                task_id=task_id, file_path=file_path, filename=filename,
+                mode=mode, api_key=sealed_key, model=model, trace=trace, document=document
+            )))
+            return future
+
+        def on_cancel() -> None:
+            self._mark_cancelled(task_id)
+            if content is None and os.path.exists(file_path):
+                os.remove(file_path)
+
+        tracer = self._tracer(trace)
+        parse_fn, parse_args, unwrap = self._parse_call(
+            file_path if content is None else content, filename, tracer
         )
+        return get_pipeline().submit(PipelineJob(
+            parse_fn=parse_fn,
+            parse_args=parse_args,
+            on_start=lambda: self._update_status(task_id, 'parsing', '正在解析文件...'),
+            on_parsed=lambda parse_future: self._analyze_document(
+                task_id, lambda: unwrap(parse_future.result()),
+                file_path if content is None else None, filename, mode, api_key, model,
+                tracer=tracer, document=document
+            ),
+            key=task_id,
+            tenant=tenant or '',
+            measure=parsed_chars,
+            on_cancel=on_cancel,
+        ))
+
+    def process_batch_async(self, batch_id: str, files: List[BatchFile],
+                            mode: str = 'append', api_key: str | None = None,
+                            model: str | None = None, tenant: str | None = None) -> Future:
+        """
+        非同步處理批次上傳：各檔案並行解析與提取，全部結束後一次合併至知識庫
+
+        Args:
+            batch_id: 父任務 ID
+            files: 各子任務的檔案
+            mode: new 或 append（new 只在合併時清空一次）
+            api_key: Gemini API Key
+            model: 模型名稱
+            tenant: 公平排程的租戶，各檔案以 FAIR_BATCH_WEIGHT 的權重排隊
+
+        Returns:
+            Future 物件（合併完成時完成；佇列模式下為已完成的 Future，結果為 job_id）
+        """
+        if self.job_queue is not None:
+            future: Future = Future()
+            try:
+                sealed_key = seal_api_key(api_key)
+            except ValueError as e:
+                for task_id in [batch_id, *(file.task_id for file in files)]:
+                    self._mark_failed(task_id, e)
+                for file in files:
+                    if file.content is None and os.path.exists(file.file_path):
+                        os.remove(file.file_path)
+                future.set_exception(e)
+                return future
+            spooled = []
+            for file in files:
+                if file.content is not None:
+                    self._spool(file.file_path, file.content)
+                spooled.append(replace(file, content=None))
+            future.set_result(self.job_queue.enqueue(Job(
+                task_id=batch_id, file_path='', filename='', mode=mode,
+                api_key=sealed_key, model=model, files=spooled
+            )))
+            return future
+
+        state = _BatchState(files)
+        done: Future = Future()
+
+        def finish(file: BatchFile, entries: List[KBEntry] | None, cancelled: bool = False) -> None:
+            if self._finish_batch_file(batch_id, state, file, entries, cancelled):
+                self._merge_batch(batch_id, state, mode, api_key, model)
+                done.set_result(batch_id)
+
+        def on_parsed(file: BatchFile, parse_future: Future) -> None:
+            # 解析完成後即釋放上傳內容
+            file.content = None
+            finish(file, self._extract_batch_file(file, parse_future.result, api_key, model))
+
+        def on_cancel(file: BatchFile) -> None:
+            file.content = None
+            self._mark_cancelled(file.task_id)
+            # 最後一個結束的子任務負責合併，不在取消請求的執行緒中進行
+            get_executor().submit(finish, file, None, True)
+
+        for file in files:
+            get_pipeline().submit(PipelineJob(
+                parse_fn=parse_document,
+                parse_args=(file.file_path if file.content is None else file.content,
+                            file.filename),
+                on_start=lambda file=file: self._update_status(
+                    file.task_id, 'parsing', '正在解析文件...'
+                ),
+                on_parsed=lambda parse_future, file=file: on_parsed(file, parse_future),
+                key=file.task_id,
+                tenant=tenant or '',
+                weight=config.FAIR_BATCH_WEIGHT,
+                measure=parsed_chars,
+                on_cancel=lambda file=file: on_cancel(file),
+            ))
+        return done
+
+    def cancel(self, task_id: str) -> bool:
+        """
+        取消排隊中（尚未開始解析）的任務，批次父任務會取消所有尚未開始的子任務
+
+        佇列模式下只能取消整個工作仍在佇列中的任務（單一文件或整個批次）
+
+        Returns:
+            是否已取消
+        """
+        task = self.task_store.get(task_id) or {}
+        children = task.get('children') or []
+
+        if self.job_queue is not None:
+            job = self.job_queue.cancel(task_id)
+            if job is None:
+                return False
+            for path in [job.file_path, *(file.file_path for file in job.files or [])]:
+                if path and os.path.exists(path):
+                    os.remove(path)
+            for child_id in children:
+                self._mark_cancelled(child_id)
+            self._mark_cancelled(task_id)
+            return True
+
+        if children:
+            # 全部子任務都取消時，父任務於合併階段標記為已取消
+            return sum(get_pipeline().cancel(child_id) for child_id in children) > 0
+        return get_pipeline().cancel(task_id)
+
+    def _process_batch(self, batch_id: str, files: List[BatchFile], mode: str = 'append',
+                       api_key: str | None = None, model: str | None = None) -> None:
+        """
+        同步處理批次（worker 使用）：以執行緒池並行解析與提取後一次合併
+
+        Args:
+            同 process_batch_async
+        """
+        state = _BatchState(files)
+
+        def run(file: BatchFile) -> None:
+            self._update_status(file.task_id, 'parsing', '正在解析文件...')
+            entries = self._extract_batch_file(
+                file, lambda: self._parse_file(file.file_path, file.filename), api_key, model
+            )
+            self._finish_batch_file(batch_id, state, file, entries)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(files), config.ANALYZE_WORKERS)),
+                                thread_name_prefix='batch') as pool:
+            list(pool.map(run, files))
+        self._merge_batch(batch_id, state, mode, api_key, model)
 
     def _process_document(self, task_id: str, file_path: str, filename: str,
                           mode: str = 'append', api_key: str | None = None,
-                          model: str | None = None) -> None:
+                          model: str | None = None, trace: str | None = None,
+                          document: str | None = None) -> None:
         """
-        處理文件的核心邏輯
+        同步處理文件（在目前執行緒中解析與分析）
 
         Args:
             task_id: 任務 ID
@@ -82,80 +331,343 @@ class DocumentProcessor:
             mode: new 或 append
             api_key: Gemini API Key
             model: 模型名稱
+            trace: 追蹤模式（spans / profile）
+            document: 文件的邏輯名稱（增量重新匯入）
         """
-        try:
-            # 更新狀態：解析中
-            self._update_status(task_id, 'parsing', '正在解析文件...')
-
-            # 步驟 1: 解析文件
-            content = self._parse_file(file_path, filename)
-
-            # 更新狀態：分析中
-            self._update_status(
-                task_id, 'analyzing',
-                f'文件解析完成 ({len(content)} 字元)，AI 分析中...'
-            )
-
-            # 步驟 2: AI 分析提取
-            extractor = PhraseExtractor(api_key=api_key, model=model)
-            extracted_content = extractor.extract(content)
-
-            # 更新狀態：合併中
-            self._update_status(task_id, 'merging', '正在合併知識庫...')
+        self._update_status(task_id, 'parsing', '正在解析文件...')
+        self._analyze_document(
+            task_id, lambda: self._parse_file(file_path, filename),
+            file_path, filename, mode, api_key, model, tracer=self._tracer(trace),
+            document=document
+        )
 
-            # 步驟 3: 處理增量更新
-            output_path = os.path.join(self.output_folder, config.OUTPUT_FILENAME)
-            merger = KnowledgeBaseMerger(output_path)
+    def _analyze_document(self, task_id: str, get_parsed: Callable[[], dict],
+                          file_path: str | None, filename: str, mode: str = 'append',
+                          api_key: str | None = None, model: str | None = None,
+                          tracer: Tracer | None = None, document: str | None = None) -> None:
+        """
+        處理文件的核心邏輯（解析之後的 AI 分析、合併與儲存）
 
-            if mode == 'append':
-                existing_kb = merger.load_existing()
-                if existing_kb:
-                    final_content = extractor.merge_with_existing(existing_kb, extracted_content)
-                else:
-                    final_content = extracted_content
-            else:
-                final_content = extracted_content
+        Args:
+            task_id: 任務 ID
+            get_parsed: 取得解析結果（解析失敗時拋出例外）
+            file_path: 上傳的文件路徑（內容未寫入檔案時為 None）
+            filename: 原始檔名
+            mode: new 或 append
+            api_key: Gemini API Key
+            model: 模型名稱
+            tracer: 追蹤器，結束時將紀錄存入任務（先於最終狀態寫入）
+            document: 文件的邏輯名稱，提供時只提取與上一版相比變更或新增的單元
+        """
+        try:
+            with activate(tracer):
+                entries, extractor, revision = self._extract_entries(
+                    task_id, get_parsed, api_key, model, document=document, mode=mode
+                )
+                # 增量提取時變更的單元可能沒有任何條目，仍需寫入以移除已刪除單元的條目
+                incremental = revision is not None and \
+                    len(revision.extracted) < len(set(revision.fingerprints))
+                if not entries and not incremental:
+                    raise ValueError("無法從 AI 回應中解析出任何話術條目")
 
-            # 步驟 4: 格式化並儲存
-            formatted_content = DifyFormatter.format(final_content)
-            merger.save(formatted_content, filename)
+                # 更新狀態：合併中
+                self._update_status(task_id, 'merging', '正在合併知識庫...')
+                merged = self._merge_entries(entries, filename, mode, extractor,
+                                             revision=revision)
 
             # 更新狀態：完成
             self.task_store.update(task_id, {
                 'status': 'completed',
                 'message': '處理完成！',
-                'output_file': output_path,
-                'content_size': len(formatted_content),
+                **merged,
+                'entries_extracted': len(entries),
+                'cache': dict(extractor.cache_stats),
+                'gemini': extractor.gemini_stats,
+                'partial_content': None,
+                **self._trace_fields(task_id, tracer),
                 'completed_at': datetime.now().isoformat()
             })
 
         except Exception as e:
             # 更新狀態：失敗
-            self.task_store.update(task_id, {
-                'status': 'failed',
-                'message': f'錯誤: {str(e)}',
-                'error': str(e)
-            })
+            if tracer is not None:
+                self.task_store.update(task_id, self._trace_fields(task_id, tracer))
+            self._mark_failed(task_id, e)
 
         finally:
             # 清理上傳的檔案
-            if os.path.exists(file_path):
+            if file_path and os.path.exists(file_path):
                 os.remove(file_path)
 
-    def _parse_file(self, file_path: str, filename: str) -> str:
-        """解析文件並回傳文字內容"""
-        file_ext = os.path.splitext(filename)[1].lower()
+    def _extract_entries(self, task_id: str, get_parsed: Callable[[], dict],
+                         api_key: str | None, model: str | None,
+                         document: str | None = None, mode: str = 'append'
+                         ) -> Tuple[List[KBEntry], PhraseExtractor, DocumentRevision | None]:
+        """
+        解析並以 AI 提取條目（不寫入知識庫）
 
-        if file_ext == '.docx':
-            parser = WordParser(file_path)
-            parsed = parser.parse()
-            return parsed['full_text']
-        elif file_ext == '.pptx':
-            parser = PPTParser(file_path)
-            parsed = parser.parse()
-            return parsed['full_text']
-        else:
-            raise ValueError(f"不支援的檔案格式: {file_ext}")
+        Args:
+            document: 文件的邏輯名稱，提供時（且 INCREMENTAL_INGEST 啟用）依投影片/章節指紋
+                      與上一版比對，append 模式只提取變更或新增的單元
+            mode: new 或 append（new 會清空知識庫，所有單元都需提取）
+
+        Returns:
+            (提取並於文件內歸併後的條目, 使用的 PhraseExtractor, 文件的單元版本或 None)
+        """
+        # 步驟 1: 取得解析結果
+        parsed = get_parsed()
+        content = parsed['full_text']
+
+        with get_metrics().time('kb_stage_duration_seconds', stage='extract'), \
+                span('extract', cat='stage'):
+            # 依 token 預算規劃請求
+            extractor = PhraseExtractor(api_key=api_key, model=model,
+                                        cache=self.extraction_cache)
+            revision = None
+            chunk_units = None
+            if document and config.INCREMENTAL_INGEST:
+                units = document_units(parsed)
+                fingerprints = [unit_fingerprint(unit) for unit in units]
+                known = self._document_fingerprints(document) if mode == 'append' else set()
+                pending = [i for i, fingerprint in enumerate(fingerprints)
+                           if fingerprint not in known]
+                revision = DocumentRevision(
+                    document=document, fingerprints=fingerprints,
+                    extracted={fingerprints[i] for i in pending}
+                )
+                plan = extractor.plan_units([units[i] for i in pending])
+                chunk_units = [[fingerprints[pending[j]] for j in owners]
+                               for owners in plan.chunk_units]
+                scope = f'{len(pending)}/{len(units)} 個單元有變更，'
+            else:
+                plan = extractor.plan(parsed)
+                scope = ''
+            chunks = plan.chunks
+
+            # 更新狀態：分析中
+            self.task_store.update(task_id, {
+                'status': 'analyzing',
+                'message': f'文件解析完成 ({len(content)} 字元，{scope}{len(chunks)} 個區塊)，AI 分析中...',
+                'tokens_estimated': plan.estimated_tokens,
+                **({'units_total': len(revision.fingerprints),
+                    'units_extracted': len(pending)} if revision else {}),
+            })
+
+            # 步驟 2: AI 分塊並行分析提取
+            entries = extractor.extract_chunks(
+                chunks,
+                on_progress=lambda done, total: self.task_store.update(task_id, {
+                    'status': 'analyzing',
+                    'message': f'AI 分析中... ({done}/{total} 區塊)',
+                    'cache': dict(extractor.cache_stats),
+                    'gemini': extractor.gemini_stats,
+                }),
+                on_partial=lambda text: self.task_store.update(task_id, {'partial_content': text}),
+                chunk_units=chunk_units
+            )
+        return entries, extractor, revision
+
+    def _document_fingerprints(self, document: str) -> set:
+        """文件上一版已提取的單元指紋"""
+        store = KnowledgeBaseStore(os.path.join(self.output_folder, config.KB_STORE_FILENAME))
+        return store.document_fingerprints(document)
+
+    def _merge_entries(self, entries: List[KBEntry], source_file: str | None, mode: str,
+                       extractor: PhraseExtractor, label: str | None = None,
+                       revision: DocumentRevision | None = None) -> dict:
+        """
+        將條目去重後寫入結構化知識庫，並重新渲染 Markdown
+
+        Args:
+            entries: 新提取的條目
+            source_file: 來源文件名稱，None 表示各條目的 sources 已記錄來源（批次合併）
+            mode: new 或 append
+            extractor: 用於判斷可疑重複配對
+            label: 寫入知識庫標頭的來源說明，預設為 source_file
+            revision: 文件的單元版本，移除上一版已刪除單元獨有的條目
+
+        Returns:
+            寫入任務狀態的合併結果
+        """
+        # 步驟 3-4: 寫入結構化知識庫並重新渲染（寫入鎖 + 版本確認，並行任務不互相覆蓋）
+        result = KnowledgeBaseWriter(self.output_folder).merge(
+            entries, source_file, mode, judge=extractor.resolve_duplicates, label=label,
+            revision=revision
+        )
+        if result.rebased:
+            print(f"🔁 知識庫已被其他任務更新，已重新去重 {result.rebased} 次")
+        if result.retracted:
+            print(f"🗑️ 已移除 {result.retracted} 個僅出現在已刪除段落的條目")
+
+        return {
+            'output_file': os.path.join(self.output_folder, config.OUTPUT_FILENAME),
+            'content_size': result.content_size,
+            'entries_added': result.added,
+            'duplicates_merged': result.merged,
+            'duplicates_ambiguous': result.ambiguous,
+            'kb_version': result.version,
+            **({'entries_retracted': result.retracted} if revision else {}),
+        }
+
+    def _extract_batch_file(self, file: BatchFile, get_parsed: Callable[[], dict],
+                            api_key: str | None, model: str | None) -> List[KBEntry] | None:
+        """
+        批次中的單一檔案：解析與提取（不寫入知識庫），失敗時只標記該子任務
+
+        Returns:
+            已記錄來源檔名的條目，失敗時為 None
+        """
+        try:
+            entries, extractor, _revision = self._extract_entries(
+                file.task_id, get_parsed, api_key, model
+            )
+            if not entries:
+                raise ValueError("無法從 AI 回應中解析出任何話術條目")
+        except Exception as e:
+            self._mark_failed(file.task_id, e)
+            return None
+
+        for entry in entries:
+            entry.sources = [file.filename]
+        self.task_store.update(file.task_id, {
+            'status': 'extracted',
+            'message': '提取完成，等待批次合併...',
+            'entries_extracted': len(entries),
+            'cache': dict(extractor.cache_stats),
+            'gemini': extractor.gemini_stats,
+            'partial_content': None,
+        })
+        return entries
+
+    def _finish_batch_file(self, batch_id: str, state: _BatchState, file: BatchFile,
+                           entries: List[KBEntry] | None, cancelled: bool = False) -> bool:
+        """記錄子任務結果並更新父任務進度，回傳是否所有子任務都已結束"""
+        finished, last = state.finish(file, entries, cancelled)
+        self.task_store.update(batch_id, {
+            'status': 'analyzing',
+            'message': f'AI 分析中... ({finished}/{len(state.files)} 個檔案)',
+            'files_done': finished,
+            'files_failed': state.failed,
+            'files_cancelled': state.cancelled,
+        })
+        return last
+
+    def _merge_batch(self, batch_id: str, state: _BatchState, mode: str,
+                     api_key: str | None, model: str | None) -> None:
+        """
+        所有子任務提取結束後，一次去重並寫入知識庫
+
+        上傳的檔案在合併結束後才刪除，佇列模式下 worker 中斷時可整批重試
+        """
+        try:
+            self._complete_batch(batch_id, state, mode, api_key, model)
+        finally:
+            for file in state.files:
+                if os.path.exists(file.file_path):
+                    os.remove(file.file_path)
+
+    def _complete_batch(self, batch_id: str, state: _BatchState, mode: str,
+                        api_key: str | None, model: str | None) -> None:
+        succeeded = [file for file in state.files if file.task_id in state.results]
+        if state.cancelled == len(state.files):
+            self._mark_cancelled(batch_id)
+            return
+        try:
+            if not succeeded:
+                raise ValueError("批次中所有檔案皆處理失敗")
+
+            # 依上傳順序串接，同名術語以先出現的檔案為準
+            entries = [entry for file in succeeded for entry in state.results[file.task_id]]
+            self._update_status(
+                batch_id, 'merging', f'正在合併 {len(succeeded)} 個檔案至知識庫...'
+            )
+            label = ', '.join(file.filename for file in succeeded)
+            merged = self._merge_entries(
+                entries, None, mode, PhraseExtractor(api_key=api_key, model=model), label
+            )
+        except Exception as e:
+            self._mark_failed(batch_id, e)
+            for file in succeeded:
+                self._mark_failed(file.task_id, e)
+            return
+
+        completed_at = datetime.now().isoformat()
+        for file in succeeded:
+            self.task_store.update(file.task_id, {
+                'status': 'completed',
+                'message': '處理完成！',
+                'output_file': merged['output_file'],
+                'kb_version': merged['kb_version'],
+                'completed_at': completed_at,
+            })
+        message = f'處理完成！（{len(succeeded)} 個檔案成功，{state.failed} 個失敗'
+        if state.cancelled:
+            message += f'，{state.cancelled} 個已取消'
+        self.task_store.update(batch_id, {
+            'status': 'completed',
+            'message': message + '）',
+            **merged,
+            'entries_extracted': len(entries),
+            'files_done': len(state.files),
+            'files_failed': state.failed,
+            'files_cancelled': state.cancelled,
+            'completed_at': completed_at,
+        })
+
+    @staticmethod
+    def _tracer(trace: str | None) -> Tracer | None:
+        return Tracer(profile=trace == 'profile') if trace else None
+
+    @staticmethod
+    def _parse_call(source: str | bytes, filename: str, tracer: Tracer | None
+                    ) -> Tuple[Callable[..., Any], Tuple[Any, ...], Callable[[Any], dict]]:
+        """
+        解析行程要執行的函式與參數，以及將其結果轉回解析結果的函式
+
+        追蹤時以 run_traced 包裝，解析行程中記錄的 span 隨結果回傳並併入 tracer
+        """
+        if tracer is None:
+            return parse_document, (source, filename), lambda parsed: parsed
+        return run_traced, (tracer.profile, parse_document, source, filename), tracer.unwrap
+
+    def _trace_fields(self, task_id: str, tracer: Tracer | None) -> dict:
+        """
+        將追蹤紀錄寫入 TRACE_DIR，任務只記錄檔案路徑
+
+        紀錄可能有數 MB，放在任務中會在每次狀態更新、推播與列表時一併讀寫
+        """
+        if tracer is None:
+            return {}
+        folder = os.path.join(self.output_folder, config.TRACE_DIR)
+        os.makedirs(folder, exist_ok=True)
+        self._prune_traces(folder)
+        path = os.path.join(folder, f'{task_id}.json')
+        atomic_write(path, json.dumps(tracer.to_chrome(task_id=task_id), ensure_ascii=False))
+        return {'trace_file': path}
+
+    @staticmethod
+    def _prune_traces(folder: str) -> None:
+        """清除超過 TASK_TTL 的追蹤紀錄（任務已過期，無從取得）"""
+        cutoff = time.time() - config.TASK_TTL
+        for entry in os.scandir(folder):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _spool(file_path: str, content: bytes) -> None:
+        """佇列模式：將上傳內容寫入檔案供 worker 讀取（完整寫入後才出現在該路徑）"""
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, file_path)
+
+    def _parse_file(self, file_path: str, filename: str) -> dict:
+        """解析文件並回傳結構化內容（含 full_text）"""
+        with get_metrics().time('kb_stage_duration_seconds', stage='parse'):
+            return parse_document(file_path, filename)
 
     def _update_status(self, task_id: str, status: str, message: str) -> None:
         """更新任務狀態"""
@@ -163,3 +675,19 @@ class DocumentProcessor:
             'status': status,
             'message': message
         })
+
+    def _mark_cancelled(self, task_id: str) -> None:
+        """將任務標記為已取消"""
+        self.task_store.update(task_id, {
+            'status': 'cancelled',
+            'message': '任務已取消',
+            'completed_at': datetime.now().isoformat()
+        })
+
+    def _mark_failed(self, task_id: str, error: Exception) -> None:
+        """將任務標記為失敗"""
+        self.task_store.update(task_id, {
+            'status': 'failed',
+            'message': f'錯誤: {str(error)}',
+            'error': str(error)
+        })
@@ -0,0 +1,173 @@
+"""
+租戶公平排程
+處理管線依租戶（使用者的 API Key 或來源 IP）分開排隊，以加權公平排隊（WFQ）選出下一個工作：
+每個租戶累計已取得的處理量（字元數 ÷ 權重，即虛擬時間），累計最少者優先，同一使用者
+大量上傳時其他使用者不必等它全部處理完。
+
+解析前只知道檔案大小（壓縮後的大小與字元數無關），開始解析時先預扣 FAIR_ESTIMATED_CHARS，
+解析完成後依實際字元數補扣或退還；進入 AI 分析時另依字元數排序，小文件優先
+"""
+import itertools
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import config
+
+
+class FairShare:
+    """各租戶累計的處理量（兩段佇列共用）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage: Dict[str, float] = {}
+        # 租戶在管線中（排隊或處理中）的工作數，歸零時清除累計值
+        self._jobs: Dict[str, int] = {}
+        # 系統虛擬時間：最近一次被選中的租戶的累計值
+        self._clock = 0.0
+
+    def join(self, tenant: str) -> None:
+        """租戶的工作進入管線（閒置後重新加入的租戶從目前的虛擬時間開始，不累積閒置額度）"""
+        with self._lock:
+            if not self._jobs.get(tenant):
+                self._usage[tenant] = max(self._usage.get(tenant, 0.0), self._clock)
+            self._jobs[tenant] = self._jobs.get(tenant, 0) + 1
+
+    def leave(self, tenant: str) -> None:
+        """租戶的工作離開管線（完成、失敗或取消）"""
+        with self._lock:
+            remaining = self._jobs.get(tenant, 0) - 1
+            if remaining > 0:
+                self._jobs[tenant] = remaining
+            else:
+                self._jobs.pop(tenant, None)
+                self._usage.pop(tenant, None)
+
+    def usage(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._usage)
+
+    def charge(self, tenant: str, amount: float) -> None:
+        """租戶被選中：推進系統虛擬時間並計入處理量（amount 可為負數，即退還預扣）"""
+        with self._lock:
+            usage = self._usage.get(tenant, self._clock)
+            self._clock = max(self._clock, usage)
+            self._usage[tenant] = usage + amount
+
+
+@dataclass
+class _Entry:
+    key: str
+    item: Any
+    tenant: str
+    weight: float
+    # 排序用的大小（字元數），0 表示同一租戶內依先後順序
+    size: float
+    # 被選中時計入租戶的處理量（已除以權重）
+    charge: float
+    seq: int
+    enqueued_at: float
+
+
+class FairQueue:
+    """依租戶累計處理量選出下一個工作的阻塞佇列，可依鍵取消排隊中的工作"""
+
+    def __init__(self, share: FairShare, size_aware: bool = False,
+                 aging: Optional[float] = None):
+        """
+        Args:
+            share: 租戶累計處理量
+            size_aware: 是否依大小排序（小的優先）；否則同一租戶內依先後順序
+            aging: 每等待 1 秒相當於少 N 個字元，預設依 FAIR_AGING
+        """
+        self.share = share
+        self.size_aware = size_aware
+        self.aging = config.FAIR_AGING if aging is None else aging
+        self._cond = threading.Condition()
+        self._entries: Dict[str, _Entry] = {}
+        self._seq = itertools.count()
+        self._closed = False
+
+    def put(self, key: str, item: Any, tenant: str, weight: float = 1.0,
+            size: float = 0, charge: float = 0) -> None:
+        """
+        加入工作
+
+        Args:
+            key: 取消用的鍵（通常為任務 ID）
+            item: 工作
+            tenant: 租戶
+            weight: 權重，越大分到的處理量越多
+            size: 工作大小（字元數），size_aware 時小的優先
+            charge: 被選中時計入租戶的處理量（字元數，會再除以權重）
+        """
+        with self._cond:
+            self._entries[key] = _Entry(
+                key=key, item=item, tenant=tenant, weight=weight, size=size,
+                charge=charge / weight, seq=next(self._seq), enqueued_at=time.monotonic()
+            )
+            self._cond.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        取出下一個工作（阻塞至有工作為止）
+
+        Returns:
+            工作；已關閉且沒有剩餘工作，或逾時時為 None
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._entries or self._closed, timeout):
+                return None
+            if not self._entries:
+                return None
+            entry = self._select(self.share.usage())
+            del self._entries[entry.key]
+        self.share.charge(entry.tenant, entry.charge)
+        return entry.item
+
+    def cancel(self, key: str) -> Any:
+        """
+        取消排隊中的工作
+
+        Returns:
+            被取消的工作，已被取出（開始處理）或不存在時為 None
+        """
+        with self._cond:
+            entry = self._entries.pop(key, None)
+        return entry.item if entry is not None else None
+
+    def close(self) -> None:
+        """不再等待新工作（剩餘的工作仍可取出）"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        with self._cond:
+            return key in self._entries
+
+    def _select(self, usage: Dict[str, float]) -> _Entry:
+        """虛擬時間最小者；size_aware 時加上大小並扣除等待時間（呼叫端需持有鎖）"""
+        candidates: List[_Entry] = list(self._entries.values())
+        if not self.size_aware:
+            # 每個租戶只看最早的工作
+            heads: Dict[str, _Entry] = {}
+            for entry in candidates:
+                if entry.tenant not in heads or entry.seq < heads[entry.tenant].seq:
+                    heads[entry.tenant] = entry
+            candidates = list(heads.values())
+
+        now = time.monotonic()
+
+        def score(entry: _Entry) -> tuple:
+            value = usage.get(entry.tenant, 0.0)
+            if self.size_aware:
+                value += (entry.size - self.aging * (now - entry.enqueued_at)) / entry.weight
+            return value, entry.seq
+
+        return min(candidates, key=score)
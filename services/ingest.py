@@ -0,0 +1,326 @@
+"""
+上傳檔案串流接收
+werkzeug 解析 multipart 時直接寫入 UploadBuffer：邊接收邊計算 SHA-256、累計大小並檢查
+檔頭（.docx / .pptx / .zip 皆為 ZIP 格式），內容小於門檻時留在記憶體，超過才轉存暫存檔。
+留在記憶體的內容以 bytes 交給解析行程，不再經過 uploads/ 資料夾（佇列模式除外）；
+已轉存暫存檔的內容分段複製至 uploads/，解析行程改讀檔案
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from dataclasses import dataclass
+from typing import IO, Optional, Union
+
+from flask import Request, current_app
+from werkzeug.datastructures import FileStorage
+
+import config
+
+if os.name != 'nt':
+    import fcntl
+
+# ZIP 本地檔頭
+ZIP_MAGIC = b'PK\x03\x04'
+
+# 分段讀寫的大小
+_CHUNK_SIZE = 64 * 1024
+
+# 上傳資料夾的使用中鎖檔：使用該資料夾的行程持有共享鎖，行程結束（含當機）時由系統釋放
+_ACTIVE_LOCK_NAME = '.active.lock'
+_active_lock_fds: dict[str, int] = {}
+
+# Office 文件必須包含的主檔
+_PACKAGE_MEMBERS = {
+    '.docx': 'word/document.xml',
+    '.pptx': 'ppt/presentation.xml',
+}
+
+
+class UploadRejected(ValueError):
+    """上傳內容不合法（格式不符、損毀或超過大小上限）"""
+    pass
+
+
+class UploadInspector:
+    """串流檢查：累計大小、計算 SHA-256、確認 ZIP 檔頭"""
+
+    def __init__(self, filename: str, max_bytes: Optional[int] = None):
+        """
+        Args:
+            filename: 原始檔名（用於錯誤訊息）
+            max_bytes: 單一檔案大小上限，預設依 UPLOAD_MAX_FILE_BYTES
+        """
+        self.filename = filename
+        self.max_bytes = config.UPLOAD_MAX_FILE_BYTES if max_bytes is None else max_bytes
+        self.size = 0
+        self.error: Optional[str] = None
+        self._sha256 = hashlib.sha256()
+        self._head = b''
+
+    def feed(self, data: bytes) -> None:
+        """檢查一段資料，發現不合法後不再處理後續資料"""
+        if self.error:
+            return
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.error = f'檔案超過 {self.max_bytes} bytes 上限: {self.filename}'
+            return
+        if len(self._head) < len(ZIP_MAGIC):
+            self._head += data[:len(ZIP_MAGIC) - len(self._head)]
+            if not ZIP_MAGIC.startswith(self._head):
+                self.error = f'檔案內容不是有效的 Office 文件或 zip: {self.filename}'
+                return
+        self._sha256.update(data)
+
+    def verify(self) -> str:
+        """
+        確認整份內容合法
+
+        Returns:
+            SHA-256（十六進位）
+
+        Raises:
+            UploadRejected: 內容不合法
+        """
+        if not self.error and self._head != ZIP_MAGIC:
+            self.error = f'檔案內容不是有效的 Office 文件或 zip: {self.filename}'
+        if self.error:
+            raise UploadRejected(self.error)
+        return self._sha256.hexdigest()
+
+
+class UploadBuffer(tempfile.SpooledTemporaryFile):
+    """werkzeug 寫入上傳內容的緩衝區，寫入時同步檢查（不合法的內容不再保留）"""
+
+    def __init__(self, filename: str, max_size: Optional[int] = None):
+        """
+        Args:
+            filename: 原始檔名
+            max_size: 超過此大小才轉存暫存檔，預設依 UPLOAD_SPOOL_THRESHOLD
+        """
+        super().__init__(
+            max_size=config.UPLOAD_SPOOL_THRESHOLD if max_size is None else max_size,
+            mode='w+b'
+        )
+        # zip 是多份文件的容器，依批次請求上限檢查；解出的各檔案再依單檔上限檢查
+        self.inspector = UploadInspector(
+            filename,
+            config.BATCH_MAX_REQUEST_BYTES if filename.lower().endswith('.zip') else None
+        )
+
+    def write(self, s: bytes) -> int:  # type: ignore[override]
+        self.inspector.feed(s)
+        if self.inspector.error:
+            return len(s)
+        return super().write(s)
+
+
+class IngestRequest(Request):
+    """
+    以 UploadBuffer 接收上傳檔案的 Request（設為 app.request_class）
+    端點可用 max_request_size 裝飾器設定自己的請求大小上限，未設定時沿用 MAX_CONTENT_LENGTH
+    """
+
+    @property
+    def max_content_length(self) -> Optional[int]:
+        override = getattr(self, '_max_content_length', None)
+        if override is not None:
+            return override
+        if current_app and self.endpoint:
+            limit = getattr(current_app.view_functions.get(self.endpoint), 'max_content_length', None)
+            if limit is not None:
+                return limit
+        return super().max_content_length
+
+    @max_content_length.setter
+    def max_content_length(self, value: Optional[int]) -> None:
+        self._max_content_length = value
+
+    def _get_file_stream(self, total_content_length: Optional[int], content_type: Optional[str],
+                         filename: Optional[str] = None,
+                         content_length: Optional[int] = None) -> IO[bytes]:
+        return UploadBuffer(filename or '')
+
+
+@dataclass
+class Upload:
+    """通過檢查的上傳檔案（content 為 None 時內容已寫入 path）"""
+    filename: str
+    content: Optional[bytes]
+    sha256: str
+    size: int
+    path: Optional[str] = None
+
+
+def ingest_upload(file: FileStorage, filename: Optional[str] = None,
+                  path: Optional[str] = None) -> Upload:
+    """
+    取得上傳檔案的內容與雜湊（已由 UploadBuffer 串流檢查時不再重讀一次計算）。
+    不超過 UPLOAD_SPOOL_THRESHOLD 的內容讀入記憶體；較大的內容以固定大小分段複製至 path，
+    不會整份讀入記憶體
+
+    Args:
+        file: request.files 中的檔案
+        filename: 檔名，預設為 file.filename
+        path: 大型內容的寫入路徑，未提供時一律讀入記憶體
+
+    Returns:
+        Upload
+
+    Raises:
+        UploadRejected: 內容不合法
+    """
+    filename = filename or file.filename or ''
+    sha256 = inspect_upload(file, filename)
+    stream = file.stream
+    check_package(stream, filename)
+
+    size = stream.seek(0, os.SEEK_END)
+    stream.seek(0)
+    if path is None or size <= config.UPLOAD_SPOOL_THRESHOLD:
+        return Upload(filename=filename, content=stream.read(), sha256=sha256, size=size)
+
+    try:
+        with open(path, 'wb') as dest:
+            shutil.copyfileobj(stream, dest, _CHUNK_SIZE)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return Upload(filename=filename, content=None, sha256=sha256, size=size, path=path)
+
+
+def inspect_upload(file: FileStorage, filename: Optional[str] = None) -> str:
+    """
+    檢查上傳檔案並將串流移回開頭
+
+    Returns:
+        SHA-256（十六進位）
+
+    Raises:
+        UploadRejected: 內容不合法
+    """
+    stream = file.stream
+    if isinstance(stream, UploadBuffer):
+        inspector = stream.inspector
+    else:
+        # 未使用 IngestRequest 時（例如其他 app 掛載此 Blueprint）讀一次計算
+        inspector = UploadInspector(filename or file.filename or '')
+        stream.seek(0)
+        for data in iter(lambda: stream.read(_CHUNK_SIZE), b''):
+            inspector.feed(data)
+    sha256 = inspector.verify()
+    stream.seek(0)
+    return sha256
+
+
+def save_upload(source: IO[bytes], path: str, filename: str) -> str:
+    """
+    將串流（例如 zip 內的檔案）邊檢查邊寫入 path，不合法時刪除已寫入的部分
+
+    Returns:
+        SHA-256（十六進位）
+
+    Raises:
+        UploadRejected: 內容不合法
+    """
+    inspector = UploadInspector(filename)
+    try:
+        with open(path, 'wb') as dest:
+            for data in iter(lambda: source.read(_CHUNK_SIZE), b''):
+                inspector.feed(data)
+                if inspector.error:
+                    break
+                dest.write(data)
+        sha256 = inspector.verify()
+        check_package(path, filename)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return sha256
+
+
+def check_package(content: Union[str, IO[bytes]], filename: str) -> None:
+    """
+    確認 .docx / .pptx 是完整的 Office 文件（zip 目錄可讀且含有主檔），其餘副檔名不檢查
+
+    Args:
+        content: 檔案路徑或可 seek 的串流（檢查後移回開頭）
+        filename: 原始檔名
+
+    Raises:
+        UploadRejected: 文件損毀或不是對應的格式
+    """
+    member = _PACKAGE_MEMBERS.get(os.path.splitext(filename)[1].lower())
+    if member is None:
+        return
+    try:
+        with zipfile.ZipFile(content) as archive:
+            archive.getinfo(member)
+    except (zipfile.BadZipFile, KeyError):
+        raise UploadRejected(f'檔案損毀或不是有效的 {os.path.splitext(filename)[1]} 文件: {filename}')
+    finally:
+        if not isinstance(content, str):
+            content.seek(0)
+
+
+def sweep_orphaned_uploads(folder: str, max_age: Optional[float] = None) -> int:
+    """
+    刪除上傳資料夾中超過 max_age 秒的檔案（處理中行程當機時留下的檔案）。
+    呼叫後本行程持續以共享鎖標示正在使用此資料夾；其他行程仍持有鎖時（例如同一主機的其他
+    worker 正在處理批次，其 zip 解出檔可能早於 max_age）不清除任何檔案。
+    Windows 沒有共享鎖，僅依 max_age 判斷
+
+    Args:
+        folder: 上傳資料夾
+        max_age: 檔案保留秒數，預設依 UPLOAD_ORPHAN_MAX_AGE
+
+    Returns:
+        刪除的檔案數
+    """
+    max_age = config.UPLOAD_ORPHAN_MAX_AGE if max_age is None else max_age
+    os.makedirs(folder, exist_ok=True)
+    if os.name != 'nt' and not _claim_upload_folder(folder):
+        return 0
+
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        for name in os.listdir(folder):
+            if name == _ACTIVE_LOCK_NAME:
+                continue
+            path = os.path.join(folder, name)
+            try:
+                if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+    finally:
+        if os.name != 'nt':
+            # 清除完畢後降為共享鎖，與其他行程共同使用此資料夾
+            fcntl.flock(_active_lock_fds[folder], fcntl.LOCK_SH)
+    return removed
+
+
+def _claim_upload_folder(folder: str) -> bool:
+    """
+    取得上傳資料夾的鎖檔（行程存續期間保留）
+
+    Returns:
+        是否取得獨占鎖（沒有其他行程使用此資料夾）；否則已改持共享鎖
+    """
+    fd = _active_lock_fds.get(folder)
+    if fd is None:
+        fd = os.open(os.path.join(folder, _ACTIVE_LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        _active_lock_fds[folder] = fd
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        return False
@@ -0,0 +1,385 @@
+"""
+持久化工作佇列
+Web 行程只負責入列，由獨立的 worker 行程（python -m services.worker）取出處理，
+支援 Redis list 與本機 SQLite 兩種後端
+
+工作只包含上傳檔案的路徑（UPLOAD_FOLDER 下），Web 與 worker 必須共用同一個檔案系統
+（同一台主機或掛載相同的磁碟）；API Key 不以明文放入佇列，見 seal_api_key
+"""
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Iterator
+
+import config
+
+
+@dataclass
+class BatchFile:
+    """批次上傳中的單一檔案（對應一個子任務）"""
+    task_id: str
+    file_path: str
+    filename: str
+    sha256: str = ''
+    # 直接上傳的內容（非佇列模式下不寫入 file_path），入列前須先寫入檔案並清除
+    content: bytes | None = field(default=None, repr=False, compare=False)
+
+
+@dataclass
+class Job:
+    """佇列中的文件處理工作（批次工作以 files 列出各子檔案，task_id 為父任務）"""
+    task_id: str
+    file_path: str
+    filename: str
+    mode: str = 'append'
+    api_key: str | None = None
+    model: str | None = None
+    job_id: str = ''
+    attempts: int = 0
+    files: list[BatchFile] | None = None
+    # 追蹤模式（spans / profile），僅單一文件工作
+    trace: str | None = None
+    # 文件的邏輯名稱（增量重新匯入），僅單一文件工作
+    document: str | None = None
+
+    def to_json(self) -> str:
+        """序列化（api_key 應已由 seal_api_key 處理，不會是明文）"""
+        data = asdict(self)
+        for item in data['files'] or []:
+            # 內容已寫入 file_path，不放入佇列
+            item.pop('content', None)
+        return json.dumps(data, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: str) -> 'Job':
+        data = json.loads(raw)
+        if data.get('files'):
+            data['files'] = [BatchFile(**item) for item in data['files']]
+        return cls(**data)
+
+
+def seal_api_key(api_key: str | None) -> str | None:
+    """
+    入列前處理 API Key
+
+    伺服器的 GEMINI_API_KEY 不放入佇列（worker 以 None 使用自己的環境變數），
+    使用者的 Key 以 JOB_QUEUE_SECRET 加密
+
+    Raises:
+        ValueError: 使用者提供了 Key 但未設定 JOB_QUEUE_SECRET 或未安裝 cryptography
+    """
+    if not api_key or api_key == config.GEMINI_API_KEY:
+        return None
+    return _fernet().encrypt(api_key.encode('utf-8')).decode('ascii')
+
+
+def open_api_key(sealed: str | None) -> str | None:
+    """
+    worker 取回 API Key（None 表示使用伺服器的 GEMINI_API_KEY）
+
+    Raises:
+        ValueError: 無法解密（Web 與 worker 的 JOB_QUEUE_SECRET 不同）
+    """
+    if not sealed:
+        return None
+    if not sealed.startswith('gAAAA'):
+        # 舊版入列的明文 Key（Fernet 權杖皆以此開頭）
+        return sealed
+    from cryptography.fernet import InvalidToken
+
+    try:
+        return _fernet().decrypt(sealed.encode('ascii')).decode('utf-8')
+    except InvalidToken:
+        raise ValueError("無法解密 API Key，請確認 Web 與 worker 的 JOB_QUEUE_SECRET 相同")
+
+
+def _fernet():
+    if not config.JOB_QUEUE_SECRET:
+        raise ValueError("佇列模式使用個人 API Key 需設定 JOB_QUEUE_SECRET")
+    try:
+        from cryptography.fernet import Fernet
+    except ImportError:
+        raise ValueError("佇列模式使用個人 API Key 需安裝 cryptography")
+    key = hashlib.sha256(config.JOB_QUEUE_SECRET.encode('utf-8')).digest()
+    return Fernet(base64.urlsafe_b64encode(key))
+
+
+class JobQueue(ABC):
+    """工作佇列抽象基類"""
+
+    @abstractmethod
+    def enqueue(self, job: Job) -> str:
+        """加入工作，回傳 job_id"""
+        pass
+
+    @abstractmethod
+    def dequeue(self, timeout: float = 5.0) -> Job | None:
+        """取出工作（租用），逾時回傳 None"""
+        pass
+
+    @abstractmethod
+    def ack(self, job: Job) -> None:
+        """確認工作完成（無論成功或失敗都已寫回任務狀態）"""
+        pass
+
+    @abstractmethod
+    def touch(self, job: Job) -> None:
+        """延長租用期限（長時間處理中的 worker 定期呼叫）"""
+        pass
+
+    @abstractmethod
+    def requeue_stale(self) -> int:
+        """將租用逾時（worker 當機或被回收）的工作放回佇列，回傳數量"""
+        pass
+
+    @abstractmethod
+    def cancel(self, task_id: str) -> Job | None:
+        """移除尚未被取出的工作（依任務 ID），回傳被移除的工作，已被取出時為 None"""
+        pass
+
+    @abstractmethod
+    def size(self) -> int:
+        """等待中的工作數"""
+        pass
+
+
+class SQLiteJobQueue(JobQueue):
+    """本機 SQLite 佇列（單機多行程）"""
+
+    def __init__(self, db_path: str, lease_seconds: int | None = None):
+        """
+        Args:
+            db_path: SQLite 檔案路徑
+            lease_seconds: 租用時間，超過未 ack 視為 worker 失聯
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds or config.JOB_LEASE_SECONDS
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY, payload TEXT NOT NULL,"
+                " state TEXT NOT NULL, leased_until REAL, created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs (state, created_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, job: Job) -> str:
+        job.job_id = job.job_id or str(uuid.uuid4())
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, payload, state, created_at) VALUES (?, ?, 'queued', ?)",
+                (job.job_id, job.to_json(), time.time())
+            )
+        return job.job_id
+
+    def dequeue(self, timeout: float = 5.0) -> Job | None:
+        deadline = time.time() + timeout
+        while True:
+            job = self._try_dequeue()
+            if job is not None or time.time() >= deadline:
+                return job
+            time.sleep(min(0.5, max(deadline - time.time(), 0)))
+
+    def _try_dequeue(self) -> Job | None:
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE 取得寫入鎖，避免多個 worker 取到同一筆
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT job_id, payload FROM jobs WHERE state = 'queued'"
+                    " ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                job = Job.from_json(row[1])
+                job.attempts += 1
+                conn.execute(
+                    "UPDATE jobs SET state = 'leased', leased_until = ?, payload = ?"
+                    " WHERE job_id = ?",
+                    (time.time() + self.lease_seconds, job.to_json(), row[0])
+                )
+                conn.execute("COMMIT")
+                return job
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def ack(self, job: Job) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job.job_id,))
+
+    def touch(self, job: Job) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET leased_until = ? WHERE job_id = ? AND state = 'leased'",
+                (time.time() + self.lease_seconds, job.job_id)
+            )
+
+    def requeue_stale(self) -> int:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET state = 'queued', leased_until = NULL"
+                " WHERE state = 'leased' AND leased_until < ?",
+                (time.time(),)
+            )
+            return cursor.rowcount
+
+    def cancel(self, task_id: str) -> Job | None:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT job_id, payload FROM jobs WHERE state = 'queued'"
+                    " AND json_extract(payload, '$.task_id') = ? LIMIT 1",
+                    (task_id,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("DELETE FROM jobs WHERE job_id = ?", (row[0],))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return Job.from_json(row[1]) if row is not None else None
+
+    def size(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'queued'").fetchone()[0]
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Redis 可靠佇列（跨主機）
+
+    使用 BLMOVE 將工作原子地移入處理中清單，並以 sorted set 記錄租用期限，
+    worker 失聯時由 requeue_stale 放回等待清單；取出次數記錄在 hash（只在取出時累加），
+    payload 保持不變以便 ack 時比對
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0,
+                 prefix: str = 'jobs:', lease_seconds: int | None = None):
+        try:
+            import redis
+            self._redis = redis.Redis(host=host, port=port, db=db, decode_responses=True)
+            self._redis.ping()
+        except Exception as e:
+            raise ConnectionError(f"無法連接 Redis: {e}")
+
+        self._pending = f"{prefix}pending"
+        self._processing = f"{prefix}processing"
+        self._leases = f"{prefix}leases"
+        self._attempts = f"{prefix}attempts"
+        self.lease_seconds = lease_seconds or config.JOB_LEASE_SECONDS
+
+    def enqueue(self, job: Job) -> str:
+        job.job_id = job.job_id or str(uuid.uuid4())
+        self._redis.lpush(self._pending, job.to_json())
+        return job.job_id
+
+    def dequeue(self, timeout: float = 5.0) -> Job | None:
+        raw = self._redis.blmove(self._pending, self._processing, timeout, 'RIGHT', 'LEFT')
+        if raw is None:
+            return None
+        job = Job.from_json(raw)
+        # 在此之前失聯的 worker 留下沒有租約的工作，由 requeue_stale 補上租約後回收
+        pipe = self._redis.pipeline()
+        pipe.zadd(self._leases, {raw: time.time() + self.lease_seconds})
+        pipe.hincrby(self._attempts, job.job_id, 1)
+        _, attempts = pipe.execute()
+        job.attempts += attempts
+        # 保留原始 payload 以便 ack 時從處理中清單移除
+        job._raw = raw  # type: ignore[attr-defined]
+        return job
+
+    def ack(self, job: Job) -> None:
+        raw = getattr(job, '_raw', job.to_json())
+        pipe = self._redis.pipeline()
+        pipe.lrem(self._processing, 1, raw)
+        pipe.zrem(self._leases, raw)
+        pipe.hdel(self._attempts, job.job_id)
+        pipe.execute()
+
+    def touch(self, job: Job) -> None:
+        raw = getattr(job, '_raw', job.to_json())
+        self._redis.zadd(self._leases, {raw: time.time() + self.lease_seconds}, xx=True)
+
+    def requeue_stale(self) -> int:
+        # 取出後、登記租約前失聯的工作沒有租約：補上一份租約（NX 不覆寫存活 worker 的租約），
+        # 到期後與其他逾時工作一同放回
+        processing = self._redis.lrange(self._processing, 0, -1)
+        if processing:
+            deadline = time.time() + self.lease_seconds
+            self._redis.zadd(self._leases, {raw: deadline for raw in processing}, nx=True)
+
+        stale = self._redis.zrangebyscore(self._leases, 0, time.time())
+        count = 0
+        for raw in stale:
+            # 只有成功從處理中清單移除者才放回，避免多個 worker 重複放回；
+            # 取出次數已在 dequeue 累加，放回時不再計算
+            if self._redis.lrem(self._processing, 1, raw):
+                pipe = self._redis.pipeline()
+                pipe.rpush(self._pending, raw)
+                pipe.zrem(self._leases, raw)
+                pipe.execute()
+                count += 1
+            else:
+                self._redis.zrem(self._leases, raw)
+        return count
+
+    def cancel(self, task_id: str) -> Job | None:
+        for raw in self._redis.lrange(self._pending, 0, -1):
+            job = Job.from_json(raw)
+            if job.task_id == task_id:
+                # LREM 為原子操作，worker 已先取出時回傳 0
+                if not self._redis.lrem(self._pending, 1, raw):
+                    return None
+                self._redis.hdel(self._attempts, job.job_id)
+                return job
+        return None
+
+    def size(self) -> int:
+        return self._redis.llen(self._pending)
+
+
+def create_job_queue() -> JobQueue | None:
+    """
+    根據環境變數建立工作佇列
+
+    環境變數:
+        JOB_QUEUE: redis / sqlite（未設定則不使用佇列，由 Web 行程直接處理）
+        JOB_QUEUE_PATH: SQLite 佇列檔案路徑
+        REDIS_HOST / REDIS_PORT / REDIS_DB: Redis 連線設定
+    """
+    backend = config.JOB_QUEUE_BACKEND
+    if not backend:
+        return None
+
+    if backend == 'redis':
+        return RedisJobQueue(
+            host=os.getenv('REDIS_HOST', 'localhost'),
+            port=int(os.getenv('REDIS_PORT', '6379')),
+            db=int(os.getenv('REDIS_DB', '0'))
+        )
+    if backend == 'sqlite':
+        return SQLiteJobQueue(config.JOB_QUEUE_PATH)
+
+    raise ValueError(f"不支援的工作佇列後端: {backend}")
@@ -0,0 +1,237 @@
+"""
+分段處理管線
+CPU 密集的文件解析在行程池執行，I/O 密集的 AI 分析在執行緒池執行，
+兩段之間以有界佇列銜接，避免解析速度遠超分析時無限堆積解析結果。
+兩段各自依租戶公平排程（見 fair_queue），排隊中尚未開始解析的工作可取消。
+解析行程異常結束（損毀的檔案造成記憶體不足或崩潰）時重建行程池，受影響的工作各自在
+獨立行程中重試一次，只有真正造成崩潰的工作失敗
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Tuple
+
+import config
+from metrics import get_metrics
+from .fair_queue import FairQueue, FairShare
+
+
+def _timed_parse(fn: Callable[..., Any], *args: Any) -> Tuple[Any, float]:
+    """在解析行程中執行並量測耗時（不含在行程池中排隊的時間）"""
+    start = time.perf_counter()
+    return fn(*args), time.perf_counter() - start
+
+
+@dataclass
+class PipelineJob:
+    """管線中的一個工作"""
+    parse_fn: Callable[..., Any]
+    parse_args: Tuple[Any, ...]
+    # 解析開始前於主行程呼叫（例如更新任務狀態）
+    on_start: Callable[[], None]
+    # 於分析執行緒呼叫，參數為解析結果的 Future
+    on_parsed: Callable[[Future], Any]
+    # 取消用的鍵（通常為任務 ID），未提供時自動產生
+    key: str = ''
+    # 公平排程的租戶與權重（實際權重再乘上 FAIR_TENANT_WEIGHTS 中的租戶權重）
+    tenant: str = ''
+    weight: float = 1.0
+    # 由解析結果計算處理量（字元數），未提供時以 FAIR_ESTIMATED_CHARS 計
+    measure: Optional[Callable[[Any], int]] = None
+    # 排隊中被取消時呼叫（例如更新任務狀態）
+    on_cancel: Optional[Callable[[], None]] = None
+    future: Future = field(default_factory=Future)
+    # 解析行程池崩潰後是否已在獨立行程中重試
+    isolated: bool = False
+
+
+class StagedPipeline:
+    """解析（行程池）→ 有界交接佇列 → 分析（執行緒池），兩段皆依租戶公平排程"""
+
+    def __init__(self, parse_workers: int | None = None, analyze_workers: int | None = None,
+                 queue_size: int | None = None):
+        """
+        Args:
+            parse_workers: 解析行程數，0 表示在執行緒中解析（不使用行程池）
+            analyze_workers: AI 分析執行緒數
+            queue_size: 已開始解析但尚未完成分析的工作上限
+        """
+        self.parse_workers = config.PARSE_WORKERS if parse_workers is None else parse_workers
+        self.analyze_workers = analyze_workers or config.ANALYZE_WORKERS
+        self.queue_size = queue_size or config.STAGE_QUEUE_SIZE
+
+        self._parse_pool: Executor = (
+            ProcessPoolExecutor(max_workers=self.parse_workers)
+            if self.parse_workers > 0
+            else ThreadPoolExecutor(max_workers=1, thread_name_prefix='parse')
+        )
+        self._pool_lock = threading.Lock()
+        self._closed = False
+        self._analyze_pool = ThreadPoolExecutor(
+            max_workers=self.analyze_workers, thread_name_prefix='analyze'
+        )
+        self._share = FairShare()
+        # 等待解析（同一租戶內依先後順序）與等待分析（依字元數，小文件優先）
+        self._intake = FairQueue(self._share)
+        self._ready = FairQueue(self._share, size_aware=True)
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._dispatcher = threading.Thread(
+            target=self._dispatch_loop, name='pipeline-dispatcher', daemon=True
+        )
+        self._dispatcher.start()
+
+    @property
+    def analyze_executor(self) -> ThreadPoolExecutor:
+        """AI 分析階段的執行緒池"""
+        return self._analyze_pool
+
+    def submit(self, job: PipelineJob) -> Future:
+        """
+        提交工作（不阻塞呼叫端）
+
+        Returns:
+            分析完成時完成的 Future（排隊中被取消時為已取消的 Future）
+        """
+        job.key = job.key or str(uuid.uuid4())
+        job.weight *= config.FAIR_TENANT_WEIGHTS.get(job.tenant, 1.0)
+        self._share.join(job.tenant)
+        job.future.add_done_callback(lambda _f: self._share.leave(job.tenant))
+
+        get_metrics().inc('kb_pipeline_queue_depth', 1, stage='parse')
+        self._intake.put(job.key, job, job.tenant, job.weight,
+                         charge=config.FAIR_ESTIMATED_CHARS)
+        return job.future
+
+    def cancel(self, key: str) -> bool:
+        """
+        取消尚未開始解析的工作
+
+        Returns:
+            是否已取消（已開始處理或不存在時為 False）
+        """
+        job = self._intake.cancel(key)
+        if job is None:
+            return False
+        get_metrics().inc('kb_pipeline_queue_depth', -1, stage='parse')
+        try:
+            if job.on_cancel is not None:
+                job.on_cancel()
+        finally:
+            job.future.cancel()
+        return True
+
+    def _dispatch_loop(self) -> None:
+        """有交接名額時才取出工作開始解析（背壓），取出時依租戶公平排程"""
+        while True:
+            self._slots.acquire()
+            job = self._intake.get()
+            if job is None:
+                self._slots.release()
+                break
+
+            metrics = get_metrics()
+            metrics.inc('kb_pipeline_queue_depth', -1, stage='parse')
+            metrics.inc('kb_pipeline_active_workers', 1, stage='parse')
+            try:
+                job.on_start()
+            except Exception as e:
+                failed: Future = Future()
+                failed.set_exception(e)
+                self._handoff(job, failed, None)
+                continue
+            self._start_parse(job, self._parse_pool)
+
+    def _start_parse(self, job: PipelineJob, pool: Executor) -> None:
+        """交給解析執行池，完成時（無論成功或失敗）轉交 _handoff"""
+        try:
+            parse_future = pool.submit(_timed_parse, job.parse_fn, *job.parse_args)
+        except Exception as e:
+            parse_future = Future()
+            parse_future.set_exception(e)
+
+        parse_future.add_done_callback(
+            lambda f, job=job, pool=pool: self._handoff(job, f, pool)
+        )
+
+    def _replace_parse_pool(self, broken: Optional[Executor]) -> None:
+        """解析行程池崩潰後重建（多個工作同時發現時只重建一次）"""
+        if broken is None:
+            return
+        with self._pool_lock:
+            if self._parse_pool is not broken:
+                return
+            print("⚠️ 解析行程異常結束，重建解析行程池")
+            self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_workers)
+        broken.shutdown(wait=False)
+
+    def _retry_isolated(self, job: PipelineJob) -> None:
+        """
+        在單獨的行程中重試（行程池崩潰時池中所有工作都會失敗，無法得知是哪個檔案造成，
+        各自隔離重試後只有造成崩潰的工作會再次失敗）
+        """
+        job.isolated = True
+        pool = ProcessPoolExecutor(max_workers=1)
+        self._start_parse(job, pool)
+        pool.shutdown(wait=False)
+
+    def _handoff(self, job: PipelineJob, timed_future: Future, pool: Optional[Executor]) -> None:
+        """解析完成後記錄耗時，依實際字元數排入分析佇列"""
+        error = timed_future.exception()
+        if isinstance(error, BrokenProcessPool) and not job.isolated and not self._closed:
+            self._replace_parse_pool(pool)
+            self._retry_isolated(job)
+            return
+
+        metrics = get_metrics()
+        metrics.inc('kb_pipeline_active_workers', -1, stage='parse')
+        parse_future: Future = Future()
+        try:
+            if isinstance(error, BrokenProcessPool):
+                raise RuntimeError("解析行程異常結束（檔案可能已損毀或內容過大）") from error
+            result, elapsed = timed_future.result()
+        except Exception as e:
+            parse_future.set_exception(e)
+            size = 0
+        else:
+            metrics.observe('kb_stage_duration_seconds', elapsed, stage='parse')
+            parse_future.set_result(result)
+            size = config.FAIR_ESTIMATED_CHARS if job.measure is None else job.measure(result)
+
+        # 補扣或退還解析前預扣的處理量
+        metrics.inc('kb_pipeline_queue_depth', 1, stage='analyze')
+        self._ready.put(job.key, (job, parse_future), job.tenant, job.weight,
+                        size=size, charge=size - config.FAIR_ESTIMATED_CHARS)
+        try:
+            # 每個執行緒池工作在開始時才從分析佇列取出當下最優先的工作
+            self._analyze_pool.submit(self._run_analysis)
+        except RuntimeError as e:
+            # 執行緒池已關閉
+            self._ready.cancel(job.key)
+            metrics.inc('kb_pipeline_queue_depth', -1, stage='analyze')
+            self._slots.release()
+            job.future.set_exception(e)
+
+    def _run_analysis(self) -> None:
+        job, parse_future = self._ready.get()
+        metrics = get_metrics()
+        metrics.inc('kb_pipeline_queue_depth', -1, stage='analyze')
+        try:
+            with metrics.active('kb_pipeline_active_workers', stage='analyze'):
+                job.future.set_result(job.on_parsed(parse_future))
+        except Exception as e:
+            job.future.set_exception(e)
+        finally:
+            self._slots.release()
+
+    def shutdown(self, wait: bool = True) -> None:
+        """停止接收工作並關閉兩段執行池（已排隊的工作仍會處理）"""
+        self._closed = True
+        self._intake.close()
+        if wait:
+            self._dispatcher.join()
+        self._parse_pool.shutdown(wait=wait)
+        self._analyze_pool.shutdown(wait=wait)
+
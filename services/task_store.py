@@ -2,11 +2,60 @@
 任務存儲服務
 支援 Redis 和記憶體兩種模式
 """
+from __future__ import annotations
+
+import bisect
 import json
 import os
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Any
+from typing import Any, Callable, Iterator
+
+import config
+from metrics import timed
+
+# 任務結束狀態（狀態串流在此結束）
+TERMINAL_STATUSES = {'completed', 'failed', 'cancelled'}
+
+
+def created_at_score(data: dict) -> float:
+    """排序分數：created_at 的時間戳記（缺少或格式錯誤時使用目前時間）"""
+    try:
+        return datetime.fromisoformat(data['created_at']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return time.time()
+
+
+def encode_cursor(score: float, task_id: str) -> str:
+    """分頁游標：上一頁最後一筆的 (分數, 任務 ID)"""
+    return f"{score!r}:{task_id}"
+
+
+def decode_cursor(cursor: str) -> tuple[float, str]:
+    """
+    解析分頁游標
+
+    Raises:
+        ValueError: 游標格式錯誤
+    """
+    score, sep, task_id = cursor.partition(':')
+    if not sep or not task_id:
+        raise ValueError(f"無效的游標: {cursor}")
+    return float(score), task_id
+
+
+def since_score(since: str) -> float:
+    """
+    解析 since 篩選條件（ISO 8601 時間）
+
+    Raises:
+        ValueError: 時間格式錯誤
+    """
+    return datetime.fromisoformat(since).timestamp()
 
 
 class TaskStore(ABC):
@@ -42,39 +91,289 @@ class TaskStore(ABC):
         """刪除任務"""
         pass
 
+    @abstractmethod
+    def list(self, cursor: str | None = None, limit: int = 50, status: str | None = None,
+             since: str | None = None) -> tuple[list[dict], str | None]:
+        """
+        依建立時間由新到舊分頁列出任務
+
+        Args:
+            cursor: 上一頁回傳的游標，None 表示第一頁
+            limit: 每頁筆數
+            status: 只列出此狀態的任務
+            since: 只列出此時間（ISO 8601）之後建立的任務
+
+        Returns:
+            (任務列表, 下一頁游標；沒有下一頁時為 None)
+
+        Raises:
+            ValueError: 游標或 since 格式錯誤
+        """
+        pass
+
+    def watch(self, task_id: str, timeout: float = 15.0) -> Iterator[dict | None]:
+        """
+        監看任務變更
+
+        先產生目前的任務內容，之後每次變更產生一次最新內容；
+        超過 timeout 秒無變更時產生 None（供呼叫端送出 keep-alive），任務消失時結束。
+        預設以輪詢實作，子類別可改用推播機制。
+
+        Args:
+            task_id: 任務 ID
+            timeout: 無變更時產生 None 的間隔（秒）
+        """
+        last = self.get(task_id)
+        if last is None:
+            return
+        yield last
+
+        idle = 0.0
+        while True:
+            time.sleep(1.0)
+            current = self.get(task_id)
+            if current is None:
+                return
+            if current != last:
+                last, idle = current, 0.0
+                yield current
+            else:
+                idle += 1.0
+                if idle >= timeout:
+                    idle = 0.0
+                    yield None
+
+
+@dataclass(slots=True)
+class _TaskRecord:
+    """記憶體存儲中的單一任務（data 發布後不再修改，更新時整筆替換）"""
+    data: dict
+    score: float
+    expires_at: float
+    version: int = 1
+
 
 class MemoryTaskStore(TaskStore):
-    """記憶體存儲（開發/測試用）"""
+    """
+    記憶體存儲（單機部署用）
 
-    def __init__(self):
-        self._store: dict[str, dict] = {}
+    寫入以單一鎖序列化並採 copy-on-write：更新時建立新的任務 dict 再替換，
+    讀取不需加鎖也不會看到寫到一半的內容。任務與 Redis 相同在最後一次寫入
+    ttl 秒後過期，超過 max_entries 時淘汰最久未寫入的任務。
+    """
 
+    def __init__(self, ttl: int = 86400, max_entries: int = 10000):
+        """
+        Args:
+            ttl: 任務過期時間（秒），預設 24 小時
+            max_entries: 任務數上限，超過時淘汰最久未更新者
+        """
+        self._ttl = ttl
+        self._max_entries = max_entries
+        # 依最後寫入時間排序；TTL 固定，因此同時也依過期時間排序
+        self._store: OrderedDict[str, _TaskRecord] = OrderedDict()
+        # 寫入鎖，每次變更喚醒 watch()
+        self._changed = threading.Condition()
+        # 依 (created_at 分數, 任務 ID) 排序的索引，另依狀態分組
+        self._index: list[tuple[float, str]] = []
+        self._status_index: dict[str, list[tuple[float, str]]] = {}
+
+    def _live(self, task_id: str) -> _TaskRecord | None:
+        record = self._store.get(task_id)
+        if record is None or record.expires_at <= time.time():
+            return None
+        return record
+
+    @timed('kb_task_store_duration_seconds', operation='get')
     def get(self, task_id: str) -> dict | None:
-        return self._store.get(task_id)
+        record = self._live(task_id)
+        return dict(record.data) if record else None
 
+    @timed('kb_task_store_duration_seconds', operation='set')
     def set(self, task_id: str, data: dict) -> None:
-        self._store[task_id] = data
+        with self._changed:
+            now = time.time()
+            old = self._store.pop(task_id, None)
+            if old is not None:
+                self._unindex(task_id, old)
+            record = _TaskRecord(
+                data=dict(data),
+                score=created_at_score(data),
+                expires_at=now + self._ttl,
+                version=old.version + 1 if old else 1,
+            )
+            self._store[task_id] = record
+            self._index_task(task_id, record)
+            self._evict(now)
+            self._changed.notify_all()
 
+    @timed('kb_task_store_duration_seconds', operation='update')
     def update(self, task_id: str, updates: dict) -> None:
-        if task_id in self._store:
-            self._store[task_id].update(updates)
-
+        with self._changed:
+            now = time.time()
+            record = self._live(task_id)
+            if record is None:
+                return
+
+            old_status = record.data.get('status')
+            data = {**record.data, **updates}
+            if data.get('status') != old_status:
+                self._unindex_status(task_id, old_status, record.score)
+                self._index_status(task_id, data.get('status'), record.score)
+
+            record.data = data
+            record.expires_at = now + self._ttl
+            record.version += 1
+            self._store.move_to_end(task_id)
+            self._evict(now)
+            self._changed.notify_all()
+
+    @timed('kb_task_store_duration_seconds', operation='exists')
     def exists(self, task_id: str) -> bool:
-        return task_id in self._store
+        return self._live(task_id) is not None
 
+    @timed('kb_task_store_duration_seconds', operation='get_all')
     def get_all(self) -> list[dict]:
-        return list(self._store.values())
+        with self._changed:
+            records = list(self._store.values())
+        now = time.time()
+        return [dict(r.data) for r in records if r.expires_at > now]
 
+    @timed('kb_task_store_duration_seconds', operation='delete')
     def delete(self, task_id: str) -> None:
-        if task_id in self._store:
+        with self._changed:
+            record = self._store.pop(task_id, None)
+            if record is not None:
+                self._unindex(task_id, record)
+                self._changed.notify_all()
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    @timed('kb_task_store_duration_seconds', operation='list')
+    def list(self, cursor: str | None = None, limit: int = 50, status: str | None = None,
+             since: str | None = None) -> tuple[list[dict], str | None]:
+        upper = decode_cursor(cursor) if cursor else None
+        lower = since_score(since) if since else None
+
+        with self._changed:
+            self._evict(time.time())
+            index = self._status_index.get(status, []) if status else self._index
+            # 由游標位置往前（較舊）走訪
+            pos = bisect.bisect_left(index, upper) if upper else len(index)
+            page = []
+            while pos > 0 and len(page) <= limit:
+                pos -= 1
+                score, task_id = index[pos]
+                if lower is not None and score < lower:
+                    break
+                page.append((score, task_id))
+
+            tasks = [dict(self._store[task_id].data) for _, task_id in page[:limit]]
+
+        next_cursor = encode_cursor(*page[limit - 1]) if len(page) > limit else None
+        return tasks, next_cursor
+
+    def watch(self, task_id: str, timeout: float = 15.0) -> Iterator[dict | None]:
+        if self._live(task_id) is None:
+            return
+
+        def version() -> int | None:
+            record = self._live(task_id)
+            return record.version if record else None
+
+        last_version = None
+        while True:
+            with self._changed:
+                changed = self._changed.wait_for(lambda: version() != last_version, timeout)
+                if changed:
+                    record = self._live(task_id)
+                    if record is None:
+                        return
+                    last_version = record.version
+                    snapshot: dict | None = dict(record.data)
+                else:
+                    snapshot = None
+            yield snapshot
+
+    def _evict(self, now: float) -> None:
+        """移除已過期及超出上限的任務（呼叫端需持有鎖）"""
+        while self._store:
+            task_id, record = next(iter(self._store.items()))
+            if record.expires_at > now and len(self._store) <= self._max_entries:
+                break
             del self._store[task_id]
+            self._unindex(task_id, record)
+
+    def _index_task(self, task_id: str, record: _TaskRecord) -> None:
+        """將任務加入排序索引（呼叫端需持有鎖）"""
+        bisect.insort(self._index, (record.score, task_id))
+        self._index_status(task_id, record.data.get('status'), record.score)
+
+    def _unindex(self, task_id: str, record: _TaskRecord) -> None:
+        """將任務移出排序索引（呼叫端需持有鎖）"""
+        self._unindex_status(task_id, record.data.get('status'), record.score)
+        self._remove_entry(self._index, (record.score, task_id))
+
+    def _index_status(self, task_id: str, status: str | None, score: float) -> None:
+        if status is not None:
+            entries = self._status_index.setdefault(status, [])
+            bisect.insort(entries, (score, task_id))
+
+    def _unindex_status(self, task_id: str, status: str | None, score: float) -> None:
+        entries = self._status_index.get(status) if status is not None else None
+        if entries is not None:
+            self._remove_entry(entries, (score, task_id))
+            if not entries:
+                del self._status_index[status]
+
+    @staticmethod
+    def _remove_entry(entries: list[tuple[float, str]], entry: tuple[float, str]) -> None:
+        pos = bisect.bisect_left(entries, entry)
+        if pos < len(entries) and entries[pos] == entry:
+            del entries[pos]
 
 
 class RedisTaskStore(TaskStore):
-    """Redis 存儲（生產環境用）"""
+    """
+    Redis 存儲（生產環境用）
+
+    每個任務存成一個 Hash（欄位值為 JSON），部分更新只寫入並推播變更的欄位；
+    另以 sorted set 依 created_at 建立索引（全部任務一個、每個狀態各一個），
+    列表時不需使用阻塞的 KEYS。舊版以字串（整筆 JSON）存放的任務於啟動時轉換，
+    仍遇到時（如新舊版本同時運行）於讀寫時個別轉換
+    """
+
+    # 原子更新：任務存在時才寫入欄位、維護狀態索引、續期並推播變更的欄位，單次往返完成
+    # KEYS: 任務 hash、通知頻道、總索引；ARGV: TTL、狀態索引前綴、任務 ID、欄位/值...
+    _UPDATE_SCRIPT = """
+        if redis.call('EXISTS', KEYS[1]) == 0 then
+            return 0
+        end
+        for i = 4, #ARGV, 2 do
+            if ARGV[i] == 'status' then
+                local old = redis.call('HGET', KEYS[1], 'status')
+                local score = redis.call('ZSCORE', KEYS[3], ARGV[3])
+                if old ~= ARGV[i + 1] and score then
+                    if old then
+                        redis.call('ZREM', ARGV[2] .. cjson.decode(old), ARGV[3])
+                    end
+                    redis.call('ZADD', ARGV[2] .. cjson.decode(ARGV[i + 1]), score, ARGV[3])
+                end
+            end
+        end
+        redis.call('HSET', KEYS[1], unpack(ARGV, 4))
+        redis.call('EXPIRE', KEYS[1], ARGV[1])
+        local parts = {}
+        for i = 4, #ARGV, 2 do
+            parts[#parts + 1] = cjson.encode(ARGV[i]) .. ':' .. ARGV[i + 1]
+        end
+        redis.call('PUBLISH', KEYS[2], '{"op":"update","data":{' .. table.concat(parts, ',') .. '}}')
+        return 1
+    """
 
     def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0,
-                 prefix: str = 'task:', ttl: int = 86400):
+                 prefix: str = 'task:', ttl: int = 86400, max_connections: int = 20):
         """
         初始化 Redis 連接
 
@@ -84,50 +383,266 @@ class RedisTaskStore(TaskStore):
             db: Redis 資料庫編號
             prefix: Key 前綴
             ttl: 任務過期時間（秒），預設 24 小時
+            max_connections: 連線池大小上限（用盡時等待，不直接失敗）
         """
         try:
             import redis
-            self._redis = redis.Redis(host=host, port=port, db=db, decode_responses=True)
+            pool = redis.BlockingConnectionPool(
+                host=host, port=port, db=db, decode_responses=True,
+                max_connections=max_connections, timeout=10
+            )
+            self._redis = redis.Redis(connection_pool=pool)
             self._redis.ping()
+            # 狀態串流的訂閱連線在串流期間一直佔用，使用獨立的連線池，不排擠一般操作
+            self._pubsub_redis = redis.Redis(connection_pool=redis.ConnectionPool(
+                host=host, port=port, db=db, decode_responses=True
+            ))
         except Exception as e:
             raise ConnectionError(f"無法連接 Redis: {e}")
 
         self._prefix = prefix
         self._ttl = ttl
+        self._index = f"{prefix}index"
+        self._status_prefix = f"{prefix}status:"
+        self._update_script = self._redis.register_script(self._UPDATE_SCRIPT)
+        self._migrate_legacy()
 
     def _key(self, task_id: str) -> str:
         """生成完整的 Redis key"""
         return f"{self._prefix}{task_id}"
 
+    def _channel(self, task_id: str) -> str:
+        """任務變更通知的 pub/sub 頻道"""
+        return f"{self._prefix}events:{task_id}"
+
+    @staticmethod
+    def _encode(data: dict) -> dict[str, str]:
+        return {field: json.dumps(value, ensure_ascii=False) for field, value in data.items()}
+
+    @staticmethod
+    def _decode(raw: dict[str, str]) -> dict:
+        return {field: json.loads(value) for field, value in raw.items()}
+
+    def _status_key(self, status: str) -> str:
+        """單一狀態的任務索引"""
+        return f"{self._status_prefix}{status}"
+
+    def _migrate_legacy(self) -> None:
+        """將舊版字串格式的任務轉換為 Hash 並加入索引"""
+        migrated = 0
+        for key in self._redis.scan_iter(match=f"{self._prefix}*", count=500, _type='string'):
+            migrated += self._migrate_key(key)
+        if migrated:
+            print(f"🔄 已將 {migrated} 個舊格式任務轉換為 Hash")
+
+    def _migrate_key(self, key: str) -> int:
+        """
+        轉換單一舊格式任務（保留剩餘 TTL），其他行程已轉換或同時修改時略過
+
+        Returns:
+            轉換的任務數（0 或 1）
+        """
+        import redis
+
+        task_id = key[len(self._prefix):]
+        with self._redis.pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.type(key) != 'string':
+                    return 0
+                raw = pipe.get(key)
+                ttl = pipe.pttl(key)
+                try:
+                    data = json.loads(raw) if raw else None
+                except ValueError:
+                    data = None
+                pipe.multi()
+                pipe.delete(key)
+                if isinstance(data, dict) and data:
+                    score = created_at_score(data)
+                    pipe.hset(key, mapping=self._encode(data))
+                    if ttl > 0:
+                        pipe.pexpire(key, ttl)
+                    else:
+                        pipe.expire(key, self._ttl)
+                    pipe.zadd(self._index, {task_id: score})
+                    if data.get('status') is not None:
+                        pipe.zadd(self._status_key(data['status']), {task_id: score})
+                pipe.execute()
+                return 1
+            except redis.WatchError:
+                return 0
+
+    def _legacy_retry(self, key: str, operation: Callable[[], Any]) -> Any:
+        """執行操作，遇到舊格式任務（WRONGTYPE）時先轉換再重試一次"""
+        try:
+            return operation()
+        except Exception as e:
+            if not self._is_wrongtype(e):
+                raise
+            self._migrate_key(key)
+            return operation()
+
+    @staticmethod
+    def _is_wrongtype(error: Exception) -> bool:
+        return 'WRONGTYPE' in str(error)
+
+    @timed('kb_task_store_duration_seconds', operation='get')
     def get(self, task_id: str) -> dict | None:
-        data = self._redis.get(self._key(task_id))
-        if data:
-            return json.loads(data)
+        key = self._key(task_id)
+        raw = self._legacy_retry(key, lambda: self._redis.hgetall(key))
+        if raw:
+            return self._decode(raw)
         return None
 
+    @timed('kb_task_store_duration_seconds', operation='set')
     def set(self, task_id: str, data: dict) -> None:
-        self._redis.setex(self._key(task_id), self._ttl, json.dumps(data, ensure_ascii=False))
-
+        key = self._key(task_id)
+        old_status = self._legacy_retry(key, lambda: self._redis.hget(key, 'status'))
+        score = created_at_score(data)
+
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.delete(key)
+        if old_status is not None:
+            pipe.zrem(self._status_key(json.loads(old_status)), task_id)
+        if data:
+            pipe.hset(key, mapping=self._encode(data))
+            pipe.expire(key, self._ttl)
+        pipe.zadd(self._index, {task_id: score})
+        if data.get('status') is not None:
+            pipe.zadd(self._status_key(data['status']), {task_id: score})
+        pipe.publish(self._channel(task_id),
+                     json.dumps({'op': 'set', 'data': data}, ensure_ascii=False))
+        pipe.execute()
+
+    @timed('kb_task_store_duration_seconds', operation='update')
     def update(self, task_id: str, updates: dict) -> None:
-        existing = self.get(task_id)
-        if existing:
-            existing.update(updates)
-            self.set(task_id, existing)
-
+        if not updates:
+            return
+        args: list[Any] = [self._ttl, self._status_prefix, task_id]
+        for field, value in self._encode(updates).items():
+            args.extend([field, value])
+        key = self._key(task_id)
+        self._legacy_retry(key, lambda: self._update_script(
+            keys=[key, self._channel(task_id), self._index], args=args
+        ))
+
+    @timed('kb_task_store_duration_seconds', operation='exists')
     def exists(self, task_id: str) -> bool:
         return self._redis.exists(self._key(task_id)) > 0
 
+    @timed('kb_task_store_duration_seconds', operation='get_all')
     def get_all(self) -> list[dict]:
-        keys = self._redis.keys(f"{self._prefix}*")
+        task_ids = self._redis.zrevrange(self._index, 0, -1)
+        return [task for _, task in self._fetch_many(task_ids, self._index)]
+
+    @timed('kb_task_store_duration_seconds', operation='list')
+    def list(self, cursor: str | None = None, limit: int = 50, status: str | None = None,
+             since: str | None = None) -> tuple[list[dict], str | None]:
+        upper = decode_cursor(cursor) if cursor else None
+        index = self._status_key(status) if status else self._index
+        max_score: Any = upper[0] if upper else '+inf'
+        min_score: Any = since_score(since) if since else '-inf'
+
+        page: list[tuple[float, str, dict]] = []
+        offset = 0
+        batch_size = limit + 1
+        while len(page) <= limit:
+            batch = self._redis.zrevrangebyscore(
+                index, max_score, min_score, start=offset, num=batch_size, withscores=True
+            )
+            # 同分數的項目依成員逆字典序排列，略過游標本身及其之前的項目
+            if upper:
+                scores = {m: s for m, s in batch if s < upper[0] or m < upper[1]}
+            else:
+                scores = dict(batch)
+            found = self._fetch_many(list(scores), index)
+            page.extend((scores[task_id], task_id, task) for task_id, task in found)
+            # 已過期的項目已從索引移除，下一批的位移需扣除
+            offset += len(batch) - (len(scores) - len(found))
+            if len(batch) < batch_size:
+                break
+
+        tasks = [task for _, _, task in page[:limit]]
+        next_cursor = None
+        if len(page) > limit:
+            last_score, last_id, _ = page[limit - 1]
+            next_cursor = encode_cursor(last_score, last_id)
+        return tasks, next_cursor
+
+    def _fetch_many(self, task_ids: list[str], index: str) -> list[tuple[str, dict]]:
+        """以單次 pipeline 讀取多個任務，並從索引清除已過期的項目"""
+        if not task_ids:
+            return []
+
+        pipe = self._redis.pipeline(transaction=False)
+        for task_id in task_ids:
+            pipe.hgetall(self._key(task_id))
+        results = pipe.execute(raise_on_error=False)
+
         tasks = []
-        for key in keys:
-            data = self._redis.get(key)
-            if data:
-                tasks.append(json.loads(data))
+        expired = []
+        for task_id, raw in zip(task_ids, results):
+            if isinstance(raw, Exception):
+                if not self._is_wrongtype(raw):
+                    raise raw
+                self._migrate_key(self._key(task_id))
+                raw = self._redis.hgetall(self._key(task_id))
+            if raw:
+                tasks.append((task_id, self._decode(raw)))
+            else:
+                expired.append(task_id)
+
+        if expired:
+            pipe = self._redis.pipeline(transaction=False)
+            pipe.zrem(self._index, *expired)
+            if index != self._index:
+                pipe.zrem(index, *expired)
+            pipe.execute()
         return tasks
 
+    @timed('kb_task_store_duration_seconds', operation='delete')
     def delete(self, task_id: str) -> None:
-        self._redis.delete(self._key(task_id))
+        key = self._key(task_id)
+        status = self._legacy_retry(key, lambda: self._redis.hget(key, 'status'))
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.delete(key)
+        pipe.zrem(self._index, task_id)
+        if status is not None:
+            pipe.zrem(self._status_key(json.loads(status)), task_id)
+        pipe.execute()
+
+    def watch(self, task_id: str, timeout: float = 15.0) -> Iterator[dict | None]:
+        """
+        以 pub/sub 監看任務：set 推播完整內容，update 只推播變更的欄位，
+        於此合併成最新的完整內容（部分預覽等頻繁更新不必每次傳送整筆任務）
+        """
+        pubsub = self._pubsub_redis.pubsub(ignore_subscribe_messages=True)
+        # 先訂閱再讀取目前狀態，避免錯過兩者之間的變更
+        pubsub.subscribe(self._channel(task_id))
+        try:
+            current = self.get(task_id)
+            if current is None:
+                return
+            yield current
+
+            while True:
+                message = pubsub.get_message(timeout=timeout)
+                if message is None:
+                    # 任務過期或被刪除時不會有推播，閒置時確認任務仍存在
+                    if not self.exists(task_id):
+                        return
+                    yield None
+                elif message['type'] == 'message':
+                    event = json.loads(message['data'])
+                    if event.get('op') == 'update':
+                        current = {**current, **event['data']}
+                    else:
+                        # set（舊版推播整筆任務時沒有 op）
+                        current = event['data'] if 'op' in event else event
+                    yield current
+        finally:
+            pubsub.close()
 
 
 def create_task_store() -> TaskStore:
@@ -138,6 +653,9 @@ def create_task_store() -> TaskStore:
         REDIS_HOST: Redis 主機（設定此項則使用 Redis）
         REDIS_PORT: Redis 端口（預設 6379）
         REDIS_DB: Redis 資料庫（預設 0）
+        REDIS_MAX_CONNECTIONS: 連線池大小上限（預設 20）
+        TASK_TTL: 任務過期時間（秒，預設 86400）
+        TASK_STORE_MAX_ENTRIES: 記憶體存儲的任務數上限（預設 10000）
     """
     redis_host = os.getenv('REDIS_HOST')
 
@@ -146,9 +664,11 @@ def create_task_store() -> TaskStore:
             return RedisTaskStore(
                 host=redis_host,
                 port=int(os.getenv('REDIS_PORT', '6379')),
-                db=int(os.getenv('REDIS_DB', '0'))
+                db=int(os.getenv('REDIS_DB', '0')),
+                ttl=config.TASK_TTL,
+                max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', '20'))
             )
         except ConnectionError as e:
             print(f"警告: Redis 連接失敗，回退到記憶體存儲: {e}")
 
-    return MemoryTaskStore()
+    return MemoryTaskStore(ttl=config.TASK_TTL, max_entries=config.TASK_STORE_MAX_ENTRIES)
@@ -2,14 +2,36 @@
 請求驗證模組
 使用 Pydantic 進行輸入驗證
 """
+import unicodedata
+
 from pydantic import BaseModel, Field, field_validator
 from typing import Literal
 
 
+def document_key(name: str) -> str:
+    """
+    文件的邏輯名稱（增量重新匯入的比對鍵）
+
+    以原始檔名正規化（Unicode NFC、去除路徑、合併空白），不使用 secure_filename：
+    後者會刪除中文字元，不同的中文檔名會變成同一個鍵
+    """
+    name = unicodedata.normalize('NFC', name).replace('\\', '/').rsplit('/', 1)[-1]
+    return ' '.join(name.split())[:200]
+
+
 class UploadRequest(BaseModel):
     """上傳請求驗證"""
     mode: Literal['new', 'append'] = Field(default='append', description='處理模式')
     model: str = Field(default='gemini-2.5-flash-lite', description='AI 模型名稱')
+    document: str | None = Field(default=None, max_length=200,
+                                 description='文件的邏輯名稱（預設為檔名），同名重新上傳時只提取變更的投影片/章節')
+
+    @field_validator('document')
+    @classmethod
+    def validate_document(cls, v: str | None) -> str | None:
+        if v is None:
+            return None
+        return document_key(v) or None
 
     @field_validator('model')
     @classmethod
@@ -35,9 +57,30 @@ class TaskResponse(BaseModel):
     completed_at: str | None = None
     output_file: str | None = None
     content_size: int | None = None
+    cache: dict | None = None
+    gemini: dict | None = None
+    batch_id: str | None = None
+    children: list[str] | None = None
+    tokens_estimated: int | None = None
+    kb_version: int | None = None
+    document: str | None = None
+    units_total: int | None = None
+    units_extracted: int | None = None
+    entries_retracted: int | None = None
+    content_sha256: str | None = None
+    trace_mode: str | None = None
+    partial_content: str | None = None
     error: str | None = None
 
 
+class TaskListQuery(BaseModel):
+    """任務列表查詢參數"""
+    limit: int = Field(default=50, ge=1, le=200, description='每頁筆數')
+    cursor: str | None = Field(default=None, description='上一頁回傳的 next_cursor')
+    status: str | None = Field(default=None, description='只列出此狀態的任務')
+    since: str | None = Field(default=None, description='只列出此時間（ISO 8601）之後建立的任務')
+
+
 class TaskListItem(BaseModel):
     """任務列表項目"""
     task_id: str
@@ -50,3 +93,4 @@ class PreviewResponse(BaseModel):
     """預覽回應格式"""
     content: str
     truncated: bool
+    partial: bool = False
@@ -0,0 +1,156 @@
+"""
+獨立的文件處理 worker
+從持久化工作佇列取出工作並處理，可與 Web 層分開水平擴展
+
+用法:
+    JOB_QUEUE=redis REDIS_HOST=... python -m services.worker [--concurrency 4]
+
+部署注意:
+    工作只記錄上傳檔案的路徑，worker 必須能讀到 Web 寫入 uploads/ 的檔案
+    （同一台主機，或兩者掛載同一個磁碟）；各自獨立、不共用磁碟的服務（例如 Render 上
+    分開的 Web 與 Background Worker）無法使用佇列模式。
+    使用者自己的 API Key 以 JOB_QUEUE_SECRET 加密入列，Web 與 worker 須設定相同的值
+"""
+import argparse
+import os
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from services.document_processor import DocumentProcessor  # noqa: E402
+from services.job_queue import Job, JobQueue, create_job_queue, open_api_key  # noqa: E402
+from services.task_store import MemoryTaskStore, create_task_store  # noqa: E402
+
+
+class Worker:
+    """持續從佇列取出工作並交給 DocumentProcessor 同步處理"""
+
+    def __init__(self, job_queue: JobQueue, processor: DocumentProcessor, concurrency: int):
+        self.job_queue = job_queue
+        self.processor = processor
+        self.concurrency = concurrency
+        self._stopping = threading.Event()
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._in_flight: dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def stop(self, *_args) -> None:
+        """收到終止訊號：不再取新工作，等待處理中的工作完成"""
+        print("🛑 收到終止訊號，等待處理中的工作完成...")
+        self._stopping.set()
+
+    def run(self) -> None:
+        heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        heartbeat.start()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while not self._stopping.is_set():
+                self._slots.acquire()
+                # 等待空位期間可能已收到終止訊號，不再取出新工作
+                if self._stopping.is_set():
+                    self._slots.release()
+                    break
+                job = self.job_queue.dequeue(timeout=2.0)
+                if job is None:
+                    self._slots.release()
+                    continue
+
+                with self._lock:
+                    self._in_flight[job.job_id] = job
+                pool.submit(self._handle, job)
+
+    def _handle(self, job: Job) -> None:
+        try:
+            paths = [job.file_path, *(file.file_path for file in job.files or [])]
+            try:
+                api_key = open_api_key(job.api_key)
+            except ValueError as e:
+                self._fail(job, str(e), 'api key unavailable')
+                self.job_queue.ack(job)
+                return
+
+            if job.attempts > config.JOB_MAX_ATTEMPTS:
+                self._fail(job, f'已重試 {config.JOB_MAX_ATTEMPTS} 次仍未完成',
+                           'max attempts exceeded')
+            elif not any(path and os.path.exists(path) for path in paths):
+                # 此 worker 讀不到 Web 寫入的檔案（未共用 uploads/）
+                self._fail(job, '找不到上傳檔案，worker 需與 Web 共用 uploads/ 資料夾',
+                           'upload file not found')
+            elif job.files:
+                print(f"📦 處理批次工作 {job.job_id}（任務 {job.task_id}，{len(job.files)} 個檔案，"
+                      f"第 {job.attempts} 次）")
+                self.processor._process_batch(
+                    job.task_id, job.files, job.mode, api_key, job.model
+                )
+            else:
+                print(f"📄 處理工作 {job.job_id}（任務 {job.task_id}，第 {job.attempts} 次）")
+                # _process_document 會自行將成功/失敗寫回任務狀態
+                self.processor._process_document(
+                    job.task_id, job.file_path, job.filename,
+                    job.mode, api_key, job.model, trace=job.trace,
+                    document=job.document
+                )
+            self.job_queue.ack(job)
+        finally:
+            with self._lock:
+                self._in_flight.pop(job.job_id, None)
+            self._slots.release()
+
+    def _fail(self, job: Job, message: str, error: str) -> None:
+        """將工作的所有任務標記為失敗並清除上傳檔案"""
+        for task_id in [job.task_id, *(file.task_id for file in job.files or [])]:
+            self.processor.task_store.update(task_id, {
+                'status': 'failed',
+                'message': f'錯誤: {message}',
+                'error': error,
+            })
+        for path in [job.file_path, *(file.file_path for file in job.files or [])]:
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def _heartbeat_loop(self) -> None:
+        """定期續租處理中的工作，並回收失聯 worker 的工作"""
+        interval = max(config.JOB_LEASE_SECONDS / 3, 1)
+        while not self._stopping.wait(interval):
+            with self._lock:
+                jobs = list(self._in_flight.values())
+            for job in jobs:
+                self.job_queue.touch(job)
+            requeued = self.job_queue.requeue_stale()
+            if requeued:
+                print(f"♻️ 已將 {requeued} 個逾時工作放回佇列")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Smart Workspace 文件處理 worker')
+    parser.add_argument('--concurrency', type=int, default=config.ANALYZE_WORKERS,
+                        help='同時處理的文件數')
+    parser.add_argument('--output', default=config.OUTPUT_DIR, help='知識庫輸出資料夾')
+    args = parser.parse_args()
+
+    job_queue = create_job_queue()
+    if job_queue is None:
+        print("[錯誤] 未設定 JOB_QUEUE（redis 或 sqlite），worker 無事可做")
+        sys.exit(1)
+
+    task_store = create_task_store()
+    if isinstance(task_store, MemoryTaskStore):
+        print("警告: 使用記憶體任務存儲，Web 行程將看不到此 worker 更新的任務狀態")
+
+    processor = DocumentProcessor(task_store, args.output)
+    worker = Worker(job_queue, processor, args.concurrency)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+
+    # 啟動時先回收前一次當機遺留的工作
+    job_queue.requeue_stale()
+    print(f"🚀 worker 已啟動（佇列: {config.JOB_QUEUE_BACKEND}，並行: {args.concurrency}）")
+    worker.run()
+
+
+if __name__ == '__main__':
+    main()
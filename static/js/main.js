@@ -5,6 +5,8 @@
 // 全域變數
 let currentTaskId = null;
 let pollInterval = null;
+let statusStream = null;
+let partialPreviewDismissed = false;
 
 // LocalStorage Key
 const STORAGE_KEY = '_smart_workspace_config';
@@ -213,6 +215,7 @@ function initKnowledgeExtractor() {
     document.getElementById('previewBtn')?.addEventListener('click', previewResult);
     document.getElementById('closePreviewBtn')?.addEventListener('click', () => {
         document.getElementById('previewSection').style.display = 'none';
+        partialPreviewDismissed = true;
     });
     document.getElementById('newTaskBtn')?.addEventListener('click', resetUI);
 }
@@ -291,6 +294,7 @@ function showProgressSection(filename) {
     if (uploadSection) uploadSection.style.display = 'none';
     if (resultSection) resultSection.style.display = 'none';
     if (previewSection) previewSection.style.display = 'none';
+    partialPreviewDismissed = false;
 
     if (progressSection) {
         progressSection.style.display = 'block';
@@ -317,12 +321,44 @@ function showProgressSection(filename) {
     }
 }
 
-// 開始輪詢狀態
+// 開始追蹤狀態（優先使用 SSE 串流，不支援或連續連線失敗時退回輪詢）
 function startPolling() {
+    stopStatusUpdates();
+
+    if (window.EventSource) {
+        // 伺服器定期關閉串流（STATUS_STREAM_MAX_SECONDS）時瀏覽器會自動重連，
+        // 只有無法重連或連續失敗時才改用輪詢
+        let failures = 0;
+        const stream = new EventSource(`/api/status/${currentTaskId}/stream`);
+        statusStream = stream;
+        stream.onopen = () => { failures = 0; };
+        stream.onmessage = (event) => {
+            failures = 0;
+            handleTaskUpdate(JSON.parse(event.data));
+        };
+        stream.onerror = () => {
+            failures += 1;
+            if (stream.readyState === EventSource.CLOSED || failures >= 3) {
+                stopStatusUpdates();
+                pollInterval = setInterval(checkTaskStatus, 2000);
+            }
+        };
+        return;
+    }
+
+    pollInterval = setInterval(checkTaskStatus, 2000);
+}
+
+// 停止串流與輪詢
+function stopStatusUpdates() {
+    if (statusStream) {
+        statusStream.close();
+        statusStream = null;
+    }
     if (pollInterval) {
         clearInterval(pollInterval);
+        pollInterval = null;
     }
-    pollInterval = setInterval(checkTaskStatus, 2000);
 }
 
 // 檢查任務狀態
@@ -334,23 +370,34 @@ async function checkTaskStatus() {
         const task = await response.json();
 
         if (response.ok) {
-            updateProgress(task);
-
-            if (task.status === 'completed' || task.status === 'failed') {
-                clearInterval(pollInterval);
-
-                if (task.status === 'completed') {
-                    showResult(task);
-                } else {
-                    showToast('處理失敗: ' + task.message, 'error');
-                }
-            }
+            handleTaskUpdate(task);
         }
     } catch (error) {
         console.error('狀態查詢錯誤:', error);
     }
 }
 
+// 處理任務狀態更新
+function handleTaskUpdate(task) {
+    updateProgress(task);
+
+    if (task.partial_content && task.status !== 'completed') {
+        showPartialPreview(task.partial_content);
+    }
+
+    if (task.status === 'completed' || task.status === 'failed' || task.status === 'cancelled') {
+        stopStatusUpdates();
+
+        if (task.status === 'completed') {
+            showResult(task);
+        } else if (task.status === 'cancelled') {
+            showToast('任務已取消', 'info');
+        } else {
+            showToast('處理失敗: ' + task.message, 'error');
+        }
+    }
+}
+
 // 更新進度顯示
 function updateProgress(task) {
     const statusElement = document.getElementById('progressStatus');
@@ -364,7 +411,8 @@ function updateProgress(task) {
         'analyzing': { text: 'AI 分析中', progress: 55 },
         'merging': { text: '合併中', progress: 85 },
         'completed': { text: '完成', progress: 100 },
-        'failed': { text: '失敗', progress: 0 }
+        'failed': { text: '失敗', progress: 0 },
+        'cancelled': { text: '已取消', progress: 0 }
     };
 
     const statusInfo = statusMap[task.status] || { text: task.status, progress: 0 };
@@ -477,6 +525,19 @@ async function previewResult() {
     }
 }
 
+// 分析中即時顯示已產生的內容（使用者關閉後不再自動開啟）
+function showPartialPreview(content) {
+    if (partialPreviewDismissed) return;
+
+    const previewSection = document.getElementById('previewSection');
+    const previewContent = document.getElementById('previewContent');
+
+    if (previewSection && previewContent) {
+        previewSection.style.display = 'block';
+        previewContent.textContent = content;
+    }
+}
+
 // 重置 UI
 function resetUI() {
     const fileInput = document.getElementById('fileInput');
@@ -493,9 +554,7 @@ function resetUI() {
 
     currentTaskId = null;
 
-    if (pollInterval) {
-        clearInterval(pollInterval);
-    }
+    stopStatusUpdates();
 }
 
 // ==========================================
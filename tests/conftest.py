@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 測試直接匯入專案根目錄的模組（config、parsers 等）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
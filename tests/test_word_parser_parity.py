@@ -0,0 +1,190 @@
+"""
+Word 解析器一致性測試：XML 串流快速路徑與 python-docx 路徑的輸出必須相同
+"""
+import io
+import zipfile
+
+import pytest
+from docx import Document  # type: ignore[import-untyped]
+from docx.enum.text import WD_BREAK  # type: ignore[import-untyped]
+from docx.oxml import OxmlElement  # type: ignore[import-untyped]
+from docx.oxml.ns import qn  # type: ignore[import-untyped]
+
+import parsers.word_parser as word_parser
+from benchmarks.corpus import make_docx
+from parsers import WordParser
+
+PARITY_KEYS = ('paragraphs', 'tables', 'headings', 'sections', 'full_text')
+
+
+def _save(doc, tmp_path, name='doc.docx') -> str:
+    path = str(tmp_path / name)
+    doc.save(path)
+    return path
+
+
+def _parse_both(path: str) -> tuple:
+    return WordParser(path, fast=False).parse(), WordParser(path, fast=True).parse()
+
+
+def _assert_parity(path: str) -> dict:
+    slow, fast = _parse_both(path)
+    for key in PARITY_KEYS:
+        assert fast[key] == slow[key], key
+    return slow
+
+
+def _add_hyperlink(paragraph, text: str, url: str) -> None:
+    r_id = paragraph.part.relate_to(
+        url, 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/hyperlink',
+        is_external=True
+    )
+    hyperlink = OxmlElement('w:hyperlink')
+    hyperlink.set(qn('r:id'), r_id)
+    run = OxmlElement('w:r')
+    t = OxmlElement('w:t')
+    t.text = text
+    run.append(t)
+    hyperlink.append(run)
+    paragraph._p.append(hyperlink)
+
+
+def test_headings_and_sections(tmp_path):
+    doc = Document()
+    doc.add_paragraph('標題前的前言')
+    doc.add_heading('第一章', level=1)
+    doc.add_paragraph('第一章內容')
+    doc.add_paragraph('')
+    doc.add_heading('1.1 小節', level=2)
+    doc.add_paragraph('小節內容')
+    doc.add_heading('', level=3)
+    doc.add_heading('文件標題', level=0)
+    doc.add_paragraph('清單項目', style='List Bullet')
+    doc.add_heading('第二章', level=1)
+
+    result = _assert_parity(_save(doc, tmp_path))
+    assert [h['level'] for h in result['headings']] == ['Heading 1', 'Heading 2', 'Heading 3', 'Heading 1']
+    assert result['sections'][0] == {'heading': '', 'level': '', 'text': '標題前的前言'}
+
+
+def test_tables_with_merged_cells(tmp_path):
+    doc = Document()
+    doc.add_heading('表格', level=1)
+    table = doc.add_table(rows=4, cols=4)
+    for r, row in enumerate(table.rows):
+        for c, cell in enumerate(row.cells):
+            cell.text = f'{r}-{c}'
+    table.cell(0, 0).merge(table.cell(0, 2))      # 水平合併
+    table.cell(1, 3).merge(table.cell(3, 3))      # 垂直合併
+    table.cell(2, 0).merge(table.cell(3, 1))      # 區塊合併
+    table.cell(1, 1).add_paragraph('第二段')       # 多段落儲存格
+    doc.add_paragraph('表格後的段落')
+    doc.add_table(rows=1, cols=2)                 # 空表格
+
+    result = _assert_parity(_save(doc, tmp_path))
+    assert result['tables'][0][0][:3] == [result['tables'][0][0][0]] * 3
+    assert result['tables'][0][3][3] == result['tables'][0][1][3]
+
+
+def test_nested_tables(tmp_path):
+    doc = Document()
+    outer = doc.add_table(rows=2, cols=2)
+    outer.cell(0, 0).text = '外層'
+    inner = outer.cell(0, 1).add_table(rows=2, cols=2)
+    for r, row in enumerate(inner.rows):
+        for c, cell in enumerate(row.cells):
+            cell.text = f'內層{r}-{c}'
+    outer.cell(1, 0).text = '下一列'
+    doc.add_paragraph('結尾')
+
+    result = _assert_parity(_save(doc, tmp_path))
+    # 巢狀表格不列為獨立表格
+    assert len(result['tables']) == 1
+
+
+def test_hyperlinks(tmp_path):
+    doc = Document()
+    para = doc.add_paragraph('請參考 ')
+    _add_hyperlink(para, '說明文件', 'https://example.com/doc')
+    para.add_run(' 的內容')
+    _add_hyperlink(doc.add_paragraph(), '只有連結', 'https://example.com/only')
+    table = doc.add_table(rows=1, cols=1)
+    _add_hyperlink(table.cell(0, 0).paragraphs[0], '表格內連結', 'https://example.com/cell')
+
+    result = _assert_parity(_save(doc, tmp_path))
+    assert result['paragraphs'][0] == '請參考 說明文件 的內容'
+
+
+def test_breaks_and_tabs(tmp_path):
+    doc = Document()
+    para = doc.add_paragraph('第一行')
+    para.add_run().add_break()
+    para.add_run('第二行\t接 Tab')
+    para.add_run().add_break(WD_BREAK.PAGE)
+    para.add_run('分頁後')
+    para.add_run().add_break(WD_BREAK.COLUMN)
+    run = para.add_run('分欄後')
+    run._r.append(OxmlElement('w:cr'))
+    run._r.append(OxmlElement('w:noBreakHyphen'))
+    run._r.append(OxmlElement('w:tab'))
+    doc.add_paragraph('\t只有前置 Tab')
+    doc.add_heading('標題\t含 Tab', level=1)
+    doc.add_paragraph('段落').add_run().add_break(WD_BREAK.PAGE)
+
+    _assert_parity(_save(doc, tmp_path))
+
+
+def test_synthetic_corpus(tmp_path):
+    path = str(tmp_path / 'corpus.docx')
+    make_docx(path, 12)
+    _assert_parity(path)
+
+
+def test_file_object_source(tmp_path):
+    path = str(tmp_path / 'corpus.docx')
+    make_docx(path, 4)
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    slow = WordParser(io.BytesIO(data), fast=False, file_name='a.docx').parse()
+    fast = WordParser(io.BytesIO(data), fast=True, file_name='a.docx').parse()
+    assert fast == slow
+
+
+def test_fallback_when_fast_path_fails(tmp_path, monkeypatch):
+    doc = Document()
+    doc.add_heading('章節', level=1)
+    doc.add_paragraph('內容')
+    path = _save(doc, tmp_path)
+    expected = WordParser(path, fast=False).parse()
+
+    def broken(source):
+        # 讀取部分內容後失敗，回退時須將檔案物件移回開頭
+        if not isinstance(source, str):
+            source.read(10)
+        raise ValueError('unexpected structure')
+
+    monkeypatch.setattr(word_parser, 'parse_docx_xml', broken)
+    assert WordParser(path, fast=True).parse() == expected
+    with open(path, 'rb') as f:
+        result = WordParser(io.BytesIO(f.read()), fast=True, file_name='doc.docx').parse()
+    for key in PARITY_KEYS:
+        assert result[key] == expected[key], key
+
+
+def test_malformed_document_xml(tmp_path):
+    doc = Document()
+    doc.add_paragraph('內容')
+    path = _save(doc, tmp_path)
+
+    broken = str(tmp_path / 'broken.docx')
+    with zipfile.ZipFile(path) as src, zipfile.ZipFile(broken, 'w') as dst:
+        for info in src.infolist():
+            data = src.read(info)
+            if info.filename == 'word/document.xml':
+                data = data[:len(data) // 2]
+            dst.writestr(info, data)
+
+    # 快速路徑解析失敗後回退，python-docx 同樣無法讀取時回報解析失敗
+    with pytest.raises(Exception, match='Word 文件解析失敗'):
+        WordParser(broken, fast=True).parse()
@@ -0,0 +1,314 @@
+"""
+任務追蹤（trace 模式）
+上傳時指定 trace 的任務會記錄各階段的 span（解析、解析器各 _extract_* 方法、每次 Gemini
+呼叫、知識庫合併與儲存），可選擇同時取樣呼叫堆疊，完成後以 Chrome trace-event 格式存入
+任務，可用 chrome://tracing 或 Perfetto 開啟。
+
+未啟用追蹤時 span() 只讀取一次 ContextVar，幾乎沒有額外開銷。追蹤器以 ContextVar 傳遞：
+asyncio 任務自動繼承，執行緒池須以 bind() 包裝，解析行程則以 parse 結果一併回傳 export()
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+import config
+
+T = TypeVar('T')
+
+# 追蹤模式：spans 只記錄 span；profile 另取樣呼叫堆疊
+TRACE_MODES = ('spans', 'profile')
+
+_current: contextvars.ContextVar[Optional['Tracer']] = contextvars.ContextVar(
+    'kb_tracer', default=None
+)
+
+
+def _now_us() -> float:
+    """牆上時間（微秒），跨行程的 span 可對齊"""
+    return time.time() * 1_000_000
+
+
+class Tracer:
+    """單一任務的追蹤紀錄"""
+
+    def __init__(self, profile: bool = False, max_events: Optional[int] = None,
+                 max_samples: Optional[int] = None, interval: Optional[float] = None):
+        """
+        Args:
+            profile: 是否於 span 執行期間取樣呼叫堆疊
+            max_events: span 數上限，預設依 TRACE_MAX_EVENTS
+            max_samples: 堆疊取樣數上限，預設依 TRACE_MAX_SAMPLES
+            interval: 取樣間隔（秒），預設依 TRACE_PROFILE_INTERVAL
+        """
+        self.profile = profile
+        self.max_events = max_events or config.TRACE_MAX_EVENTS
+        self.max_samples = max_samples or config.TRACE_MAX_SAMPLES
+        self.interval = interval or config.TRACE_PROFILE_INTERVAL
+        self.pid = os.getpid()
+        self.events: List[Dict[str, Any]] = []
+        self.stack_frames: Dict[str, Dict[str, Any]] = {}
+        self.samples: List[Dict[str, Any]] = []
+        self.dropped = 0
+
+        self._lock = threading.Lock()
+        self._tracks: Dict[int, str] = {}
+        # 各執行緒目前開啟的 span 數（只取樣正在處理此任務的執行緒）
+        self._active: Dict[int, int] = {}
+        self._frame_ids: Dict[Tuple[str, str], str] = {}
+        self._sampler: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        if profile:
+            self._sampler = threading.Thread(
+                target=self._sample_loop, name='trace-sampler', daemon=True
+            )
+            self._sampler.start()
+
+    @contextmanager
+    def span(self, name: str, cat: str = '', **args: Any) -> Iterator[Dict[str, Any]]:
+        """
+        記錄一個 span，可在 with 區塊內於回傳的 dict 補充 args（例如回應大小）
+        """
+        tid, track = self._track()
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._active[thread_id] = self._active.get(thread_id, 0) + 1
+        start = _now_us()
+        started = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args['error'] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            duration = (time.perf_counter() - started) * 1_000_000
+            with self._lock:
+                self._active[thread_id] -= 1
+                if not self._active[thread_id]:
+                    del self._active[thread_id]
+                self._append({
+                    'name': name, 'cat': cat or 'task', 'ph': 'X',
+                    'ts': round(start, 1), 'dur': round(duration, 1),
+                    'pid': self.pid, 'tid': tid, 'args': args,
+                }, tid, track)
+
+    def stop(self) -> None:
+        """停止堆疊取樣"""
+        self._stopped.set()
+        if self._sampler is not None and self._sampler is not threading.current_thread():
+            self._sampler.join()
+
+    def export(self) -> Dict[str, Any]:
+        """可跨行程傳遞的紀錄（供 absorb 合併）"""
+        self.stop()
+        with self._lock:
+            return {
+                'events': list(self.events),
+                'stack_frames': dict(self.stack_frames),
+                'samples': list(self.samples),
+                'dropped': self.dropped,
+            }
+
+    def absorb(self, exported: Dict[str, Any]) -> None:
+        """合併其他行程（解析行程）的紀錄"""
+        with self._lock:
+            room = max(self.max_events - len(self.events), 0)
+            self.events.extend(exported['events'][:room])
+            self.dropped += exported['dropped'] + max(len(exported['events']) - room, 0)
+            self.stack_frames.update(exported['stack_frames'])
+            self.samples.extend(exported['samples'][:max(self.max_samples - len(self.samples), 0)])
+
+    def unwrap(self, result: Tuple[T, Dict[str, Any]]) -> T:
+        """合併 run_traced 的紀錄並回傳原本的結果"""
+        value, exported = result
+        self.absorb(exported)
+        return value
+
+    def to_chrome(self, **metadata: Any) -> Dict[str, Any]:
+        """
+        Chrome trace-event 格式（JSON Object Format）
+
+        Args:
+            metadata: 附加於 metadata 的資訊（例如 task_id）
+        """
+        self.stop()
+        with self._lock:
+            trace: Dict[str, Any] = {
+                'traceEvents': sorted(self.events, key=lambda e: (e['ph'] != 'M', e.get('ts', 0))),
+                'displayTimeUnit': 'ms',
+                'metadata': {**metadata, 'dropped_events': self.dropped},
+            }
+            if self.samples:
+                trace['stackFrames'] = dict(self.stack_frames)
+                trace['samples'] = list(self.samples)
+        return trace
+
+    def _append(self, event: Dict[str, Any], tid: int, track: str) -> None:
+        """加入事件（呼叫端需持有鎖），首次出現的軌道一併加入名稱"""
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        if tid not in self._tracks:
+            self._tracks[tid] = track
+            self.events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                'args': {'name': track},
+            })
+        self.events.append(event)
+
+    @staticmethod
+    def _track() -> Tuple[int, str]:
+        """目前的軌道：asyncio 任務各自一條（同一執行緒上的 span 會交錯），否則為執行緒"""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            return id(task), f"asyncio {task.get_name()}"
+        thread = threading.current_thread()
+        return threading.get_native_id(), thread.name
+
+    def _sample_loop(self) -> None:
+        """定期取樣正在執行 span 的執行緒的呼叫堆疊"""
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                thread_ids = list(self._active)
+            if not thread_ids:
+                continue
+            frames = sys._current_frames()
+            ts = round(_now_us(), 1)
+            with self._lock:
+                for thread_id in thread_ids:
+                    frame = frames.get(thread_id)
+                    if frame is None:
+                        continue
+                    if len(self.samples) >= self.max_samples:
+                        self._stopped.set()
+                        return
+                    self.samples.append({
+                        'ts': ts, 'pid': self.pid, 'tid': thread_id,
+                        'sf': self._frame_id(frame), 'weight': 1,
+                    })
+
+    def _frame_id(self, frame: Any) -> str:
+        """將堆疊轉為 stackFrames 中的節點 ID（相同路徑共用節點，呼叫端需持有鎖）"""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+
+        parent = ''
+        for name in reversed(stack):
+            key = (parent, name)
+            frame_id = self._frame_ids.get(key)
+            if frame_id is None:
+                frame_id = f"{self.pid}-{len(self._frame_ids)}"
+                self._frame_ids[key] = frame_id
+                node: Dict[str, Any] = {'name': name, 'category': 'python'}
+                if parent:
+                    node['parent'] = parent
+                self.stack_frames[frame_id] = node
+            parent = frame_id
+        return parent
+
+
+def current() -> Optional[Tracer]:
+    """目前的追蹤器（未啟用時為 None）"""
+    return _current.get()
+
+
+@contextmanager
+def activate(tracer: Optional[Tracer]) -> Iterator[Optional[Tracer]]:
+    """在 with 區塊內啟用追蹤器（None 時不做任何事）"""
+    if tracer is None:
+        yield None
+        return
+    token = _current.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, cat: str = '', **args: Any) -> Iterator[Dict[str, Any]]:
+    """
+    記錄 span（未啟用追蹤時不記錄），回傳的 dict 可補充 args
+
+    Example:
+        with tracing.span('gemini.request', cat='gemini', prompt_chars=n) as info:
+            text = call()
+            info['response_chars'] = len(text)
+    """
+    tracer = _current.get()
+    if tracer is None:
+        yield args
+        return
+    with tracer.span(name, cat, **args) as info:
+        yield info
+
+
+def traced(name: Optional[str] = None, cat: str = '') -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """以 span 記錄函式執行的裝飾器（預設以 類別.方法 命名）"""
+    def decorator(fn: Callable[..., T]) -> Callable[..., T]:
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> T:
+            tracer = _current.get()
+            if tracer is None:
+                return fn(*args, **kwargs)
+            with tracer.span(span_name, cat):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def bind(fn: Callable[..., T]) -> Callable[..., T]:
+    """讓交給執行緒池的函式沿用目前的追蹤器"""
+    if _current.get() is None:
+        return fn
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def run_traced(profile: bool, fn: Callable[..., T], *args: Any) -> Tuple[T, Dict[str, Any]]:
+    """
+    在新的追蹤器下執行 fn（模組層級函數，可在解析行程池中執行）
+
+    Returns:
+        (fn 的結果, Tracer.export())，呼叫端以 Tracer.unwrap 合併
+    """
+    tracer = Tracer(profile=profile)
+    try:
+        with activate(tracer):
+            value = fn(*args)
+    finally:
+        # fn 拋出例外時也要停止取樣執行緒
+        tracer.stop()
+    return value, tracer.export()
+
+
+def parse_mode(value: Optional[str]) -> Optional[str]:
+    """
+    解析上傳參數 / X-Trace 標頭
+
+    Returns:
+        'spans'、'profile' 或 None（未啟用）
+    """
+    value = (value or '').strip().lower()
+    if value == 'profile':
+        return 'profile'
+    if value in ('1', 'true', 'yes', 'on', 'spans'):
+        return 'spans'
+    return None